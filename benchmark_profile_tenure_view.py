@@ -0,0 +1,269 @@
+"""
+/***************************************************************************
+Name                 : ProfileTenureViewBenchmark
+Description          : Benchmarks for ProfileTenureView rendering.
+Date                 : 19/October/2026
+copyright            : John Kahiu
+email                : gkahiu at gmail dot com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import random
+import sys
+import time
+
+from PyQt4.QtGui import (
+    QApplication,
+    QGraphicsView,
+    QImage,
+    QPainter
+)
+from PyQt4.QtCore import (
+    QRectF,
+    Qt
+)
+
+from profile_tenure_view import (
+    Arrow,
+    ArrowRouter,
+    Entity,
+    EntityItem,
+    ProfileTenureScene,
+    ProfileTenureView,
+    update_arrow_positions
+)
+
+app = QApplication(sys.argv)
+
+#Time budget, in milliseconds, of a frame at 60 frames per second
+FRAME_TIME = 1000.0 / 60
+
+
+def _timed(func, repeat):
+    #Returns the average time, in milliseconds, of calling func
+    start = time.time()
+    for i in range(repeat):
+        func()
+
+    return (time.time() - start) * 1000.0 / repeat
+
+
+def _frame_status(elapsed):
+    #Returns whether the elapsed time, in milliseconds, fits in a frame
+    if elapsed <= FRAME_TIME:
+        return 'within one frame'
+
+    return 'over one frame ({0:.1f} ms)'.format(FRAME_TIME)
+
+
+def _arrow_scene(num_items, num_arrows, extent, seed=0):
+    #Creates a scene with items randomly positioned within the extent and
+    # arrows linking random pairs of items.
+    rnd = random.Random(seed)
+    scene = ProfileTenureScene()
+    scene.setSceneRect(QRectF(0, 0, extent, extent))
+
+    items = []
+    for i in range(num_items):
+        item = EntityItem()
+        scene.addItem(item)
+        item.setPos(rnd.uniform(0, extent), rnd.uniform(0, extent))
+        items.append(item)
+
+    for i in range(num_arrows):
+        start, end = rnd.sample(items, 2)
+        scene.add_arrow(start, end)
+
+    return scene
+
+
+def bench_arrow_culling(num_items=500, num_arrows=1000, extent=20000.0,
+                        repeat=20):
+    """
+    Renders a viewport-sized area of a scene with many arrows and reports
+    the number of arrows painted and the average render time. The render
+    is repeated with bounds covering the whole scene, which makes Qt paint
+    every arrow as it did before the bounds were precomputed, to give a
+    baseline for comparison.
+    """
+    scene = _arrow_scene(num_items, num_arrows, extent)
+
+    painted = [0]
+    arrow_paint = Arrow.paint
+    arrow_bounds = Arrow.boundingRect
+
+    def counting_paint(self, painter, option, widget):
+        painted[0] += 1
+        arrow_paint(self, painter, option, widget)
+
+    def scene_bounds(self):
+        return self.mapRectFromScene(scene.sceneRect())
+
+    img = QImage(960, 540, QImage.Format_ARGB32_Premultiplied)
+    exposed = QRectF(extent / 2.0, extent / 2.0, 960, 540)
+
+    def render():
+        img.fill(Qt.white)
+        painter = QPainter(img)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        scene.render(painter, QRectF(img.rect()), exposed)
+        painter.end()
+
+    Arrow.paint = counting_paint
+    results = []
+
+    try:
+        for name, bounds in (('precomputed bounds', arrow_bounds),
+                             ('baseline, scene bounds', scene_bounds)):
+            Arrow.boundingRect = bounds
+
+            #Bounds are cached by the scene index
+            for item in scene.items():
+                if isinstance(item, Arrow):
+                    item.prepareGeometryChange()
+
+            painted[0] = 0
+            elapsed = _timed(render, repeat)
+            results.append((painted[0] / float(repeat), elapsed))
+
+            print('Arrow culling ({0}): {1} arrows, {2:.1f} painted per '
+                  'frame, {3:.2f} ms per frame'.format(
+                      name,
+                      num_arrows,
+                      painted[0] / float(repeat),
+                      elapsed
+                  ))
+
+    finally:
+        Arrow.paint = arrow_paint
+        Arrow.boundingRect = arrow_bounds
+
+    (culled_painted, culled), (all_painted, baseline) = results
+    print('Arrow culling gain: {0:.1f} fewer arrows painted, {1:.1f}x '
+          'faster per frame'.format(
+              all_painted - culled_painted,
+              baseline / max(culled, 1e-6)
+          ))
+
+
+def bench_batch_arrow_update(num_items=500, num_arrows=1000,
+                             extent=20000.0, repeat=10):
+    """
+    Compares updating the geometry of all arrows one at a time with the
+    batch update used after a relayout.
+    """
+    scene = _arrow_scene(num_items, num_arrows, extent)
+    arrows = [i for i in scene.items() if isinstance(i, Arrow)]
+
+    def individual():
+        for ar in arrows:
+            ar.update_position()
+
+    def batch():
+        update_arrow_positions(arrows)
+
+    print('Arrow update: {0} arrows, {1:.2f} ms individually, '
+          '{2:.2f} ms in batch'.format(
+              len(arrows),
+              _timed(individual, repeat),
+              _timed(batch, repeat)
+          ))
+
+
+def bench_arrow_routing(num_items=200, num_arrows=400, extent=6000.0,
+                        repeat=50):
+    """
+    Reports the time taken to route all the arrows in a scene around the
+    items, and the average time taken to reroute the affected arrows when
+    an item is moved, against the time budget of one frame.
+    """
+    for mode, name in ((ArrowRouter.Orthogonal, 'orthogonal'),
+                       (ArrowRouter.Polyline, 'polyline')):
+        scene = _arrow_scene(num_items, num_arrows, extent)
+        items = [i for i in scene.items() if isinstance(i, EntityItem)]
+        rnd = random.Random(1)
+
+        start = time.time()
+        scene.set_router(ArrowRouter(mode))
+        full = (time.time() - start) * 1000.0
+
+        def move():
+            item = rnd.choice(items)
+            item.moveBy(rnd.uniform(-50, 50), rnd.uniform(-50, 50))
+
+        per_move = _timed(move, repeat)
+
+        print('Arrow routing ({0}): {1} items, {2} arrows, {3:.2f} ms for '
+              'all arrows ({4}), {5:.2f} ms per item move ({6})'.format(
+                  name,
+                  num_items,
+                  num_arrows,
+                  full,
+                  _frame_status(full),
+                  per_move,
+                  _frame_status(per_move)
+              ))
+
+
+def bench_drag_repaint(num_parties=100, steps=50):
+    """
+    Moves a party item in small steps, as when it is dragged, and reports
+    the average time taken to repaint the view after each step for
+    different viewport update strategies, against the time budget of one
+    frame.
+    """
+    strategies = (
+        ('full, no flags', QGraphicsView.FullViewportUpdate,
+         QGraphicsView.OptimizationFlags()),
+        ('minimal', QGraphicsView.MinimalViewportUpdate, None),
+        ('smart', QGraphicsView.SmartViewportUpdate, None)
+    )
+
+    for name, mode, flags in strategies:
+        view = ProfileTenureView()
+        view.draft_while_interacting = False
+        view.set_update_strategy(mode, flags)
+
+        view.begin_update()
+        for i in range(num_parties):
+            view.add_party_entity(Entity('Party {0}'.format(i)))
+            p_item = view._party_items['Party {0}'.format(i)]
+            p_item.setPos((i % 10) * 180.0, (i // 10) * 180.0)
+        view.end_update()
+
+        view.resize(960, 540)
+        view.show()
+        app.processEvents()
+
+        p_item = view._party_items['Party 0']
+
+        def drag_step():
+            p_item.moveBy(5.0, 2.0)
+            app.processEvents()
+
+        per_step = _timed(drag_step, steps)
+
+        print('Drag repaint ({0}): {1} parties, {2:.2f} ms per step '
+              '({3})'.format(
+                  name,
+                  num_parties,
+                  per_step,
+                  _frame_status(per_step)
+              ))
+
+        view.close()
+
+
+if __name__ == '__main__':
+    bench_arrow_culling()
+    bench_batch_arrow_update()
+    bench_arrow_routing()
+    bench_drag_repaint()
@@ -17,8 +17,25 @@ email                : gkahiu at gmail dot com
  *                                                                         *
  ***************************************************************************/
 """
-import sys
+import ctypes
+import hashlib
+import json
 import math
+import mmap
+import numbers
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 
 from PyQt4.QtGui import (
     QApplication,
@@ -33,6 +50,7 @@ from PyQt4.QtGui import (
     QGraphicsTextItem,
     QGraphicsView,
     QGridLayout,
+    QHBoxLayout,
     QIcon,
     QImage,
     QLabel,
@@ -40,9 +58,12 @@ from PyQt4.QtGui import (
     QKeyEvent,
     QPainter,
     QPainterPath,
+    QPainterPathStroker,
+    QPinchGesture,
     QPen,
     QPixmap,
     QPolygonF,
+    QPrinter,
     QSizePolicy,
     QSpacerItem,
     QTextLayout,
@@ -51,6 +72,7 @@ from PyQt4.QtGui import (
 )
 from PyQt4.QtCore import (
     pyqtSignal,
+    QEvent,
     QFile,
     QIODevice,
     QLineF,
@@ -59,9 +81,17 @@ from PyQt4.QtCore import (
     QRectF,
     QSize,
     QSizeF,
-    Qt
+    Qt,
+    QTimer
 )
 
+import sip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import temp_rc
 
 
@@ -71,6 +101,8 @@ class Arrow(QGraphicsLineItem):
     another. The arrow head size can be customized by specifying the angle
     and width of the arrow base.
     """
+    PreciseHitTest, LooseHitTest = range(2)
+
     def __init__(self, start_item, end_item, base_width=None,
                  tip_angle=None, fill_arrow_head=True,
                  parent_item=None, scene=None):
@@ -125,6 +157,22 @@ class Arrow(QGraphicsLineItem):
 
         self._arrow_head_points = []
 
+        #Points of the route, in item coordinates, if the arrow has been
+        # routed around other items by an ArrowRouter. Empty for a straight
+        # arrow.
+        self._route = []
+
+        #Precomputed geometry, see update_position
+        self._visible = False
+        self._overlapping = False
+        self._bounds = QRectF()
+
+        #Hit-test shape is built on demand and cached until the geometry
+        # changes.
+        self._shape = None
+        self._hit_test_mode = Arrow.PreciseHitTest
+        self._hit_tolerance = 6.0
+
     @property
     def start_item(self):
         """
@@ -158,15 +206,29 @@ class Arrow(QGraphicsLineItem):
         return self._end_item.pos()
 
     def boundingRect(self):
+        #Precomputed in update_position, empty if the arrow is not drawn
+        return self._bounds
+
+    def _compute_bounds(self):
+        #Bounds of the line and arrow head including the pen width
+        if not self._visible:
+            return QRectF()
+
         extra = (self.base_width + self.pen().widthF()) / 2.0
+        if self._hit_test_mode == Arrow.LooseHitTest:
+            extra = max(extra, self._hit_tolerance / 2.0)
+
         p1 = self.line().p1()
         p2 = self.line().p2()
 
         rect = QRectF(
             p1, QSizeF(p2.x() - p1.x(), p2.y() - p1.y())
-        ).normalized().adjusted(-extra, -extra, extra, extra)
+        ).normalized()
+        rect = rect.united(self.arrow_head_polygon().boundingRect())
+        if self._route:
+            rect = rect.united(QPolygonF(self._route).boundingRect())
 
-        return rect
+        return rect.adjusted(-extra, -extra, extra, extra)
 
     def arrow_head_polygon(self):
         """
@@ -175,12 +237,111 @@ class Arrow(QGraphicsLineItem):
         """
         return QPolygonF(self._arrow_head_points)
 
+    @property
+    def route(self):
+        """
+        :return: Returns the points of the route, in item coordinates, if
+        the arrow has been routed around other items, otherwise an empty
+        list.
+        :rtype: list
+        """
+        return self._route
+
+    def path(self):
+        """
+        :return: Returns the line, or the route if the arrow has been routed
+        around other items, as a path.
+        :rtype: QPainterPath
+        """
+        if not self._route:
+            path = QPainterPath(self.line().p1())
+            path.lineTo(self.line().p2())
+
+            return path
+
+        path = QPainterPath(self._route[0])
+        for pt in self._route[1:]:
+            path.lineTo(pt)
+
+        return path
+
     def shape(self):
-        path = super(Arrow, self).shape()
+        if self._shape is None:
+            self._shape = self._build_shape()
+
+        return self._shape
+
+    def _build_shape(self):
+        #Creates the hit-test shape based on the hit test mode
+        if not self._visible:
+            return QPainterPath()
+
+        stroker = QPainterPathStroker()
+
+        if self._hit_test_mode == Arrow.LooseHitTest:
+            stroker.setWidth(self._hit_tolerance)
+            stroker.setCapStyle(Qt.RoundCap)
+
+            return stroker.createStroke(self.path())
+
+        if not self._route:
+            path = super(Arrow, self).shape()
+
+        else:
+            stroker.setWidth(max(self.pen().widthF(), 1.0))
+            path = stroker.createStroke(self.path())
+
         path.addPolygon(self.arrow_head_polygon())
 
         return path
 
+    @property
+    def hit_test_mode(self):
+        """
+        :return: Returns the mode used for building the hit-test shape.
+        :rtype: int
+        """
+        return self._hit_test_mode
+
+    @hit_test_mode.setter
+    def hit_test_mode(self, mode):
+        """
+        Sets the mode used for building the hit-test shape.
+        PreciseHitTest uses the outline of the line and arrow head while
+        LooseHitTest uses the line stroked with hit_tolerance, which is
+        faster and easier to pick in crowded scenes.
+        :param mode: PreciseHitTest or LooseHitTest.
+        :type mode: int
+        """
+        self._hit_test_mode = mode
+        self._geometry_changed()
+
+    @property
+    def hit_tolerance(self):
+        """
+        :return: Returns the width, in pixels, of the stroked line used in
+        LooseHitTest mode.
+        :rtype: float
+        """
+        return self._hit_tolerance
+
+    @hit_tolerance.setter
+    def hit_tolerance(self, tolerance):
+        """
+        Sets the width of the stroked line used in LooseHitTest mode.
+        :param tolerance: Width in pixels.
+        :type tolerance: float
+        """
+        self._hit_tolerance = tolerance
+        self._geometry_changed()
+
+    def _geometry_changed(self):
+        #Invalidates the cached shape and updates the bounds
+        self.prepareGeometryChange()
+        self._shape = None
+        self._bounds = self._compute_bounds()
+        self.update()
+
     @property
     def angle(self):
         """
@@ -218,49 +379,92 @@ class Arrow(QGraphicsLineItem):
     def update_position(self):
         """
         Updates the position of the line and arrowhead when the positions of
-        the start and end items change.
+        the start and end items change. The geometry is computed here rather
+        than when painting so that the bounding rect is always accurate and
+        arrows outside the exposed area are not painted.
         """
-        line = QLineF(
-            self.mapFromScene(self.start_item.center()),
-            self.mapFromScene(self.end_item.center())
-        )
-        self.setLine(line)
-
-    def _intersection_point(self, item, reference_line):
-        #Computes the intersection point between the item's line segments
-        # with the reference line.
-        intersect_point = QPointF()
-
-        for l in item.line_segments():
-            intersect_type = l.intersect(reference_line, intersect_point)
-            if intersect_type == QLineF.BoundedIntersection:
-                return intersect_point
-
-        return None
+        self.prepareGeometryChange()
+        self._visible = self._compute_geometry()
+        self._geometry_changed()
 
-    def paint(self, painter, option, widget):
+    @property
+    def overlapping(self):
+        """
+        :return: Returns True if the rectangles of the start and end items
+        overlapped when the geometry was last updated, in which case the
+        arrow is not drawn.
+        :rtype: bool
         """
-        Draw the arrow item.
+        return self._overlapping
+
+    def set_geometry(self, visible, start_point=None, end_point=None,
+                     head_points=None, overlapping=False):
+        """
+        Sets precomputed geometry of the arrow, used when the geometry of
+        several arrows is computed in a batch. See update_arrow_positions.
+        :param visible: False if the arrow should not be drawn, in which
+        case the other arguments are ignored.
+        :type visible: bool
+        :param start_point: Start point of the arrow line in scene
+        coordinates.
+        :type start_point: QPointF
+        :param end_point: End point of the arrow line, which is the tip of
+        the arrow, in scene coordinates.
+        :type end_point: QPointF
+        :param head_points: The two points of the arrow base in scene
+        coordinates.
+        :type head_points: list
+        :param overlapping: True if the rectangles of the start and end
+        items overlap.
+        :type overlapping: bool
         """
-        if self._start_item.collidesWithItem(self._end_item):
-            return
+        self.prepareGeometryChange()
+        self._visible = visible
+        self._overlapping = overlapping
+        self._route = []
+
+        if visible:
+            arrow_line = QLineF(
+                self.mapFromScene(start_point),
+                self.mapFromScene(end_point)
+            )
+            self.setLine(arrow_line)
+            self._arrow_head_points = [
+                self.mapFromScene(head_points[0]),
+                self.mapFromScene(head_points[1]),
+                arrow_line.p2()
+            ]
+
+        self._geometry_changed()
+
+    def _compute_geometry(self):
+        #Computes the arrow line and head points. Returns False if the
+        # arrow should not be drawn.
+        #The items are rectangles hence comparing the cached scene rects is
+        # sufficient and cheaper than a shape-based collision test.
+        self._overlapping = self._start_item.scene_bounding_rect().intersects(
+            self._end_item.scene_bounding_rect()
+        )
+        self._route = []
+        if self._overlapping:
+            return False
 
-        painter.setPen(self.pen())
+        router = self._router()
+        if router is None:
+            arrow_line = self._straight_line()
 
-        center_line = QLineF(self.start_item.center(), self.end_item.center())
+        else:
+            arrow_line = self._routed_line(router)
 
-        #Get intersection points
-        start_intersection_point = self._intersection_point(self._start_item, center_line)
-        end_intersection_point = self._intersection_point(self._end_item, center_line)
+        if arrow_line is None:
+            return False
 
-        #Do not draw if there are no intersection points
-        if start_intersection_point is None or end_intersection_point is None:
-            return
+        arrow_length = arrow_line.length()
+        if arrow_length == 0:
+            return False
 
-        arrow_line = QLineF(start_intersection_point, end_intersection_point)
         self.setLine(arrow_line)
-
-        arrow_length = arrow_line.length()
+        end_point = arrow_line.p2()
 
         #Setup computation parameters
         cnt_factor = (self.base_width / 2.0)/(
@@ -269,8 +473,8 @@ class Arrow(QGraphicsLineItem):
         cnt_point_delta = (self.base_width/2.0)/arrow_length
 
         #Get arrow base along the line
-        arrow_base_x = end_intersection_point.x() - (arrow_line.dx() * cnt_factor)
-        arrow_base_y = end_intersection_point.y() - (arrow_line.dy() * cnt_factor)
+        arrow_base_x = end_point.x() - (arrow_line.dx() * cnt_factor)
+        arrow_base_y = end_point.y() - (arrow_line.dy() * cnt_factor)
 
         #Get deltas to arrow points from centre point of arrow base
         cnt_point_dx = -(arrow_line.dy() * cnt_point_delta)
@@ -281,15 +485,87 @@ class Arrow(QGraphicsLineItem):
         A2 = QPointF(arrow_base_x + cnt_point_dx, arrow_base_y + cnt_point_dy)
 
         #Update arrow points
-        self._arrow_head_points = [A1, A2, end_intersection_point]
+        self._arrow_head_points = [A1, A2, end_point]
+
+        return True
+
+    def _router(self):
+        #Returns the router of the scene, if any
+        scene = self.scene()
+        if isinstance(scene, ProfileTenureScene):
+            return scene.router()
+
+        return None
+
+    def _straight_line(self):
+        #Returns the line between the edges of the start and end items along
+        # the line joining their centers, or None if there is no such line.
+        center_line = QLineF(self.start_item.center(), self.end_item.center())
+
+        #Get intersection points
+        start_intersection_point = self._intersection_point(
+            self._start_item,
+            center_line
+        )
+        end_intersection_point = self._intersection_point(
+            self._end_item,
+            center_line
+        )
+
+        #Do not draw if there are no intersection points
+        if start_intersection_point is None or end_intersection_point is None:
+            return None
+
+        return QLineF(
+            self.mapFromScene(start_intersection_point),
+            self.mapFromScene(end_intersection_point)
+        )
+
+    def _routed_line(self, router):
+        #Routes the arrow around other items and returns the last segment of
+        # the route, which carries the arrow head.
+        points = router.route(self)
+        if points is None:
+            return None
+
+        route = [self.mapFromScene(QPointF(x, y)) for x, y in points]
+        if len(route) > 2:
+            self._route = route
+
+        return QLineF(route[-2], route[-1])
+
+    def _intersection_point(self, item, reference_line):
+        #Computes the intersection point between the item's line segments
+        # with the reference line.
+        intersect_point = QPointF()
 
-        #Draw main arrow line
-        painter.drawLine(arrow_line)
+        for l in item.line_segments():
+            intersect_type = l.intersect(reference_line, intersect_point)
+            if intersect_type == QLineF.BoundedIntersection:
+                return intersect_point
+
+        return None
+
+    def paint(self, painter, option, widget):
+        """
+        Draw the arrow item using the geometry computed in update_position.
+        """
+        if not self._visible:
+            return
+
+        painter.setPen(self.pen())
+
+        #Draw main arrow line or the route around other items
+        if self._route:
+            painter.drawPolyline(QPolygonF(self._route))
+        else:
+            painter.drawLine(self.line())
 
         #Draw arrow head
+        end_point = self._arrow_head_points[2]
         if not self.fill_arrow_head:
-            painter.drawLine(A1, end_intersection_point)
-            painter.drawLine(end_intersection_point, A2)
+            painter.drawLine(self._arrow_head_points[0], end_point)
+            painter.drawLine(end_point, self._arrow_head_points[1])
 
         else:
             painter.setPen(Qt.NoPen)
@@ -297,6 +573,554 @@ class Arrow(QGraphicsLineItem):
             painter.drawPolygon(self.arrow_head_polygon())
 
 
+def _rect_array(rects):
+    #Converts a list of QRectF objects to an array of x, y, width, height
+    return numpy.array(
+        [(r.x(), r.y(), r.width(), r.height()) for r in rects],
+        dtype=numpy.float64
+    ).reshape(-1, 4)
+
+
+def update_arrow_positions(arrows):
+    """
+    Updates the geometry of several arrows at once. If NumPy is available,
+    the clipping of the arrow lines against the start and end item
+    rectangles and the computation of the arrow heads is done for all the
+    arrows in a single vectorized pass and the results are written back to
+    the arrows. Otherwise, the arrows are updated one at a time.
+    :param arrows: Arrow items to be updated.
+    :type arrows: list
+    """
+    arrows = list(arrows)
+
+    if numpy is None or len(arrows) < 2:
+        for ar in arrows:
+            ar.update_position()
+
+        return
+
+    start = _rect_array(
+        [ar.start_item.scene_bounding_rect() for ar in arrows]
+    )
+    end = _rect_array([ar.end_item.scene_bounding_rect() for ar in arrows])
+    base_width = numpy.array([ar.base_width for ar in arrows])
+    angle = numpy.array([ar.angle for ar in arrows])
+
+    #Items whose rectangles overlap are not linked by a visible arrow
+    overlap = (start[:, 0] < end[:, 0] + end[:, 2]) & \
+        (end[:, 0] < start[:, 0] + start[:, 2]) & \
+        (start[:, 1] < end[:, 1] + end[:, 3]) & \
+        (end[:, 1] < start[:, 1] + start[:, 3])
+
+    start_half = start[:, 2:] / 2.0
+    end_half = end[:, 2:] / 2.0
+    start_center = start[:, :2] + start_half
+    end_center = end[:, :2] + end_half
+    delta = end_center - start_center
+    abs_delta = numpy.abs(delta)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        #Fraction of the center line inside the start and end rectangles
+        start_t = numpy.minimum(
+            start_half[:, 0] / abs_delta[:, 0],
+            start_half[:, 1] / abs_delta[:, 1]
+        )
+        end_t = numpy.minimum(
+            end_half[:, 0] / abs_delta[:, 0],
+            end_half[:, 1] / abs_delta[:, 1]
+        )
+
+        line_start = start_center + delta * start_t[:, None]
+        line_end = end_center - delta * end_t[:, None]
+        line = line_end - line_start
+        length = numpy.hypot(line[:, 0], line[:, 1])
+
+        #Arrow head base along the line and offsets to the base points
+        cnt_factor = (base_width / 2.0) / (numpy.tan(angle / 2.0) * length)
+        cnt_point_delta = (base_width / 2.0) / length
+        head_base = line_end - line * cnt_factor[:, None]
+        head_offset = numpy.column_stack(
+            (-line[:, 1], line[:, 0])
+        ) * cnt_point_delta[:, None]
+
+    head_1 = head_base - head_offset
+    head_2 = head_base + head_offset
+
+    visible = ~overlap & (start_t + end_t < 1.0) & (length > 0) & \
+        numpy.isfinite(head_1).all(axis=1) & \
+        numpy.isfinite(head_2).all(axis=1)
+
+    for i, ar in enumerate(arrows):
+        if not visible[i]:
+            ar.set_geometry(False, overlapping=bool(overlap[i]))
+            continue
+
+        ar.set_geometry(
+            True,
+            QPointF(*line_start[i]),
+            QPointF(*line_end[i]),
+            [QPointF(*head_1[i]), QPointF(*head_2[i])]
+        )
+
+
+class ArrowRouter(object):
+    """
+    Computes routes for arrows that go around the other items in the scene
+    instead of crossing over them. The rectangles of the items, and the
+    segments of the routes, are kept in a grid-based spatial index so that
+    only the items near a route are tested, and when an item moves only the
+    arrows connected to it or whose routes run through or around it are
+    rerouted.
+    Routes are either orthogonal i.e. made of horizontal and vertical
+    segments, or polylines with a single bend around an obstacle. If no
+    route around the obstacles is found, a straight line is used.
+    """
+    Orthogonal, Polyline = range(2)
+
+    def __init__(self, mode=None, padding=12.0, cell_size=200.0,
+                 max_candidates=32):
+        """
+        Class constructor.
+        :param mode: Routing mode, either Orthogonal or Polyline. Defaults
+        to Orthogonal.
+        :type mode: int
+        :param padding: Minimum distance, in pixels, between a route and
+        the items that it goes around.
+        :type padding: float
+        :param cell_size: Size, in pixels, of the cells of the spatial
+        index.
+        :type cell_size: float
+        :param max_candidates: Maximum number of candidate routes that are
+        tested for each arrow, shortest first, before falling back to a
+        straight line. This bounds the time taken to route an arrow.
+        :type max_candidates: int
+        """
+        self.mode = mode
+        if self.mode is None:
+            self.mode = ArrowRouter.Orthogonal
+
+        self.padding = float(padding)
+        self.cell_size = float(cell_size)
+        self.max_candidates = max_candidates
+
+        #Item rects as (x1, y1, x2, y2) tuples in scene coordinates
+        self._rects = {}
+
+        #Spatial index of items by grid cell
+        self._cells = {}
+
+        #Arrow routes as (bounds, points, cells) where the points are in
+        # scene coordinates and cells are those covered by the segments
+        self._routes = {}
+
+        #Spatial index of arrows by the grid cells of their route segments
+        self._route_cells = {}
+
+    def __len__(self):
+        return len(self._rects)
+
+    def _cell_range(self, x1, y1, x2, y2):
+        #Returns the grid cells covering the rect
+        size = self.cell_size
+
+        for col in range(int(math.floor(x1 / size)),
+                         int(math.floor(x2 / size)) + 1):
+            for row in range(int(math.floor(y1 / size)),
+                             int(math.floor(y2 / size)) + 1):
+                yield col, row
+
+    @staticmethod
+    def _item_rect(item):
+        #Returns the item rect as an (x1, y1, x2, y2) tuple
+        rect = item.scene_bounding_rect()
+
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    def add_obstacle(self, item):
+        """
+        Adds an item to the spatial index so that routes go around it.
+        :param item: Item in the scene.
+        :type item: BaseTenureItem
+        """
+        if item in self._rects:
+            self.remove_obstacle(item)
+
+        rect = self._item_rect(item)
+        self._rects[item] = rect
+
+        for cell in self._cell_range(*rect):
+            self._cells.setdefault(cell, set()).add(item)
+
+    def remove_obstacle(self, item):
+        """
+        Removes an item from the spatial index.
+        :param item: Item in the scene.
+        :type item: BaseTenureItem
+        :return: Returns the arrows whose routes were near the item and
+        hence need to be rerouted.
+        :rtype: set
+        """
+        rect = self._rects.pop(item, None)
+        if rect is None:
+            return set()
+
+        for cell in self._cell_range(*rect):
+            items = self._cells.get(cell)
+            if items is None:
+                continue
+
+            items.discard(item)
+            if not items:
+                del self._cells[cell]
+
+        return self._routes_near(rect)
+
+    def update_obstacle(self, item):
+        """
+        Updates the spatial index after an item has been moved or resized.
+        :param item: Item in the scene.
+        :type item: BaseTenureItem
+        :return: Returns the arrows whose routes were near the old or new
+        rect of the item and hence need to be rerouted.
+        :rtype: set
+        """
+        old_rect = self._rects.get(item)
+        if not old_rect is None and old_rect == self._item_rect(item):
+            return set()
+
+        arrows = self.remove_obstacle(item)
+        self.add_obstacle(item)
+        arrows.update(self._routes_near(self._rects[item]))
+
+        return arrows
+
+    def remove_route(self, arrow):
+        """
+        Removes the route of an arrow that is no longer in the scene.
+        :param arrow: Arrow item.
+        :type arrow: Arrow
+        """
+        route = self._routes.pop(arrow, None)
+        if route is None:
+            return
+
+        for cell in route[2]:
+            arrows = self._route_cells.get(cell)
+            if arrows is None:
+                continue
+
+            arrows.discard(arrow)
+            if not arrows:
+                del self._route_cells[cell]
+
+    def _set_route(self, arrow, points):
+        #Stores the route and indexes the cells covered by its segments
+        self.remove_route(arrow)
+
+        cells = set()
+        for i in range(len(points) - 1):
+            (ax, ay), (bx, by) = points[i], points[i + 1]
+            cells.update(self._cell_range(
+                min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)
+            ))
+
+        for cell in cells:
+            self._route_cells.setdefault(cell, set()).add(arrow)
+
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self._routes[arrow] = (
+            (min(xs), min(ys), max(xs), max(ys)),
+            points,
+            cells
+        )
+
+    def clear(self):
+        """
+        Removes all the items and routes.
+        """
+        self._rects.clear()
+        self._cells.clear()
+        self._routes.clear()
+        self._route_cells.clear()
+
+    def obstacles(self, x1, y1, x2, y2, exclude=()):
+        """
+        :param x1, y1, x2, y2: Rect in scene coordinates.
+        :type x1, y1, x2, y2: float
+        :param exclude: Items to leave out, such as the start and end items
+        of a route.
+        :type exclude: tuple
+        :return: Returns the visible items whose padded rects intersect the
+        given rect.
+        :rtype: set
+        """
+        pad = self.padding
+        items = set()
+
+        for cell in self._cell_range(x1 - pad, y1 - pad, x2 + pad, y2 + pad):
+            items.update(self._cells.get(cell, ()))
+
+        result = set()
+        for item in items:
+            if item in exclude or not item.isVisible():
+                continue
+
+            r = self._rects[item]
+            if r[0] - pad < x2 and x1 < r[2] + pad and \
+                    r[1] - pad < y2 and y1 < r[3] + pad:
+                result.add(item)
+
+        return result
+
+    def _routes_near(self, rect):
+        #Returns the arrows whose routes cross, or go around, the rect
+        pad = self.padding * 2
+        x1, y1, x2, y2 = rect[0] - pad, rect[1] - pad, \
+            rect[2] + pad, rect[3] + pad
+
+        candidates = set()
+        for cell in self._cell_range(x1, y1, x2, y2):
+            candidates.update(self._route_cells.get(cell, ()))
+
+        arrows = set()
+        for arrow in candidates:
+            bounds, points = self._routes[arrow][:2]
+            if bounds[0] > x2 or x1 > bounds[2] or \
+                    bounds[1] > y2 or y1 > bounds[3]:
+                continue
+
+            for i in range(len(points) - 1):
+                if _segment_crosses_rect(
+                        points[i], points[i + 1], (x1, y1, x2, y2)):
+                    arrows.add(arrow)
+                    break
+
+        return arrows
+
+    @staticmethod
+    def _blocker(points, rects):
+        #Returns the index of a rect crossed by the route, or -1 if the
+        # route does not cross any of the rects
+        for i in range(len(points) - 1):
+            (ax, ay), (bx, by) = points[i], points[i + 1]
+            x1, x2 = min(ax, bx), max(ax, bx)
+            y1, y2 = min(ay, by), max(ay, by)
+
+            for j, r in enumerate(rects):
+                if x1 >= r[2] or r[0] >= x2 or y1 >= r[3] or r[1] >= y2:
+                    continue
+
+                #Horizontal and vertical segments overlapping the rect
+                # cross it, otherwise test the segment itself
+                if ax == bx or ay == by or \
+                        _segment_crosses_rect(points[i], points[i + 1], r):
+                    return j
+
+        return -1
+
+    def _candidates(self, start, end, rects):
+        #Returns candidate routes between the start and end points, going
+        # around the given rects, sorted by increasing length
+        (sx, sy), (ex, ey) = start, end
+        pad = self.padding
+        routes = []
+
+        #Only the obstacles between the start and end points are used to
+        # derive detours
+        x1, x2 = min(sx, ex), max(sx, ex)
+        y1, y2 = min(sy, ey), max(sy, ey)
+        rects = [
+            r for r in rects
+            if r[0] < x2 and x1 < r[2] and r[1] < y2 and y1 < r[3]
+        ]
+
+        if self.mode == ArrowRouter.Polyline:
+            routes.append([start, end])
+            for r in rects:
+                #Padded corners in clockwise order
+                corners = (
+                    (r[0] - pad, r[1] - pad), (r[2] + pad, r[1] - pad),
+                    (r[2] + pad, r[3] + pad), (r[0] - pad, r[3] + pad)
+                )
+                for i, corner in enumerate(corners):
+                    next_corner = corners[(i + 1) % 4]
+                    routes.append([start, corner, end])
+                    routes.append([start, corner, next_corner, end])
+                    routes.append([start, next_corner, corner, end])
+
+        else:
+            if sx == ex or sy == ey:
+                routes.append([start, end])
+            else:
+                routes.append([start, (ex, sy), end])
+                routes.append([start, (sx, ey), end])
+
+            #Channels midway between the start and end points, and along
+            # the sides of the obstacles
+            xs = set([(sx + ex) / 2.0])
+            ys = set([(sy + ey) / 2.0])
+            for r in rects:
+                xs.update((r[0] - pad, r[2] + pad))
+                ys.update((r[1] - pad, r[3] + pad))
+
+            for x in xs:
+                routes.append([start, (x, sy), (x, ey), end])
+            for y in ys:
+                routes.append([start, (sx, y), (ex, y), end])
+
+        routes.sort(key=_route_length)
+
+        return routes[:self.max_candidates]
+
+    def route(self, arrow):
+        """
+        Computes the route of an arrow from the edge of its start item to
+        the edge of its end item around the other items.
+        :param arrow: Arrow item.
+        :type arrow: Arrow
+        :return: Returns the points of the route in scene coordinates, or
+        None if the start and end items overlap.
+        :rtype: list
+        """
+        start_item, end_item = arrow.start_item, arrow.end_item
+        for item in (start_item, end_item):
+            if not item in self._rects:
+                self.add_obstacle(item)
+
+        start_rect = self._rects[start_item]
+        end_rect = self._rects[end_item]
+        start = ((start_rect[0] + start_rect[2]) / 2.0,
+                 (start_rect[1] + start_rect[3]) / 2.0)
+        end = ((end_rect[0] + end_rect[2]) / 2.0,
+               (end_rect[1] + end_rect[3]) / 2.0)
+
+        #Obstacles are fetched once for the area spanned by the start and
+        # end items. They are shrunk by half the padding so that routes
+        # running along the padding do not count as crossing them.
+        inset = self.padding / 2.0
+        rects = [
+            (r[0] - inset, r[1] - inset, r[2] + inset, r[3] + inset)
+            for r in (
+                self._rects[item] for item in self.obstacles(
+                    min(start_rect[0], end_rect[0]),
+                    min(start_rect[1], end_rect[1]),
+                    max(start_rect[2], end_rect[2]),
+                    max(start_rect[3], end_rect[3]),
+                    (start_item, end_item)
+                )
+            )
+        ]
+
+        points = None
+        for candidate in self._candidates(start, end, rects):
+            idx = self._blocker(candidate, rects)
+            if idx == -1:
+                points = candidate
+                break
+
+            #An obstacle blocking one candidate is likely to block the next
+            # one as well, so it is tested first.
+            rects.insert(0, rects.pop(idx))
+
+        if points is None:
+            points = [start, end]
+
+        points = _clip_route(points, start_rect, end_rect)
+        if points is None:
+            self.remove_route(arrow)
+
+            return None
+
+        self._set_route(arrow, points)
+
+        return points
+
+
+def _route_length(points):
+    #Length of the route, with a small penalty for each bend
+    length = 0.0
+    for i in range(len(points) - 1):
+        (ax, ay), (bx, by) = points[i], points[i + 1]
+        length += math.hypot(bx - ax, by - ay)
+
+    return length + (len(points) - 2) * 1.0
+
+
+def _contains(rect, point):
+    #True if the point lies within the (x1, y1, x2, y2) rect
+    return rect[0] <= point[0] <= rect[2] and rect[1] <= point[1] <= rect[3]
+
+
+def _segment_crosses_rect(a, b, rect):
+    #Liang-Barsky test for the intersection of segment ab with the interior
+    # of the (x1, y1, x2, y2) rect
+    (ax, ay), (bx, by) = a, b
+    dx, dy = bx - ax, by - ay
+    t0, t1 = 0.0, 1.0
+
+    for p, q in ((-dx, ax - rect[0]), (dx, rect[2] - ax),
+                 (-dy, ay - rect[1]), (dy, rect[3] - ay)):
+        if p == 0:
+            if q <= 0:
+                return False
+
+            continue
+
+        t = q / float(p)
+        if p < 0:
+            if t > t1:
+                return False
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return False
+            t1 = min(t1, t)
+
+    return t0 < t1
+
+
+def _exit_point(inside, outside, rect):
+    #Point where the segment from inside to outside leaves the rect
+    (ax, ay), (bx, by) = inside, outside
+    dx, dy = bx - ax, by - ay
+    t = 1.0
+
+    if dx > 0:
+        t = min(t, (rect[2] - ax) / dx)
+    elif dx < 0:
+        t = min(t, (rect[0] - ax) / dx)
+    if dy > 0:
+        t = min(t, (rect[3] - ay) / dy)
+    elif dy < 0:
+        t = min(t, (rect[1] - ay) / dy)
+
+    return ax + dx * t, ay + dy * t
+
+
+def _clip_route(points, start_rect, end_rect):
+    #Trims a route running between the centers of the start and end rects
+    # so that it runs between their edges. Returns None if nothing remains.
+    last = max(i for i, p in enumerate(points) if _contains(start_rect, p))
+    if last == len(points) - 1:
+        return None
+
+    points = [_exit_point(points[last], points[last + 1], start_rect)] + \
+        points[last + 1:]
+
+    first = min(i for i, p in enumerate(points) if _contains(end_rect, p))
+    if first == 0:
+        return None
+
+    points = points[:first] + \
+        [_exit_point(points[first], points[first - 1], end_rect)]
+
+    if points[-2] == points[-1]:
+        return None
+
+    return points
+
+
 class BaseIconRender(object):
     """Renders an icon on the tenure item's header section. This icon can be
     can be used to visually depict the nature of the context of the tenure
@@ -497,41 +1321,250 @@ class TenureLinkRenderer(BaseIconRender):
         p.restore()
 
 
-class BaseTenureItem(QGraphicsItem):
-    """Abstract class that provides core functionality for rendering entity and
-    social tenure relationship objects corresponding to the entities in a
-    given profile."""
-    Type = QGraphicsItem.UserType + 1
+class EntityObservable(object):
+    """
+    Mixin that enables entities, and related objects such as value lists,
+    to notify observers when their columns or lookup values are added,
+    removed or renamed. Observers are callables with the signature
+    observer(source, event, old_value, new_value). STDM-style entities can
+    opt in by implementing register_observer and unregister_observer.
+    ColumnsAdded is used to notify that several columns have been added at
+    once, in which case new_value is a tuple of the column names.
+    """
+    ColumnAdded, ColumnRemoved, ColumnRenamed, LookupAdded, LookupRemoved, \
+        LookupRenamed, ColumnsAdded = range(7)
 
-    def __init__(self, parent=None, scene=None, **kwargs):
-        super(BaseTenureItem, self).__init__(parent, scene)
-        self.setFlag(QGraphicsItem.ItemIsMovable)
+    def _observer_list(self):
+        #Created on demand as subclasses might not call the constructor
+        observers = getattr(self, '_observers', None)
+        if observers is None:
+            observers = []
+            self._observers = observers
 
-        #Renderer for header icon
-        self.icon_renderer = kwargs.get('icon_renderer', None)
+        return observers
 
-        self.arrows = []
+    def register_observer(self, observer):
+        """
+        Adds an observer which will be notified of changes to the object.
+        :param observer: Callable object.
+        :type observer: callable
+        """
+        observers = self._observer_list()
+        if not observer in observers:
+            observers.append(observer)
 
-        self.pen = QPen(
-            Qt.black,
-            0.9,
-            Qt.SolidLine,
-            Qt.RoundCap,
-            Qt.RoundJoin
-        )
+    def unregister_observer(self, observer):
+        """
+        Removes an observer.
+        :param observer: Callable object.
+        :type observer: callable
+        """
+        try:
+            self._observer_list().remove(observer)
+        except ValueError:
+            pass
 
-        #Display properties
-        self._default_header = QApplication.translate(
-            'ProfileTenureView',
-            'Not Defined'
-        )
-        self.header = self._default_header
-        self.items_title = ''
-        self.icon_painter = kwargs.pop('icon_painter', None)
-        self.items = []
+    def notify_observers(self, event, old_value=None, new_value=None):
+        """
+        Notifies the registered observers of a change to the object.
+        :param event: Type of change e.g. ColumnAdded.
+        :type event: int
+        :param old_value: Name of the column or lookup value before the
+        change, None if it has been added.
+        :type old_value: str
+        :param new_value: Name of the column or lookup value after the
+        change, None if it has been removed.
+        :type new_value: str
+        """
+        for observer in self._observer_list()[:]:
+            observer(self, event, old_value, new_value)
+
+
+class LookupCache(object):
+    """
+    Caches the lookup values of value lists so that rendering the same
+    profile does not query the lookups again. Entries are keyed by the
+    identity and, if available, the version attribute of the value list.
+    Observable value lists are invalidated automatically when their lookup
+    values change. The least recently used entries are discarded once the
+    cache holds max_size value lists.
+    """
+    def __init__(self, ttl=None, max_size=128):
+        """
+        Class constructor.
+        :param ttl: Time, in seconds, after which cached lookups expire. If
+        None then the lookups are cached until they are invalidated.
+        :type ttl: float
+        :param max_size: Maximum number of value lists whose lookups are
+        cached.
+        :type max_size: int
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        #Value list id: (value list, version, timestamp, serial, lookups)
+        # ordered from the least to the most recently used. The serial
+        # number identifies each time the lookups were queried.
+        self._entries = OrderedDict()
+        self._serial = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, timestamp, now):
+        return not self.ttl is None and now - timestamp >= self.ttl
+
+    def _valid_entry(self, value_list, now):
+        #Returns the entry of the value list if it is still valid
+        entry = self._entries.get(id(value_list), None)
+        if entry is None:
+            return None
+
+        vl, vl_version, timestamp = entry[:3]
+        if not vl is value_list or \
+                vl_version != getattr(value_list, 'version', None) or \
+                self._expired(timestamp, now):
+            return None
+
+        return entry
+
+    def serial(self, value_list):
+        """
+        :param value_list: Value list object.
+        :type value_list: ValueList
+        :return: Returns a number that identifies the cached lookups of the
+        value list, which changes each time the lookups are queried, or
+        None if there are no valid cached lookups.
+        :rtype: int
+        """
+        entry = self._valid_entry(value_list, time.time())
+        if entry is None:
+            return None
+
+        return entry[3]
+
+    def lookups(self, value_list):
+        """
+        :param value_list: Value list object.
+        :type value_list: ValueList
+        :return: Returns the lookup values of the value list from the cache,
+        the value list is only queried if there is no valid cache entry.
+        :rtype: list
+        """
+        key = id(value_list)
+        version = getattr(value_list, 'version', None)
+        now = time.time()
+
+        entry = self._valid_entry(value_list, now)
+        self._entries.pop(key, None)
+        if not entry is None:
+            #Reinserted as the most recently used entry
+            self._entries[key] = entry
+
+            return list(entry[4])
+
+        values = list(value_list.lookups())
+        self._serial += 1
+
+        #The value list is referenced so that its id is not reused
+        self._entries[key] = (value_list, version, now, self._serial, values)
+
+        if hasattr(value_list, 'register_observer'):
+            value_list.register_observer(self._on_value_list_changed)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries.values()))
+            self.invalidate(oldest[0])
+
+        return list(values)
+
+    def _on_value_list_changed(self, source, event, old_value, new_value):
+        #Invalidate on changes to the lookup values
+        if event in (EntityObservable.LookupAdded,
+                     EntityObservable.LookupRemoved,
+                     EntityObservable.LookupRenamed):
+            self.invalidate(source)
+
+    def invalidate(self, value_list=None):
+        """
+        Removes cached lookups.
+        :param value_list: Value list whose lookups will be removed. If
+        None then the whole cache is cleared.
+        :type value_list: ValueList
+        """
+        if value_list is None:
+            entries = [e[0] for e in self._entries.values()]
+            self._entries.clear()
+        else:
+            entry = self._entries.pop(id(value_list), None)
+            entries = [] if entry is None else [entry[0]]
+
+        for vl in entries:
+            if hasattr(vl, 'unregister_observer'):
+                vl.unregister_observer(self._on_value_list_changed)
+
+    def evict_expired(self):
+        """
+        Removes the entries whose time to live has elapsed.
+        """
+        now = time.time()
+
+        for entry in list(self._entries.values()):
+            if self._expired(entry[2], now):
+                self.invalidate(entry[0])
+
+
+#Lookup cache shared by all views in the process
+lookup_cache = LookupCache()
+
+
+class BaseTenureItem(QGraphicsItem):
+    """Abstract class that provides core functionality for rendering entity and
+    social tenure relationship objects corresponding to the entities in a
+    given profile."""
+    Type = QGraphicsItem.UserType + 1
+
+    #EntityObservable events handled by the item
+    observed_events = ()
+
+    def __init__(self, parent=None, scene=None, **kwargs):
+        super(BaseTenureItem, self).__init__(parent, scene)
+        self.setFlag(QGraphicsItem.ItemIsMovable)
+        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
+
+        #Renderer for header icon
+        self.icon_renderer = kwargs.get('icon_renderer', None)
+
+        self.arrows = []
+
+        self.pen = QPen(
+            Qt.black,
+            0.9,
+            Qt.SolidLine,
+            Qt.RoundCap,
+            Qt.RoundJoin
+        )
+
+        #Display properties
+        self._default_header = QApplication.translate(
+            'ProfileTenureView',
+            'Not Defined'
+        )
+        self.header = self._default_header
+        self.items_title = ''
+        self.icon_painter = kwargs.pop('icon_painter', None)
+        self.items = []
         self.font_name = 'Consolas'
         self._entity = None
 
+        #Header and items last derived from the entity
+        self._entity_content = None
+
+        #Identifies the source of the content, see _entity_source_key
+        self._source_key = None
+
+        #Object whose change notifications are being observed
+        self._observed = None
+
         #Distance between the primary shape and its shadow
         self.shadow_thickness = 4
 
@@ -539,6 +1572,12 @@ class BaseTenureItem(QGraphicsItem):
         self._height = self._side
         self._start_pos = 10
 
+        #Cached heights of the item's sections, see _layout_metrics
+        self._layout = None
+
+        #Cached rect of the primary item in scene coordinates
+        self._scene_rect = None
+
         #The start and stop positions match the size of the item
         stop_position = self._start_pos + self._side
 
@@ -570,6 +1609,9 @@ class BaseTenureItem(QGraphicsItem):
         self._shadow_gradient.setColorAt(1.0, QColor('#d1d1d1'))
         self._brush = QBrush(self._gradient)
 
+        #Solid brush used instead of the gradient in draft mode
+        self._draft_brush = QBrush(self._gradient_light)
+
         self._text_highlight_color = QColor('#E74C3C')
         self._text_item_color = QColor('#CC0000')
         self._normal_text_color = Qt.black
@@ -593,9 +1635,7 @@ class BaseTenureItem(QGraphicsItem):
         Removes all arrows associated with this item and related item.
         """
         for ar in self.arrows[:]:
-            ar.start_item.remove_arrow(ar)
-            ar.end_item.remove_arrow(ar)
-            self.scene().removeItem(ar)
+            self.scene().remove_arrow(ar)
 
     def add_arrow(self, arrow):
         """
@@ -621,8 +1661,12 @@ class BaseTenureItem(QGraphicsItem):
         """
         self.header = self._default_header
         self.items = []
+        self._entity = None
+        self._entity_content = None
+        self._source_key = None
+        self._observe(None)
 
-        self.update()
+        self.refresh_layout()
 
     @property
     def brush(self):
@@ -678,21 +1722,139 @@ class BaseTenureItem(QGraphicsItem):
     @entity.setter
     def entity(self, entity):
         """
-        Sets the current entity object.
+        Sets the current entity object. The item is only updated if the
+        header or items derived from the entity differ from those currently
+        rendered.
         :param entity: Entity object.
         :type entity: Entity
         """
         self._entity = entity
-        self.prepareGeometryChange()
+
+        if entity is None:
+            self._observe(None)
+
+            return
+
+        self._observe(self.observed_object(entity))
+
+        #Entities loaded on demand fetch their remaining columns in the
+        # background, the item is updated through the notifications.
+        if hasattr(entity, 'load_remaining'):
+            entity.load_remaining()
+
+        #Skip computing the content if its source has not changed
+        key = self._entity_source_key(entity)
+        if not key is None and key == self._source_key and \
+                not self._entity_content is None:
+            return
+
+        content = self.entity_content(entity)
+        self._source_key = self._entity_source_key(entity)
+        if content == self._entity_content:
+            return
+
+        self._entity_content = content
         self._on_set_entity()
 
-    def _on_set_entity(self):
+    def entity_content(self, entity):
         """
-        Update attributes based on the entity's attributes. To be implemented
-        by subclasses.
+        Computes the content rendered by the item for the given entity. It
+        is used to determine whether the item needs to be updated when the
+        entity is set. To be implemented by subclasses.
+        :param entity: Entity object.
+        :type entity: Entity
+        :return: Returns the header text, or None if the header is not
+        derived from the entity, and a tuple of the item strings.
+        :rtype: tuple
         """
         raise NotImplementedError
 
+    def _entity_source_key(self, entity):
+        """
+        Used to avoid recomputing the content, which might be expensive,
+        when the same entity is set again. Changes notified by the observed
+        object are patched into the content and do not invalidate the key.
+        Not to be confused with content_key, which describes the rendered
+        content.
+        :param entity: Entity object.
+        :type entity: Entity
+        :return: Returns a hashable value that changes whenever the content
+        derived from the entity might have changed, or None if the content
+        should always be recomputed. Default is None.
+        :rtype: tuple
+        """
+        return None
+
+    def observed_object(self, entity):
+        """
+        :param entity: Entity object.
+        :type entity: Entity
+        :return: Returns the object, derived from the entity, whose change
+        notifications will be used to update the item. Default is the
+        entity itself.
+        :rtype: EntityObservable
+        """
+        return entity
+
+    def _observe(self, obj):
+        #Registers for change notifications from obj and stops observing
+        # the previous object.
+        if obj is self._observed:
+            return
+
+        if hasattr(self._observed, 'unregister_observer'):
+            self._observed.unregister_observer(self._on_entity_changed)
+
+        self._observed = None
+
+        if hasattr(obj, 'register_observer'):
+            obj.register_observer(self._on_entity_changed)
+            self._observed = obj
+
+    def _on_entity_changed(self, source, event, old_value, new_value):
+        #Patches the items in place based on the change notification
+        if not event in self.observed_events or self._entity_content is None:
+            return
+
+        items = list(self._entity_content[1])
+
+        if event in (EntityObservable.ColumnAdded,
+                     EntityObservable.LookupAdded):
+            items.append(new_value)
+
+        elif event == EntityObservable.ColumnsAdded:
+            items.extend(new_value)
+
+        elif event in (EntityObservable.ColumnRemoved,
+                       EntityObservable.LookupRemoved):
+            if not old_value in items:
+                return
+            items.remove(old_value)
+
+        elif event in (EntityObservable.ColumnRenamed,
+                       EntityObservable.LookupRenamed):
+            if not old_value in items:
+                return
+            items[items.index(old_value)] = new_value
+
+        self._entity_content = (self._entity_content[0], tuple(items))
+        self._source_key = self._entity_source_key(self._entity)
+        self.items = items
+
+        self.refresh_layout()
+
+    def _on_set_entity(self):
+        """
+        Update attributes based on the entity's attributes.
+        """
+        header, items = self._entity_content
+
+        if not header is None:
+            self.header = header
+        self.items = list(items)
+
+        self.refresh_layout()
+
     @property
     def width(self):
         """
@@ -711,16 +1873,124 @@ class BaseTenureItem(QGraphicsItem):
         """
         return float(self._height + self.shadow_thickness)
 
+    def _layout_metrics(self):
+        #Computes the heights of the header, items title, items and the
+        # whole item. The values are cached until refresh_layout is called.
+        if not self._layout is None:
+            return self._layout
+
+        #Use height of subsections to compute the appropriate height
+        header_height = self._font_height(self.header_font, self.header) + 7
+
+        items_title_height = self._font_height(
+            self.items_title_font,
+            self.items_title
+        )
+        margin = 1
+
+        fixed_height = header_height + items_title_height + (6 * margin)
+
+        if self.auto_adjust_height():
+            items_height = self.items_size(self.items).height() + 2
+            main_item_height = max(self._side, fixed_height + items_height)
+
+        else:
+            items_height = self._side - fixed_height
+            main_item_height = self._side
+
+        self._height = main_item_height
+        self._layout = (
+            header_height,
+            items_title_height,
+            items_height,
+            main_item_height
+        )
+
+        return self._layout
+
+    def refresh_layout(self):
+        """
+        Recomputes the size of the item after the header or items have
+        changed, and updates the arrows connected to the item.
+        """
+        self.prepareGeometryChange()
+        self._layout = None
+        self._scene_rect = None
+        self._layout_metrics()
+        self._geometry_changed()
+
+        self.update()
+
+    def _geometry_changed(self):
+        #Updates the connected arrows and the contents bounds of the scene,
+        # the arrows are deferred if the scene is in a batch update.
+        scene = self.scene()
+        if isinstance(scene, ProfileTenureScene):
+            scene.item_geometry_changed(self)
+
+        else:
+            for ar in self.arrows:
+                ar.update_position()
+
+    def itemChange(self, change, value):
+        #Keep the geometry of the connected arrows up to date
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            self._scene_rect = None
+            self._geometry_changed()
+
+        elif change == QGraphicsItem.ItemVisibleHasChanged:
+            self._geometry_changed()
+
+        #Keep the arrow router and contents bounds in sync with the scene
+        elif change == QGraphicsItem.ItemSceneChange:
+            scene = self.scene()
+            if isinstance(scene, ProfileTenureScene):
+                scene.item_removed(self)
+
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            scene = self.scene()
+            if isinstance(scene, ProfileTenureScene):
+                scene.item_added(self)
+
+        return super(BaseTenureItem, self).itemChange(change, value)
+
     def scene_bounding_rect(self):
         """
         :return: Returns the bounding rect of the primary item in scene
         coordinates, this does not include the shadow thickness.
         :rtype: QRectF
         """
-        local_start_point = QPointF(self._start_pos, self._start_pos)
-        scene_start_point = self.mapToScene(local_start_point)
+        #Cached until the item is moved or its layout changes
+        if self._scene_rect is None:
+            self._layout_metrics()
+
+            local_start_point = QPointF(self._start_pos, self._start_pos)
+            scene_start_point = self.mapToScene(local_start_point)
+            self._scene_rect = QRectF(
+                scene_start_point,
+                QSizeF(self._side, self._height)
+            )
+
+        return QRectF(self._scene_rect)
+
+    def content_key(self):
+        """
+        :return: Returns a tuple describing the rendered content of the item
+        i.e. the type, header, items and position. Two items with the same
+        content key are rendered identically.
+        :rtype: tuple
+        """
+        pos = self.pos()
 
-        return QRectF(scene_start_point, QSizeF(self._side, self._height))
+        return (
+            self.type(),
+            unicode(self.header),
+            unicode(self.items_title),
+            tuple(unicode(i) for i in self.items),
+            pos.x(),
+            pos.y(),
+            self.isVisible()
+        )
 
     def center(self):
         """
@@ -877,6 +2147,16 @@ class BaseTenureItem(QGraphicsItem):
 
         layout.draw(painter, QPointF(start_x, start_y))
 
+    def _is_draft(self, widget):
+        #True if the item is being painted on a view in draft mode. Images
+        # are rendered without a widget hence always in full quality.
+        if widget is None:
+            return False
+
+        view = widget.parent()
+
+        return isinstance(view, ProfileTenureView) and view.draft_mode()
+
     def paint(self, painter, option, widget=None):
         """
         Performs the painting of the tenure item based on the object's
@@ -890,27 +2170,10 @@ class BaseTenureItem(QGraphicsItem):
         """
         shadow_start_pos = self._start_pos + self.shadow_thickness
 
-        #Use height of subsections to compute the appropriate height
-        header_height = self._font_height(self.header_font, self.header) + 7
-
-        items_title_height = self._font_height(
-            self.items_title_font,
-            self.items_title
-        )
+        header_height, items_title_height, items_height, main_item_height = \
+            self._layout_metrics()
         margin = 1
 
-        fixed_height = header_height + items_title_height + (6 * margin)
-
-        if self.auto_adjust_height():
-            items_height = self.items_size(self.items).height() + 2
-            main_item_height = max(self._side, fixed_height + items_height)
-
-        else:
-            items_height = self._side - fixed_height
-            main_item_height = self._side
-
-        self._height = main_item_height
-
         shadow_rect = QRect(
             shadow_start_pos,
             shadow_start_pos,
@@ -929,13 +2192,17 @@ class BaseTenureItem(QGraphicsItem):
         painter_pen.setColor(self._normal_text_color)
         painter_pen.setWidth(0)
 
+        #Shadow, gradients and icon are left out in draft mode
+        draft = self._is_draft(widget)
+
         #Create shadow effect using linear gradient
-        painter.setBrush(self._shadow_gradient)
-        painter.setPen(Qt.NoPen)
-        painter.drawRect(shadow_rect)
+        if not draft:
+            painter.setBrush(self._shadow_gradient)
+            painter.setPen(Qt.NoPen)
+            painter.drawRect(shadow_rect)
 
         painter.setPen(self.pen)
-        painter.setBrush(self._brush)
+        painter.setBrush(self._draft_brush if draft else self._brush)
 
         #Main item outline
         painter.drawRect(main_item_rect)
@@ -963,7 +2230,7 @@ class BaseTenureItem(QGraphicsItem):
             header_rect.setWidth(adj_width)
 
         #Draw header icon if renderer is available
-        if not self.icon_renderer is None:
+        if not self.icon_renderer is None and not draft:
             if isinstance(self.icon_renderer, BaseIconRender):
                 self.icon_renderer.draw(painter, self)
 
@@ -1047,6 +2314,13 @@ class EntityItem(BaseTenureItem):
     """
     Type = QGraphicsItem.UserType + 2
 
+    observed_events = (
+        EntityObservable.ColumnAdded,
+        EntityObservable.ColumnsAdded,
+        EntityObservable.ColumnRemoved,
+        EntityObservable.ColumnRenamed
+    )
+
     def __init__(self, *args, **kwargs):
         super(EntityItem, self).__init__(*args, **kwargs)
         columns = QApplication.translate(
@@ -1062,11 +2336,20 @@ class EntityItem(BaseTenureItem):
     def type(self):
         return EntityItem.Type
 
-    def _on_set_entity(self):
-        if not self._entity is None:
-            self.header = self.entity.short_name
-            self.items = self.entity.columns.keys()
-            self.update()
+    def entity_content(self, entity):
+        return entity.short_name, tuple(entity.columns.keys())
+
+
+def _value_list_key(value_list):
+    #Source key of items listing the lookups of a value list. It is None,
+    # hence the lookups are read again, unless they are cached so that
+    # invalidating the cache, or the time to live elapsing, refreshes the
+    # items. The item observes the value list so its id is not reused.
+    serial = lookup_cache.serial(value_list)
+    if serial is None:
+        return None
+
+    return id(value_list), serial
 
 
 class TenureRelationshipItem(BaseTenureItem):
@@ -1075,6 +2358,12 @@ class TenureRelationshipItem(BaseTenureItem):
     """
     Type = QGraphicsItem.UserType + 3
 
+    observed_events = (
+        EntityObservable.LookupAdded,
+        EntityObservable.LookupRemoved,
+        EntityObservable.LookupRenamed
+    )
+
     def __init__(self, *args, **kwargs):
         super(TenureRelationshipItem, self).__init__(*args, **kwargs)
         tenure_types = QApplication.translate(
@@ -1098,10 +2387,17 @@ class TenureRelationshipItem(BaseTenureItem):
         #Base class override
         return False
 
-    def _on_set_entity(self):
-        if not self._entity is None:
-            self.items = self.entity.tenure_type_lookup.value_list.lookups()
-            self.update()
+    def observed_object(self, entity):
+        return entity.tenure_type_lookup.value_list
+
+    def _entity_source_key(self, entity):
+        return _value_list_key(entity.tenure_type_lookup.value_list)
+
+    def entity_content(self, entity):
+        value_list = entity.tenure_type_lookup.value_list
+        lookups = lookup_cache.lookups(value_list)
+
+        return None, tuple(lookups)
 
 
 class TenureDocumentItem(BaseTenureItem):
@@ -1110,6 +2406,12 @@ class TenureDocumentItem(BaseTenureItem):
     """
     Type = QGraphicsItem.UserType + 4
 
+    observed_events = (
+        EntityObservable.LookupAdded,
+        EntityObservable.LookupRemoved,
+        EntityObservable.LookupRenamed
+    )
+
     def __init__(self, *args, **kwargs):
         super(TenureDocumentItem, self).__init__(*args, **kwargs)
         tenure_types = QApplication.translate(
@@ -1133,283 +2435,567 @@ class TenureDocumentItem(BaseTenureItem):
         #Base class override
         return False
 
-    def _on_set_entity(self):
-        if not self._entity is None:
-            supporting_doc = self.entity.supporting_doc
-            self.items = supporting_doc.doc_type.value_list.lookups()
-
-            self.update()
+    def observed_object(self, entity):
+        return entity.supporting_doc.doc_type.value_list
 
+    def _entity_source_key(self, entity):
+        return _value_list_key(entity.supporting_doc.doc_type.value_list)
 
-class Annotation(QGraphicsTextItem):
-    """Add major or minor annotation item to the view. The only difference
-    between major and minor annotations is the font size and underline
-    (for the former)."""
-    Minor, Major = range(2)
+    def entity_content(self, entity):
+        value_list = entity.supporting_doc.doc_type.value_list
+        lookups = lookup_cache.lookups(value_list)
 
-    lost_focus = pyqtSignal(QGraphicsTextItem)
+        return None, tuple(lookups)
 
-    def __init__(self, parent=None, scene=None, size=0):
-        super(Annotation, self).__init__(parent, scene)
 
-        self.setFlag(QGraphicsItem.ItemIsMovable)
-        self.setFlag(QGraphicsItem.ItemIsSelectable)
+class PartyGroupItem(BaseTenureItem):
+    """
+    Renders a group of party entities as a single item listing the names
+    of the parties and their count. The parties in the group are not
+    rendered as individual items, which keeps profiles with many parties
+    responsive. The group can be expanded into individual party items by
+    the view.
+    """
+    Type = QGraphicsItem.UserType + 5
 
-        self.size = size
-        self.setDefaultTextColor(Qt.black)
+    def __init__(self, name, parties=None, *args, **kwargs):
+        super(PartyGroupItem, self).__init__(*args, **kwargs)
+        self._name = name
+        self._members = OrderedDict()
 
-        font = 'Consolas'
+        parties_title = QApplication.translate(
+            'ProfileTenureView',
+            'parties'
+        )
+        self.items_title = u'<<{0}>>'.format(parties_title)
 
-        #Set font size
-        if self.size == Annotation.Minor:
-            self.setFont(QFont(font, 10, 50))
+        #Use default renderer if none is specified
+        if self.icon_renderer is None:
+            self.icon_renderer = EntityIconRenderer()
 
+        if parties:
+            self.add_members(parties)
         else:
-            font = QFont(font, 14, 75)
-            font.setUnderline(True)
-            self.setFont(font)
+            self._update_members()
 
-    def focusOutEvent(self, event):
-        #Disable text interaction
-        self.setTextInteractionFlags(Qt.NoTextInteraction)
-        self.lost_focus.emit(self)
-        super(Annotation, self).focusOutEvent(event)
-
-    def mouseDoubleClickEvent(self, event):
-        #Enable text interaction
-        if self.textInteractionFlags() == Qt.NoTextInteraction:
-            self.setTextInteractionFlags(Qt.TextEditorInteraction)
+    def type(self):
+        return PartyGroupItem.Type
 
-        super(Annotation, self).mouseDoubleClickEvent(event)
+    def auto_adjust_height(self):
+        #Base class override, the item does not grow with the members
+        return False
 
+    @property
+    def name(self):
+        """
+        :return: Returns the name of the group.
+        :rtype: str
+        """
+        return self._name
 
-class ProfileTenureScene(QGraphicsScene):
-    """
-    Custom scene for handling annotation items.
-    """
-    InsertMajorAnnotation, InsertMinorAnnotation, MoveItem = range(3)
+    def members(self):
+        """
+        :return: Returns the party entities in the group.
+        :rtype: list
+        """
+        return list(self._members.values())
 
-    annotation_inserted = pyqtSignal(QGraphicsTextItem)
+    def has_member(self, name):
+        """
+        :param name: Party name.
+        :type name: str
+        :return: Returns True if the party with the given name is in the
+        group.
+        :rtype: bool
+        """
+        return name in self._members
 
-    def __init__(self, parent=None):
-        super(ProfileTenureScene, self).__init__(parent)
+    def add_members(self, parties):
+        """
+        Adds party entities to the group. Existing parties with the same
+        names are replaced.
+        :param parties: Party entities.
+        :type parties: list
+        """
+        for party in parties:
+            self._members[party.short_name] = party
 
-        self.mode = ProfileTenureScene.MoveItem
+        self._update_members()
 
-    def editor_lost_focus(self, item):
+    def remove_member(self, name):
         """
-        Check if the annotation item is empty and delete if it is.
-        :param item: Annotation item.
-        :type item: QGraphicsTextItem
+        Removes the party with the given name from the group.
+        :param name: Party name.
+        :type name: str
+        :return: Returns the party entity or None if there is no party with
+        the given name in the group.
+        :rtype: Entity
         """
-        cursor = item.textCursor()
-        cursor.clearSelection()
-        item.setTextCursor(cursor)
+        party = self._members.pop(name, None)
+        if not party is None:
+            self._update_members()
 
-        if not item.toPlainText():
-            self.removeItem(item)
-            item.deleteLater()
+        return party
 
-    def mousePressEvent(self, event):
+    def _update_members(self):
+        #Shows the member count in the header and the names as the items
+        self.header = u'{0} ({1})'.format(self._name, len(self._members))
+        self.items = list(self._members.keys())
+        self.refresh_layout()
+
+
+class EntityItemPool(object):
+    """
+    Bounded pool of detached EntityItem objects. Items of removed parties
+    are reset and kept in the pool so that they can be reused when parties
+    are added, instead of creating new items with their own gradients,
+    brushes and renderers. Items released once the pool is full are
+    discarded.
+    """
+    def __init__(self, max_size=64):
         """
-        Handles insert of annotation item.
-        :param event: Mouse press event.
-        :type event: QGraphicsSceneMouseEvent
+        Class constructor.
+        :param max_size: Maximum number of items held in the pool.
+        :type max_size: int
         """
-        if event.button() != Qt.LeftButton:
-            return
+        self.max_size = max_size
+        self._items = []
 
-        if self.mode == ProfileTenureScene.InsertMajorAnnotation:
-            sz = Annotation.Major
-            self._insert_annotation_item(sz, event.scenePos())
-        elif self.mode == ProfileTenureScene.InsertMinorAnnotation:
-            sz = Annotation.Minor
-            self._insert_annotation_item(sz, event.scenePos())
+    def __len__(self):
+        return len(self._items)
 
-        super(ProfileTenureScene, self).mousePressEvent(event)
+    def acquire(self):
+        """
+        :return: Returns an item from the pool or a new item if the pool is
+        empty. The item is not in a scene and has no entity.
+        :rtype: EntityItem
+        """
+        if self._items:
+            return self._items.pop()
 
-    def _insert_annotation_item(self, size, scene_pos):
-        #Insert major or minor annotation based on size
-        annotation = Annotation(size=size)
-        annotation.setTextInteractionFlags(Qt.TextEditorInteraction)
-        annotation.setZValue(1000.0)
-        annotation.lost_focus.connect(self.editor_lost_focus)
-        self.addItem(annotation)
-        annotation.setPos(scene_pos)
-        self.annotation_inserted.emit(annotation)
+        return EntityItem()
 
+    def release(self, item):
+        """
+        Resets an item that is no longer used and adds it to the pool. The
+        item should have been removed from the scene together with its
+        arrows.
+        :param item: Entity item.
+        :type item: EntityItem
+        :return: Returns True if the item was added to the pool, otherwise
+        False if the pool is full or the item is still in a scene.
+        :rtype: bool
+        """
+        if not item.scene() is None:
+            return False
 
-class ProfileTenureView(QGraphicsView):
+        #Stops observing the entity and clears the header and items, even
+        # if the pool is full, so that dropped items are not kept alive by
+        # their entities
+        item.invalidate()
+        item.setCacheMode(QGraphicsItem.NoCache)
+
+        if len(self._items) >= self.max_size:
+            return False
+
+        item.setPos(0, 0)
+        item.setVisible(True)
+        self._items.append(item)
+
+        return True
+
+    def clear(self):
+        """
+        Discards all the items in the pool.
+        """
+        del self._items[:]
+
+
+class Annotation(QGraphicsTextItem):
+    """Add major or minor annotation item to the view. The only difference
+    between major and minor annotations is the font size and underline
+    (for the former)."""
+    Minor, Major = range(2)
+
+    lost_focus = pyqtSignal(QGraphicsTextItem)
+
+    def __init__(self, parent=None, scene=None, size=0):
+        super(Annotation, self).__init__(parent, scene)
+
+        self.setFlag(QGraphicsItem.ItemIsMovable)
+        self.setFlag(QGraphicsItem.ItemIsSelectable)
+
+        self.size = size
+        self.setDefaultTextColor(Qt.black)
+
+        font = 'Consolas'
+
+        #Set font size
+        if self.size == Annotation.Minor:
+            self.setFont(QFont(font, 10, 50))
+
+        else:
+            font = QFont(font, 14, 75)
+            font.setUnderline(True)
+            self.setFont(font)
+
+    def focusOutEvent(self, event):
+        #Disable text interaction
+        self.setTextInteractionFlags(Qt.NoTextInteraction)
+        self.lost_focus.emit(self)
+        super(Annotation, self).focusOutEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        #Enable text interaction
+        if self.textInteractionFlags() == Qt.NoTextInteraction:
+            self.setTextInteractionFlags(Qt.TextEditorInteraction)
+
+        super(Annotation, self).mouseDoubleClickEvent(event)
+
+
+class ProfileTenureScene(QGraphicsScene):
     """
-    A widget for rendering a profile's social tenure relationship. It also
-    includes functionality for saving the view as an image.
+    Custom scene for handling annotation items. It also contains the items
+    and profile of the social tenure relationship diagram so that it can be
+    shared by several views.
     """
-    MIN_DPI = 72
-    MAX_DPI = 600
+    InsertMajorAnnotation, InsertMinorAnnotation, MoveItem = range(3)
 
-    def __init__(self, parent=None, profile=None):
-        super(ProfileTenureView, self).__init__(parent)
+    #Space, in pixels, kept between the items and the edge of the scene
+    # rect when it grows
+    SCENE_MARGIN = 40
 
-        #Init items
-        #Container for party entities and corresponding items
-        self._default_party_item = EntityItem()
-        self._party_items = {}
-        self._sp_item = EntityItem()
-        self._str_item = TenureRelationshipItem()
-        self._supporting_doc_item = TenureDocumentItem()
+    #Extra space, in pixels, added to each side of the scene rect that
+    # grows so that dragging an item outwards does not change the scene
+    # rect, and rerender the minimap, on every step
+    SCENE_GROWTH_STEP = 480
 
-        self.profile = profile
+    annotation_inserted = pyqtSignal(QGraphicsTextItem)
 
-        scene_rect = QRectF(0, 0, 960, 540)
-        scene = ProfileTenureScene(self)
-        scene.setItemIndexMethod(QGraphicsScene.NoIndex)
-        scene.setSceneRect(scene_rect)
+    def __init__(self, parent=None):
+        super(ProfileTenureScene, self).__init__(parent)
 
-        self.setRenderHint(QPainter.Antialiasing)
-        self.setRenderHint(QPainter.TextAntialiasing)
-        self.setResizeAnchor(QGraphicsView.AnchorViewCenter)
+        self.mode = ProfileTenureScene.MoveItem
 
-        self.setScene(scene)
+        #Arrows whose update has been deferred by begin_batch_update
+        self._deferred_arrows = None
 
-        #Connect signals
-        scene.annotation_inserted.connect(self.annotation_inserted)
+        #Hit-test mode applied to arrows
+        self._arrow_hit_test_mode = Arrow.PreciseHitTest
 
-        #Add items to view
-        self.scene().addItem(self._default_party_item)
-        self.scene().addItem(self._str_item)
-        self.scene().addItem(self._sp_item)
-        self.scene().addItem(self._supporting_doc_item)
+        #Optional router for arrows, straight arrows are used if None
+        self._router = None
 
-        #Position items
-        self._default_party_item.setPos(200, 20)
-        self._str_item.setPos(400, 20)
-        self._sp_item.setPos(600, 20)
-        self._supporting_doc_item.setPos(400, 220)
+        #Scene rects of the visible tenure items and their union, which is
+        # only recomputed if it may have shrunk. See contents_rect.
+        self._item_rects = {}
+        self._contents_rect = QRectF()
+        self._contents_dirty = False
 
-        #Ensure vertical scroll is at the top
-        self.centerOn(490.0, 20.0)
+        #Grow the scene rect when items are moved outside it
+        self.auto_grow = True
+
+        #Number of views that need the tenure items to be cached, see
+        # begin_item_caching
+        self._item_cache_refs = 0
+
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.setSceneRect(QRectF(0, 0, 960, 540))
+
+        self.profile = None
+
+        #Init items
+        #Container for party entities and corresponding items
+        self.default_party_item = EntityItem()
+        self.party_items = {}
+        self.party_groups = OrderedDict()
+        self.sp_item = EntityItem()
+        self.str_item = TenureRelationshipItem()
+        self.supporting_doc_item = TenureDocumentItem()
+
+        self.addItem(self.default_party_item)
+        self.addItem(self.str_item)
+        self.addItem(self.sp_item)
+        self.addItem(self.supporting_doc_item)
+
+        #Position items
+        self.default_party_item.setPos(*ProfileTenureModel.PARTY_POS)
+        self.str_item.setPos(*ProfileTenureModel.SOCIAL_TENURE_POS)
+        self.sp_item.setPos(*ProfileTenureModel.SPATIAL_UNIT_POS)
+        self.supporting_doc_item.setPos(
+            *ProfileTenureModel.SUPPORTING_DOC_POS
+        )
 
         #Link social tenure item to supporting documents item
-        self.add_arrow(self._supporting_doc_item, self._str_item)
+        self.add_arrow(self.supporting_doc_item, self.str_item)
 
-    def annotation_inserted(self, item):
+    def arrow_hit_test_mode(self):
         """
-        Slot raised when an annotation item has been inserted.
-        :param item: Annotation item.
-        :type item: Annotation
+        :return: Returns the hit-test mode of the arrows in the scene.
+        :rtype: int
         """
-        self.scene().mode = ProfileTenureScene.MoveItem
+        return self._arrow_hit_test_mode
 
-    @property
-    def profile(self):
+    def set_arrow_hit_test_mode(self, mode):
         """
-        :return: The profile object being rendered.
-        :rtype: Profile
+        Sets the hit-test mode of existing and new arrows in the scene. Use
+        Arrow.LooseHitTest for faster picking in crowded scenes.
+        :param mode: Arrow.PreciseHitTest or Arrow.LooseHitTest.
+        :type mode: int
         """
-        return self._profile
+        self._arrow_hit_test_mode = mode
 
-    def _update_profile(self):
-        #Update profile objects and render
-        if self._profile is None:
-            return
+        for item in self.items():
+            if isinstance(item, Arrow):
+                item.hit_test_mode = mode
 
-        str_ent = self._profile.social_tenure
-        # Set renderer entities
-        self._sp_item.entity = str_ent.spatial_unit
-        self._str_item.entity = str_ent
-        self._supporting_doc_item.entity = str_ent
+    def router(self):
+        """
+        :return: Returns the router used to route arrows around items, or
+        None if arrows are drawn as straight lines.
+        :rtype: ArrowRouter
+        """
+        return self._router
 
-    @profile.setter
-    def profile(self, profile):
+    def set_router(self, router):
         """
-        Sets the profile object whose STR view is to rendered.
-        :param profile: Profile object to be rendered.
-        :type profile: Profile
+        Sets the router used to route arrows around items and reroutes all
+        the arrows in the scene.
+        :param router: Arrow router, or None to draw arrows as straight
+        lines.
+        :type router: ArrowRouter
         """
-        self._profile = profile
+        if not self._router is None:
+            self._router.clear()
 
-        self._update_profile()
+        self._router = router
 
-    def add_party_entity(self, party):
+        arrows = []
+        for item in self.items():
+            if isinstance(item, Arrow):
+                arrows.append(item)
+
+            elif isinstance(item, BaseTenureItem) and not router is None:
+                router.add_obstacle(item)
+
+        self.update_arrows(arrows)
+
+    def begin_batch_update(self):
         """
-        Adds a party entity to the view. If there is a existing one with the
-        same name then it will be removed before adding this party.
-        :param party: Party entity.
-        :type party: Entity
+        Defers updating the geometry of arrows until end_batch_update is
+        called, so that the arrows affected when many items are moved, such
+        as after a relayout, are updated in a single pass.
         """
-        if party.short_name in self._party_items:
-            self.remove_party(party.short_name)
+        if self._deferred_arrows is None:
+            self._deferred_arrows = set()
 
-        #Hide default party placeholder
-        self._default_party_item.hide()
+    def end_batch_update(self):
+        """
+        Updates the geometry of the arrows deferred since
+        begin_batch_update was called.
+        """
+        arrows = self._deferred_arrows
+        self._deferred_arrows = None
 
-        p_item = EntityItem()
-        p_item.entity = party
-        self.scene().addItem(p_item)
+        if not arrows:
+            return
+
+        #Routed arrows are computed one at a time
+        if self._router is None:
+            update_arrow_positions(arrows)
 
-        if len(self._party_items) == 0:
-            p_item.setPos(200, 20)
         else:
-            self.auto_position(p_item)
+            for ar in arrows:
+                ar.update_position()
 
-        #Add to collection
-        self._party_items[party.short_name] = p_item
+    def update_arrows(self, arrows):
+        """
+        Updates the geometry of the given arrows, or defers the update if
+        the scene is in a batch update.
+        :param arrows: Arrow items.
+        :type arrows: list
+        """
+        if not self._deferred_arrows is None:
+            self._deferred_arrows.update(arrows)
 
-        #Add connection arrow to social tenure item
-        self.add_arrow(p_item, self._str_item)
+            return
 
-    def auto_position(self, item):
+        for ar in arrows:
+            ar.update_position()
+
+    def begin_item_caching(self):
         """
-        Automatically positions the party item to prevent it from overlapping
-        the others.
-        :param item: Party entity item.
-        :type item: EntityItem
+        Renders the tenure items from cached pixmaps, in item coordinates,
+        until end_item_caching is called. Calls are counted so that views
+        sharing the scene, such as those zooming at the same time, do not
+        restore full quality rendering while another view still needs the
+        cache.
         """
-        pass
+        self._item_cache_refs += 1
+        if self._item_cache_refs == 1:
+            self._set_item_cache_mode(QGraphicsItem.ItemCoordinateCache)
 
-    def remove_party(self, name):
+    def end_item_caching(self):
         """
-        Removes the party with the specified name from the collection.
-        :param name: Party name
-        :return: Returns True if the operation succeeded, otherwise False if
-        the party with the specified name does not exist in the collection.
-        :rtype: bool
+        Ends a begin_item_caching call. The items are rendered directly
+        again once all the calls have ended.
         """
-        if not name in self._party_items:
-            return False
+        if self._item_cache_refs == 0:
+            return
 
-        p_item = self._party_items.pop(name)
-        self.scene().removeItem(p_item)
+        self._item_cache_refs -= 1
+        if self._item_cache_refs == 0:
+            self._set_item_cache_mode(QGraphicsItem.NoCache)
 
-        del p_item
+    def _set_item_cache_mode(self, mode):
+        #Sets the cache mode of the tenure items in the scene
+        for item in self.items():
+            if isinstance(item, BaseTenureItem):
+                item.setCacheMode(mode)
 
-        #Show default party item
-        if len(self._party_items) == 0:
-            self._default_party_item.show()
+    def item_added(self, item):
+        """
+        Registers a tenure item that has been added to the scene with the
+        arrow router and the contents bounds.
+        :param item: Tenure item.
+        :type item: BaseTenureItem
+        """
+        #Items might have been cached by the scene they were in before
+        if self._item_cache_refs > 0:
+            item.setCacheMode(QGraphicsItem.ItemCoordinateCache)
+        else:
+            item.setCacheMode(QGraphicsItem.NoCache)
 
-        return True
+        if not self._router is None:
+            self._router.add_obstacle(item)
 
-    def invalidate_spatial_unit(self):
+        self._update_item_rect(item)
+
+    def item_removed(self, item):
         """
-        Clears the spatial unit entity.
+        Removes a tenure item that is being removed from the scene from the
+        arrow router and the contents bounds.
+        :param item: Tenure item.
+        :type item: BaseTenureItem
         """
-        self._sp_item.invalidate()
-        self._sp_item.remove_arrows()
+        if not self._router is None:
+            #Arrows that went around the item can now take a shorter route,
+            # those connected to it are removed together with the item
+            arrows = self._router.remove_obstacle(item)
+            arrows.difference_update(item.arrows)
+            self.update_arrows(arrows)
 
-    def set_spatial_unit(self, spatial_unit):
+        old_rect = self._item_rects.pop(item, None)
+        if self._shrinks(old_rect, None):
+            self._contents_dirty = True
+
+    def item_geometry_changed(self, item):
         """
-        Set the spatial unit entity.
-        :param spatial_unit: Entity corresponding to a spatial unit in a
-        profile's STR relationship.
-        :type spatial_unit: Entity
+        Updates the arrows connected to an item and the contents bounds
+        after the item has been moved, resized, shown or hidden.
+        :param item: Tenure item.
+        :type item: BaseTenureItem
         """
-        if spatial_unit is None:
+        self._update_item_rect(item)
+        self.update_item_arrows(item)
+
+    def _shrinks(self, old_rect, new_rect):
+        #True if the contents rect may shrink when an item's rect changes
+        # from old_rect to new_rect, which is None if the item is removed
+        # or hidden. This is only the case if the old rect was on the edge
+        # of the contents and the new rect does not reach as far.
+        if old_rect is None or self._contents_dirty:
+            return False
+
+        c = self._contents_rect
+        if new_rect is None:
+            return old_rect.left() <= c.left() or \
+                old_rect.top() <= c.top() or \
+                old_rect.right() >= c.right() or \
+                old_rect.bottom() >= c.bottom()
+
+        return old_rect.left() <= c.left() < new_rect.left() or \
+            old_rect.top() <= c.top() < new_rect.top() or \
+            old_rect.right() >= c.right() > new_rect.right() or \
+            old_rect.bottom() >= c.bottom() > new_rect.bottom()
+
+    def _update_item_rect(self, item):
+        #Updates the cached rect of the item and the contents rect
+        old_rect = self._item_rects.pop(item, None)
+        new_rect = None
+        if item.isVisible():
+            new_rect = item.sceneBoundingRect()
+            self._item_rects[item] = new_rect
+
+        if self._shrinks(old_rect, new_rect):
+            self._contents_dirty = True
+
+        if new_rect is None:
             return
 
-        self._sp_item.entity = spatial_unit
+        if not self._contents_dirty:
+            self._contents_rect = self._contents_rect.united(new_rect)
 
-        #Add arrow linking social tenure to spatial unit item
-        self.add_arrow(self._str_item, self._sp_item)
+        self._grow_scene_rect(new_rect)
+
+    def _grow_scene_rect(self, rect):
+        #Enlarges the scene rect, if auto_grow is True, to include the rect
+        # and a margin around it. The scene rect never shrinks so that the
+        # view does not jump while items are being moved.
+        if not self.auto_grow:
+            return
+
+        margin = self.SCENE_MARGIN
+        required = rect.adjusted(-margin, -margin, margin, margin)
+        scene_rect = self.sceneRect()
+
+        if scene_rect.contains(required):
+            return
+
+        step = self.SCENE_GROWTH_STEP
+        grown = QRectF(scene_rect)
+        if required.left() < grown.left():
+            grown.setLeft(required.left() - step)
+        if required.top() < grown.top():
+            grown.setTop(required.top() - step)
+        if required.right() > grown.right():
+            grown.setRight(required.right() + step)
+        if required.bottom() > grown.bottom():
+            grown.setBottom(required.bottom() + step)
+
+        self.setSceneRect(grown)
+
+    def contents_rect(self):
+        """
+        :return: Returns the union of the scene bounding rects of the
+        visible tenure items. It is maintained as items change and is only
+        recomputed, from the cached item rects rather than by scanning the
+        scene, if it may have shrunk.
+        :rtype: QRectF
+        """
+        if self._contents_dirty:
+            rect = QRectF()
+            for item_rect in self._item_rects.values():
+                rect = rect.united(item_rect)
+
+            self._contents_rect = rect
+            self._contents_dirty = False
+
+        return QRectF(self._contents_rect)
+
+    def update_item_arrows(self, item):
+        """
+        Updates the arrows connected to an item after it has been moved or
+        resized. If there is a router, the arrows whose routes ran through
+        or around the old or new rect of the item are rerouted as well.
+        :param item: Item that has been moved or resized.
+        :type item: BaseTenureItem
+        """
+        arrows = set(item.arrows)
+        if not self._router is None:
+            arrows.update(self._router.update_obstacle(item))
+
+        self.update_arrows(arrows)
 
     def add_arrow(self, start_item, end_item, **kwargs):
         """
@@ -1421,46 +3007,2168 @@ class ProfileTenureView(QGraphicsView):
         :param kwargs: Optional arrow arguments such as angle, base width
         etc. See arguments for the Arrow class.
         :type kwargs: dict
+        :return: Returns the arrow item.
+        :rtype: Arrow
         """
         arrow = Arrow(start_item, end_item, **kwargs)
+        arrow.hit_test_mode = self._arrow_hit_test_mode
         start_item.add_arrow(arrow)
         end_item.add_arrow(arrow)
         arrow.setZValue(100.0)
-        self.scene().addItem(arrow)
-        arrow.update_position()
+        self.addItem(arrow)
+        self.update_arrows([arrow])
 
-    def keyPressEvent(self, event):
+        return arrow
+
+    def remove_arrow(self, arrow):
         """
-        Capture delete key to remove selected annotation items.
-        :param event: Key event.
-        :type event: QKeyEvent
+        Removes an arrow from the scene and from its start and end items.
+        :param arrow: Arrow item.
+        :type arrow: Arrow
         """
-        if event.key() == Qt.Key_Delete:
-            self._delete_selected_annotation_items()
+        arrow.start_item.remove_arrow(arrow)
+        arrow.end_item.remove_arrow(arrow)
 
-        super(ProfileTenureView, self).keyPressEvent(event)
+        if not self._router is None:
+            self._router.remove_route(arrow)
 
-    def _delete_selected_annotation_items(self):
-        #Deletes selected annotation items in the scene
-        for item in self.scene().selectedItems():
+        if not self._deferred_arrows is None:
+            self._deferred_arrows.discard(arrow)
+
+        self.removeItem(arrow)
+
+    def editor_lost_focus(self, item):
+        """
+        Check if the annotation item is empty and delete if it is.
+        :param item: Annotation item.
+        :type item: QGraphicsTextItem
+        """
+        cursor = item.textCursor()
+        cursor.clearSelection()
+        item.setTextCursor(cursor)
+
+        if not item.toPlainText():
+            self.removeItem(item)
+            item.deleteLater()
+
+    def mousePressEvent(self, event):
+        """
+        Handles insert of annotation item.
+        :param event: Mouse press event.
+        :type event: QGraphicsSceneMouseEvent
+        """
+        if event.button() != Qt.LeftButton:
+            return
+
+        if self.mode == ProfileTenureScene.InsertMajorAnnotation:
+            sz = Annotation.Major
+            self._insert_annotation_item(sz, event.scenePos())
+        elif self.mode == ProfileTenureScene.InsertMinorAnnotation:
+            sz = Annotation.Minor
+            self._insert_annotation_item(sz, event.scenePos())
+
+        super(ProfileTenureScene, self).mousePressEvent(event)
+
+    def _insert_annotation_item(self, size, scene_pos):
+        #Insert major or minor annotation based on size
+        annotation = Annotation(size=size)
+        annotation.setTextInteractionFlags(Qt.TextEditorInteraction)
+        annotation.setZValue(1000.0)
+        annotation.lost_focus.connect(self.editor_lost_focus)
+        self.addItem(annotation)
+        annotation.setPos(scene_pos)
+        self.annotation_inserted.emit(annotation)
+
+
+class DiagramNode(object):
+    """
+    Widget-free representation of an item in the social tenure relationship
+    diagram.
+    """
+    Party, SpatialUnit, SocialTenure, SupportingDocument = range(4)
+
+    __slots__ = ('kind', 'entity', 'x', 'y', 'group')
+
+    def __init__(self, kind, entity=None, x=0.0, y=0.0, group=None):
+        """
+        Class constructor.
+        :param kind: Type of the node i.e. party, spatial unit, social
+        tenure or supporting document.
+        :type kind: int
+        :param entity: Entity rendered by the node.
+        :type entity: Entity
+        :param x: X position of the node in scene coordinates.
+        :type x: float
+        :param y: Y position of the node in scene coordinates.
+        :type y: float
+        :param group: Name of the party group that the node belongs to, in
+        which case the position is that of the group. None if the party is
+        rendered by its own item.
+        :type group: str
+        """
+        self.kind = kind
+        self.entity = entity
+        self.x = x
+        self.y = y
+        self.group = group
+
+    @property
+    def pos(self):
+        """
+        :return: Returns the position of the node as a tuple.
+        :rtype: tuple
+        """
+        return self.x, self.y
+
+
+class DiagramEdge(object):
+    """
+    Widget-free representation of an arrow linking two nodes.
+    """
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        """
+        Class constructor.
+        :param start: Start node.
+        :type start: DiagramNode
+        :param end: End node.
+        :type end: DiagramNode
+        """
+        self.start = start
+        self.end = end
+
+
+class DiagramAnnotation(object):
+    """
+    Widget-free representation of an annotation item.
+    """
+    __slots__ = ('text', 'size', 'x', 'y')
+
+    def __init__(self, text, size=0, x=0.0, y=0.0):
+        """
+        Class constructor.
+        :param text: Annotation text.
+        :type text: str
+        :param size: Annotation.Minor or Annotation.Major.
+        :type size: int
+        :param x: X position of the annotation in scene coordinates.
+        :type x: float
+        :param y: Y position of the annotation in scene coordinates.
+        :type y: float
+        """
+        self.text = text
+        self.size = size
+        self.x = x
+        self.y = y
+
+
+class ProfileTenureModel(object):
+    """
+    Lightweight model of a profile's social tenure relationship diagram
+    comprising of nodes, edges, positions and annotations. It does not
+    require any Qt widgets hence it can be created and modified cheaply in
+    batch or headless workloads, and views are only generated from it on
+    demand.
+    """
+    #Default positions of the nodes in scene coordinates
+    PARTY_POS = (200.0, 20.0)
+    SOCIAL_TENURE_POS = (400.0, 20.0)
+    SPATIAL_UNIT_POS = (600.0, 20.0)
+    SUPPORTING_DOC_POS = (400.0, 220.0)
+
+    __slots__ = (
+        'profile',
+        'parties',
+        'spatial_unit',
+        'social_tenure',
+        'supporting_document',
+        'edges',
+        'annotations'
+    )
+
+    def __init__(self, profile=None):
+        """
+        Class constructor.
+        :param profile: Profile object whose STR is being modelled.
+        :type profile: Profile
+        """
+        self.profile = profile
+
+        #Party nodes keyed by the entity's short name
+        self.parties = OrderedDict()
+
+        self.social_tenure = DiagramNode(
+            DiagramNode.SocialTenure,
+            None,
+            *ProfileTenureModel.SOCIAL_TENURE_POS
+        )
+        self.spatial_unit = DiagramNode(
+            DiagramNode.SpatialUnit,
+            None,
+            *ProfileTenureModel.SPATIAL_UNIT_POS
+        )
+        self.supporting_document = DiagramNode(
+            DiagramNode.SupportingDocument,
+            None,
+            *ProfileTenureModel.SUPPORTING_DOC_POS
+        )
+        self.edges = [
+            DiagramEdge(self.supporting_document, self.social_tenure)
+        ]
+        self.annotations = []
+
+        if not profile is None:
+            str_ent = profile.social_tenure
+            self.social_tenure.entity = str_ent
+            self.supporting_document.entity = str_ent
+            self.set_spatial_unit(str_ent.spatial_unit)
+
+    def nodes(self):
+        """
+        :return: Returns all the nodes in the model.
+        :rtype: list
+        """
+        nodes = list(self.parties.values())
+        nodes.extend([
+            self.social_tenure,
+            self.spatial_unit,
+            self.supporting_document
+        ])
+
+        return nodes
+
+    def add_party(self, party, x=None, y=None, group=None):
+        """
+        Adds a party node to the model. An existing node with the same name
+        is replaced.
+        :param party: Party entity.
+        :type party: Entity
+        :param x: X position of the node. Defaults to PARTY_POS.
+        :type x: float
+        :param y: Y position of the node. Defaults to PARTY_POS.
+        :type y: float
+        :param group: Name of the party group that the party belongs to.
+        :type group: str
+        :return: Returns the party node.
+        :rtype: DiagramNode
+        """
+        self.remove_party(party.short_name)
+
+        def_x, def_y = ProfileTenureModel.PARTY_POS
+        node = DiagramNode(
+            DiagramNode.Party,
+            party,
+            def_x if x is None else x,
+            def_y if y is None else y,
+            group
+        )
+        self.parties[party.short_name] = node
+        self.add_edge(node, self.social_tenure)
+
+        return node
+
+    def remove_party(self, name):
+        """
+        Removes the party node with the given name and its edges.
+        :param name: Party name.
+        :type name: str
+        :return: Returns True if the node was removed, otherwise False.
+        :rtype: bool
+        """
+        node = self.parties.pop(name, None)
+        if node is None:
+            return False
+
+        self.edges = [
+            e for e in self.edges if not e.start is node and not e.end is node
+        ]
+
+        return True
+
+    def set_spatial_unit(self, spatial_unit):
+        """
+        Sets the spatial unit entity and links it to the social tenure node.
+        :param spatial_unit: Spatial unit entity.
+        :type spatial_unit: Entity
+        """
+        if spatial_unit is None:
+            return
+
+        self.spatial_unit.entity = spatial_unit
+        self.add_edge(self.social_tenure, self.spatial_unit)
+
+    def add_edge(self, start, end):
+        """
+        Adds an edge between two nodes if it does not exist.
+        :param start: Start node.
+        :type start: DiagramNode
+        :param end: End node.
+        :type end: DiagramNode
+        :return: Returns the edge object.
+        :rtype: DiagramEdge
+        """
+        for e in self.edges:
+            if e.start is start and e.end is end:
+                return e
+
+        edge = DiagramEdge(start, end)
+        self.edges.append(edge)
+
+        return edge
+
+    def add_annotation(self, text, size=0, x=0.0, y=0.0):
+        """
+        Adds an annotation to the model.
+        :param text: Annotation text.
+        :type text: str
+        :param size: Annotation.Minor or Annotation.Major.
+        :type size: int
+        :param x: X position of the annotation.
+        :type x: float
+        :param y: Y position of the annotation.
+        :type y: float
+        :return: Returns the annotation object.
+        :rtype: DiagramAnnotation
+        """
+        annotation = DiagramAnnotation(text, size, x, y)
+        self.annotations.append(annotation)
+
+        return annotation
+
+    def create_view(self, parent=None):
+        """
+        Creates a view that renders the model.
+        :param parent: Parent widget.
+        :type parent: QWidget
+        :return: Returns the view object.
+        :rtype: ProfileTenureView
+        """
+        view = ProfileTenureView(parent)
+        view.load_model(self)
+
+        return view
+
+
+def _replace_file(src, dst):
+    #Moves src to dst, replacing dst if it exists
+    replace = getattr(os, 'replace', None)
+    if not replace is None:
+        replace(src, dst)
+
+        return
+
+    #os.rename does not replace existing files on Windows
+    if sys.platform.startswith('win') and os.path.exists(dst):
+        os.remove(dst)
+
+    os.rename(src, dst)
+
+
+class DiagramStateStore(object):
+    """
+    Saves and loads the state of a diagram i.e. item positions, party
+    entities, arrows and annotations. The state is stored as a journal of
+    JSON lines; the first line is a versioned header followed by a full
+    snapshot of the state, and each subsequent save appends only the
+    differences since the previous save. The journal is compacted into a
+    single snapshot once the number of deltas exceeds max_deltas.
+    Loading only restores the layout onto the entities of the view, or of
+    its profile, with the same names. Entities that cannot be found are
+    recreated from the saved names and columns.
+    """
+    FORMAT = 'profile-tenure-view'
+    VERSION = 1
+
+    FIXED_NODES = ('spatial_unit', 'social_tenure', 'supporting_document')
+
+    def __init__(self, path, max_deltas=100):
+        """
+        Class constructor.
+        :param path: Path of the state file.
+        :type path: str
+        :param max_deltas: Maximum number of deltas in the journal before it
+        is compacted.
+        :type max_deltas: int
+        """
+        self.path = path
+        self.max_deltas = max_deltas
+        self._saved = None
+        self._num_deltas = 0
+
+    @staticmethod
+    def _node_state(node):
+        #Serializable state of a model node
+        entity = node.entity
+        state = {'x': node.x, 'y': node.y}
+
+        if node.kind == DiagramNode.Party or \
+                node.kind == DiagramNode.SpatialUnit:
+            if not entity is None:
+                state['name'] = entity.short_name
+                state['items'] = list(entity.columns.keys())
+
+            if not node.group is None:
+                state['group'] = node.group
+
+        elif node.kind == DiagramNode.SocialTenure:
+            if not entity is None:
+                value_list = entity.tenure_type_lookup.value_list
+                state['items'] = lookup_cache.lookups(value_list)
+
+        elif node.kind == DiagramNode.SupportingDocument:
+            if not entity is None:
+                value_list = entity.supporting_doc.doc_type.value_list
+                state['items'] = lookup_cache.lookups(value_list)
+
+        return state
+
+    @staticmethod
+    def _node_key(node):
+        #Unique key of a model node
+        keys = {
+            DiagramNode.SpatialUnit: 'spatial_unit',
+            DiagramNode.SocialTenure: 'social_tenure',
+            DiagramNode.SupportingDocument: 'supporting_document'
+        }
+        if node.kind == DiagramNode.Party:
+            return u'party:{0}'.format(node.entity.short_name)
+
+        return keys[node.kind]
+
+    def state(self, model):
+        """
+        :param model: Diagram model.
+        :type model: ProfileTenureModel
+        :return: Returns the serializable state of the model.
+        :rtype: dict
+        """
+        nodes = OrderedDict()
+        for node in model.nodes():
+            nodes[self._node_key(node)] = self._node_state(node)
+
+        edges = [
+            [self._node_key(e.start), self._node_key(e.end)]
+            for e in model.edges
+        ]
+        annotations = [
+            [a.text, a.size, a.x, a.y] for a in model.annotations
+        ]
+
+        profile = model.profile
+
+        return {
+            'profile': getattr(profile, 'name', u''),
+            'nodes': nodes,
+            'edges': edges,
+            'annotations': annotations
+        }
+
+    def _delta(self, state):
+        #Differences between the last saved state and the given state
+        delta = {}
+        prev_nodes = self._saved['nodes']
+        nodes = state['nodes']
+
+        changed = OrderedDict(
+            (k, v) for k, v in nodes.items() if prev_nodes.get(k) != v
+        )
+        removed = [k for k in prev_nodes if not k in nodes]
+
+        if len(changed) > 0:
+            delta['nodes'] = changed
+        if len(removed) > 0:
+            delta['removed'] = removed
+        if state['edges'] != self._saved['edges']:
+            delta['edges'] = state['edges']
+        if state['annotations'] != self._saved['annotations']:
+            delta['annotations'] = state['annotations']
+        if state['profile'] != self._saved.get('profile'):
+            delta['profile'] = state['profile']
+
+        return delta
+
+    def _write_snapshot(self, state):
+        #Rewrites the journal with a single snapshot
+        header = {
+            'format': DiagramStateStore.FORMAT,
+            'version': DiagramStateStore.VERSION
+        }
+        #Written to a temporary file first so that the existing journal is
+        # not lost if writing fails
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.diagram',
+            dir=os.path.dirname(os.path.abspath(self.path))
+        )
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(header) + '\n')
+                f.write(json.dumps({'snapshot': state}) + '\n')
+
+            _replace_file(tmp_path, self.path)
+
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            raise
+
+        self._num_deltas = 0
+
+    def save(self, view):
+        """
+        Saves the state of the view. Only the changes since the previous
+        save are written if the file has been saved or loaded before using
+        this object.
+        :param view: Profile tenure view.
+        :type view: ProfileTenureView
+        :return: Returns True if the operation succeeded, otherwise False. If
+        False then a corresponding message is returned as well.
+        :rtype: (bool, str)
+        """
+        #Normalize to JSON types so that states can be compared
+        state = json.loads(
+            json.dumps(self.state(view.to_model())),
+            object_pairs_hook=OrderedDict
+        )
+
+        try:
+            if self._saved is None or not os.path.isfile(self.path) or \
+                    self._num_deltas >= self.max_deltas:
+                self._write_snapshot(state)
+
+            else:
+                delta = self._delta(state)
+                if len(delta) > 0:
+                    with open(self.path, 'a') as f:
+                        f.write(json.dumps({'delta': delta}) + '\n')
+                    self._num_deltas += 1
+
+        except (IOError, OSError):
+            msg = QApplication.translate(
+                'DiagramStateStore',
+                'The diagram state cannot be saved in the specified location.'
+            )
+
+            return False, msg
+
+        self._saved = state
+
+        return True, ''
+
+    def _read_state(self):
+        #Applies the deltas in the journal to the snapshot
+        with open(self.path, 'r') as f:
+            header = json.loads(f.readline())
+            if header.get('format') != DiagramStateStore.FORMAT or \
+                    header.get('version', 0) > DiagramStateStore.VERSION:
+                return None, 0
+
+            state = None
+            num_deltas = 0
+
+            for line in f:
+                if not line.strip():
+                    continue
+
+                record = json.loads(line, object_pairs_hook=OrderedDict)
+                if 'snapshot' in record:
+                    state = record['snapshot']
+                    num_deltas = 0
+
+                elif 'delta' in record and not state is None:
+                    delta = record['delta']
+                    for key in delta.get('removed', []):
+                        state['nodes'].pop(key, None)
+                    state['nodes'].update(delta.get('nodes', {}))
+                    if 'edges' in delta:
+                        state['edges'] = delta['edges']
+                    if 'annotations' in delta:
+                        state['annotations'] = delta['annotations']
+                    if 'profile' in delta:
+                        state['profile'] = delta['profile']
+                    num_deltas += 1
+
+        return state, num_deltas
+
+    @staticmethod
+    def _valid_state(state):
+        #Checks the structure of a state read from the journal
+        def is_text(value):
+            return isinstance(value, basestring)
+
+        def is_number(value):
+            return isinstance(value, numbers.Real)
+
+        if not isinstance(state, dict) or \
+                not isinstance(state.get('nodes'), dict) or \
+                not isinstance(state.get('edges'), list) or \
+                not isinstance(state.get('annotations'), list):
+            return False
+
+        for key, node_state in state['nodes'].items():
+            if not isinstance(node_state, dict) or \
+                    not is_number(node_state.get('x')) or \
+                    not is_number(node_state.get('y')):
+                return False
+
+            if key.startswith('party:'):
+                if not is_text(node_state.get('name')) or \
+                        not is_text(node_state.get('group', u'')):
+                    return False
+
+            elif not key in DiagramStateStore.FIXED_NODES:
+                return False
+
+            items = node_state.get('items', [])
+            if not isinstance(items, list) or \
+                    not all(is_text(i) for i in items):
+                return False
+
+        for edge in state['edges']:
+            if not isinstance(edge, list) or len(edge) != 2 or \
+                    not all(is_text(k) for k in edge):
+                return False
+
+        for anno in state['annotations']:
+            if not isinstance(anno, list) or len(anno) != 4 or \
+                    not is_text(anno[0]) or \
+                    not all(is_number(v) for v in anno[1:]):
+                return False
+
+        return True
+
+    @staticmethod
+    def _view_entities(view):
+        #Entities of the view and its profile keyed by their short names
+        entities = {}
+        profile = view.profile
+
+        if not profile is None:
+            for entity in getattr(profile, 'entities', {}).values():
+                entities[entity.short_name] = entity
+
+            str_ent = profile.social_tenure
+            if not str_ent is None:
+                parties = getattr(str_ent, 'parties', None)
+                if parties is None:
+                    parties = [getattr(str_ent, 'party', None)]
+                for entity in list(parties) + [str_ent.spatial_unit]:
+                    if not entity is None:
+                        entities[entity.short_name] = entity
+
+        view_entities = view.party_entities() + [view.spatial_unit()]
+        for entity in view_entities:
+            if not entity is None:
+                entities[entity.short_name] = entity
+
+        return entities
+
+    def _model(self, state, view):
+        #Creates a model of the saved layout using the entities of the view
+        model = ProfileTenureModel()
+        model.profile = view.profile
+        nodes = {}
+        node_states = state['nodes']
+        entities = self._view_entities(view)
+
+        def entity(node_state):
+            name = node_state['name']
+            if name in entities:
+                return entities[name]
+
+            #Recreated from the state if it is not in the view or profile
+            ent = Entity(name)
+            for col in node_state.get('items', []):
+                ent.columns[col] = None
+
+            return ent
+
+        str_ent = view._str_item.entity
+        if str_ent is None and not model.profile is None:
+            str_ent = model.profile.social_tenure
+
+        if str_ent is None:
+            def value_list(key):
+                items = node_states.get(key, {}).get('items', [])
+                return ValueList(key, items)
+
+            str_ent = SocialTenure(
+                [],
+                None,
+                LookupColumn('tenure_type', value_list('social_tenure')),
+                SupportingDocument(
+                    LookupColumn(
+                        'document_type',
+                        value_list('supporting_document')
+                    )
+                )
+            )
+
+        for key, node_state in node_states.items():
+            x, y = node_state['x'], node_state['y']
+
+            if key.startswith('party:'):
+                node = model.add_party(
+                    entity(node_state), x, y, node_state.get('group')
+                )
+
+            else:
+                node = getattr(model, key)
+                node.x, node.y = x, y
+
+                if key == 'spatial_unit' and 'name' in node_state:
+                    node.entity = entity(node_state)
+
+                elif key != 'spatial_unit' and 'items' in node_state:
+                    node.entity = str_ent
+
+            nodes[key] = node
+
+        model.edges = []
+        for start, end in state['edges']:
+            if start in nodes and end in nodes:
+                model.add_edge(nodes[start], nodes[end])
+
+        for text, size, x, y in state['annotations']:
+            model.add_annotation(text, size, x, y)
+
+        return model
+
+    def load(self, view):
+        """
+        Loads the diagram state into the view. Subsequent saves using this
+        object will only write the changes made after loading.
+        :param view: Profile tenure view.
+        :type view: ProfileTenureView
+        :return: Returns True if the operation succeeded, otherwise False. If
+        False then a corresponding message is returned as well.
+        :rtype: (bool, str)
+        """
+        try:
+            state, num_deltas = self._read_state()
+        except (IOError, OSError, ValueError, TypeError, AttributeError,
+                KeyError):
+            state = None
+
+        if state is None or not self._valid_state(state):
+            msg = QApplication.translate(
+                'DiagramStateStore',
+                'The diagram state file is invalid or is not supported.'
+            )
+
+            return False, msg
+
+        view.load_model(self._model(state, view))
+
+        self._saved = state
+        self._num_deltas = num_deltas
+
+        return True, ''
+
+
+class RenderCache(object):
+    """
+    Content-addressed on-disk cache of rendered profile tenure views. Each
+    image file is named using the digest of the scene content that it was
+    rendered from, and the least recently used files are evicted once the
+    total size of the cache exceeds the size limit. The order in which files
+    are used is tracked in memory since the mtime resolution of some file
+    systems is too coarse to order them; files that have not been used by
+    this object, such as those cached by an earlier session, are ordered by
+    their mtime and evicted first.
+    """
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        """
+        Class constructor.
+        :param directory: Directory where the cached images will be stored.
+        It will be created if it does not exist.
+        :type directory: str
+        :param max_size: Maximum size (in bytes) of all files in the cache.
+        Defaults to 64MB.
+        :type max_size: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+        #Paths of the files used by this object from the least to the most
+        # recently used
+        self._access_order = OrderedDict()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def path(self, key, image_format):
+        """
+        :param key: Digest of the scene content.
+        :type key: str
+        :param image_format: Image format e.g. PNG, JPG.
+        :type image_format: str
+        :return: Returns the absolute path of the cache file corresponding
+        to the given key and image format.
+        :rtype: str
+        """
+        file_name = u'{0}.{1}'.format(key, image_format.lower())
+
+        return os.path.join(self.directory, file_name)
+
+    def lookup(self, key, image_format):
+        """
+        Searches the cache for an image rendered from the given key. A
+        successful lookup marks the file as the most recently used.
+        :param key: Digest of the scene content.
+        :type key: str
+        :param image_format: Image format e.g. PNG, JPG.
+        :type image_format: str
+        :return: Returns the path to the cached image file or None if there
+        is no corresponding file in the cache.
+        :rtype: str
+        """
+        path = self.path(key, image_format)
+
+        if not os.path.isfile(path):
+            return None
+
+        #The mtime orders the files across sessions, access time is not
+        # reliable on all file systems
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        self._touch(path)
+
+        return path
+
+    def _touch(self, path):
+        #Marks the file as the most recently used
+        self._access_order.pop(path, None)
+        self._access_order[path] = None
+
+    def store_image(self, key, image_format, image):
+        """
+        Saves the image in the cache.
+        :param key: Digest of the scene content.
+        :type key: str
+        :param image_format: Image format e.g. PNG, JPG.
+        :type image_format: str
+        :param image: Rendered image.
+        :type image: QImage
+        :return: Returns the path of the cached image or None if the image
+        could not be saved.
+        :rtype: str
+        """
+        path = self.path(key, image_format)
+
+        if not image.save(path, image_format):
+            return None
+
+        self._touch(path)
+        self._evict(path)
+
+        return path
+
+    def store_file(self, key, image_format, source_path):
+        """
+        Copies an existing image file into the cache.
+        :param key: Digest of the scene content.
+        :type key: str
+        :param image_format: Image format e.g. PNG, JPG.
+        :type image_format: str
+        :param source_path: Path of the image file to be cached.
+        :type source_path: str
+        :return: Returns the path of the cached image or None if the file
+        could not be copied.
+        :rtype: str
+        """
+        path = self.path(key, image_format)
+
+        try:
+            shutil.copyfile(source_path, path)
+        except (IOError, OSError):
+            return None
+
+        self._touch(path)
+        self._evict(path)
+
+        return path
+
+    def _cache_files(self):
+        #Returns a list of (mtime, size, path) for files in the cache
+        files = []
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            files.append((st.st_mtime, st.st_size, path))
+
+        return files
+
+    def size(self):
+        """
+        :return: Returns the total size, in bytes, of the files in the cache.
+        :rtype: int
+        """
+        return sum(f[1] for f in self._cache_files())
+
+    def clear(self):
+        """
+        Removes all the files in the cache.
+        """
+        for f in self._cache_files():
+            try:
+                os.remove(f[2])
+            except OSError:
+                pass
+
+        self._access_order.clear()
+
+    def _evict(self, keep_path=None):
+        #Removes the least recently used files until the cache is within
+        # the size limit. The file in keep_path is never evicted.
+        rank = dict(
+            (path, i) for i, path in enumerate(self._access_order)
+        )
+        files = sorted(
+            self._cache_files(),
+            key=lambda f: (f[2] in rank, rank.get(f[2], 0), f[0])
+        )
+        total = sum(f[1] for f in files)
+
+        for mtime, size, path in files:
+            if total <= self.max_size:
+                break
+
+            if path == keep_path:
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            self._access_order.pop(path, None)
+            total -= size
+
+
+class ThumbnailCache(object):
+    """
+    In-memory cache of thumbnail pyramids. Each entry maps the digest of the
+    scene content to the thumbnails rendered from it, keyed by size. The
+    least recently used entries are discarded once the maximum number of
+    entries is exceeded.
+    """
+    def __init__(self, max_entries=256):
+        """
+        Class constructor.
+        :param max_entries: Maximum number of pyramids held in the cache.
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, size):
+        """
+        :param key: Digest of the scene content.
+        :type key: str
+        :param size: Size, in pixels, of the longest side of the thumbnail.
+        :type size: int
+        :return: Returns the cached thumbnail or None if not found.
+        :rtype: QImage
+        """
+        levels = self._entries.get(key, None)
+        if levels is None:
+            return None
+
+        #Mark as most recently used
+        del self._entries[key]
+        self._entries[key] = levels
+
+        return levels.get(size, None)
+
+    def put(self, key, levels):
+        """
+        Adds thumbnails to the cache.
+        :param key: Digest of the scene content.
+        :type key: str
+        :param levels: Thumbnails keyed by the size of the longest side.
+        :type levels: dict
+        """
+        existing = self._entries.pop(key, {})
+        existing.update(levels)
+        self._entries[key] = existing
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all thumbnails from the cache.
+        """
+        self._entries.clear()
+
+
+class ProfileTenureView(QGraphicsView):
+    """
+    A widget for rendering a profile's social tenure relationship. It also
+    includes functionality for saving the view as an image.
+    """
+    MIN_DPI = 72
+    MAX_DPI = 600
+
+    #Default levels of the thumbnail pyramid
+    THUMBNAIL_SIZES = (64, 256, 1024)
+
+    #Thumbnail cache shared by all views
+    thumbnail_cache = ThumbnailCache()
+
+    #Pool of party items shared by all views
+    item_pool = EntityItemPool()
+
+    #Maximum size, in bytes, of each band rendered by save_mapped_image
+    MAPPED_BAND_BYTES = 64 * 1024 * 1024
+
+    #Time, in milliseconds, without interaction after which full quality
+    # rendering is restored
+    DRAFT_IDLE_INTERVAL = 250
+
+    #Only the areas of the changed items are repainted, or their bounding
+    # rect if there are many of them
+    VIEWPORT_UPDATE_MODE = QGraphicsView.SmartViewportUpdate
+
+    #The items set the pen, brush and font they use before drawing and
+    # their bounding rects include the width of their outlines, hence the
+    # view does not need to save the painter state or enlarge the exposed
+    # area of each item.
+    OPTIMIZATION_FLAGS = QGraphicsView.DontSavePainterState | \
+        QGraphicsView.DontAdjustForAntialiasing
+
+    #Limits of the zoom factor
+    MIN_ZOOM = 0.1
+    MAX_ZOOM = 8.0
+
+    #Zoom factor applied for each step of the mouse wheel
+    WHEEL_ZOOM_STEP = 1.15
+
+    #Time, in milliseconds, allowed for each frame of an animated zoom
+    ZOOM_FRAME_BUDGET = 16
+
+    #Signal raised with the zoom factor once an animated zoom has settled
+    zoom_changed = pyqtSignal(float)
+
+    #Signal raised when the scene area shown by the view is rescaled or
+    # resized, including each step of an animated zoom. Scrolling is
+    # reported by the scroll bars.
+    visible_area_changed = pyqtSignal()
+
+    def __init__(self, parent=None, profile=None, scene=None):
+        """
+        Class constructor.
+        :param parent: Parent widget.
+        :type parent: QWidget
+        :param profile: Profile object to be rendered.
+        :type profile: Profile
+        :param scene: Existing scene to attach the view to, so that several
+        views can render the same items while keeping their own zoom. The
+        scene should not be owned by another view that might be destroyed
+        before this one. A new scene is created if not specified.
+        :type scene: ProfileTenureScene
+        """
+        super(ProfileTenureView, self).__init__(parent)
+
+        if scene is None:
+            scene = ProfileTenureScene(self)
+
+        #Optional on-disk cache for rendered images
+        self._render_cache = None
+
+        #Draft rendering while the user drags, zooms or scrolls
+        self.draft_while_interacting = False
+        self._draft = False
+        self._draft_timer = QTimer(self)
+        self._draft_timer.setSingleShot(True)
+        self._draft_timer.setInterval(self.DRAFT_IDLE_INTERVAL)
+        self._draft_timer.timeout.connect(self._end_draft)
+
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setRenderHint(QPainter.TextAntialiasing)
+        self.setResizeAnchor(QGraphicsView.AnchorViewCenter)
+
+        self.set_update_strategy()
+        self.setCacheMode(QGraphicsView.CacheBackground)
+
+        #Number of nested begin_update calls
+        self._update_depth = 0
+
+        #Animated zoom, see zoom_to
+        self._zoom_target = 1.0
+        self._zoom_fraction = 0.35
+        self._zoom_frame_time = 0.0
+        self._zoom_anchor = None
+        self._zoom_center = None
+        self._pinch_zoom = 1.0
+        self._item_caching = False
+        self._zoom_timer = QTimer(self)
+        self._zoom_timer.setInterval(self.ZOOM_FRAME_BUDGET)
+        self._zoom_timer.timeout.connect(self._zoom_frame)
+        self.viewport().grabGesture(Qt.PinchGesture)
+
+        self.setScene(scene)
+
+        #Items are owned by the scene
+        self._default_party_item = scene.default_party_item
+        self._party_items = scene.party_items
+        self._party_groups = scene.party_groups
+        self._sp_item = scene.sp_item
+        self._str_item = scene.str_item
+        self._supporting_doc_item = scene.supporting_doc_item
+
+        #Maximum number of party items, further parties are collapsed into
+        # a group. There is no limit if None.
+        self.max_party_items = None
+
+        #Do not reset the profile of a shared scene
+        if not profile is None:
+            self.profile = profile
+
+        #Connect signals
+        scene.annotation_inserted.connect(self.annotation_inserted)
+
+        #Ensure vertical scroll is at the top
+        self.centerOn(490.0, 20.0)
+
+        #Enabled after the initial scroll so that it is rendered in full
+        # quality
+        self.draft_while_interacting = True
+
+    def annotation_inserted(self, item):
+        """
+        Slot raised when an annotation item has been inserted.
+        :param item: Annotation item.
+        :type item: Annotation
+        """
+        self.scene().mode = ProfileTenureScene.MoveItem
+
+    @property
+    def profile(self):
+        """
+        :return: The profile object being rendered.
+        :rtype: Profile
+        """
+        return self.scene().profile
+
+    @property
+    def render_cache(self):
+        """
+        :return: Returns the cache used for storing rendered images or None
+        if images are always rendered from the scene.
+        :rtype: RenderCache
+        """
+        return self._render_cache
+
+    @render_cache.setter
+    def render_cache(self, cache):
+        """
+        Sets the cache for storing rendered images. Unchanged views will be
+        served from the cache instead of rendering the scene.
+        :param cache: Render cache object or None to disable caching.
+        :type cache: RenderCache
+        """
+        self._render_cache = cache
+
+    def _update_profile(self):
+        #Update profile objects and render
+        profile = self.scene().profile
+        if profile is None:
+            return
+
+        str_ent = profile.social_tenure
+        # Set renderer entities
+        self._sp_item.entity = str_ent.spatial_unit
+        self._str_item.entity = str_ent
+        self._supporting_doc_item.entity = str_ent
+
+    @profile.setter
+    def profile(self, profile):
+        """
+        Sets the profile object whose STR view is to rendered.
+        :param profile: Profile object to be rendered.
+        :type profile: Profile
+        """
+        self.scene().profile = profile
+
+        self._update_profile()
+
+    def clear_profile(self):
+        """
+        Removes the profile from the view and resets the items rendering
+        its social tenure relationship, document types and spatial unit.
+        The party items are not changed.
+        """
+        self.scene().profile = None
+
+        self._str_item.invalidate()
+        self._supporting_doc_item.invalidate()
+        self.invalidate_spatial_unit()
+
+    def spatial_unit(self):
+        """
+        :return: Returns the spatial unit entity rendered by the view or None
+        if it has not been set.
+        :rtype: Entity
+        """
+        return self._sp_item.entity
+
+    def add_party_entity(self, party):
+        """
+        Adds a party entity to the view. If there is a existing one with the
+        same name then it will be removed before adding this party. If the
+        view already has max_party_items party items then the party is
+        added to the default party group instead.
+        :param party: Party entity.
+        :type party: Entity
+        """
+        if self.has_party(party.short_name):
+            self.remove_party(party.short_name)
+
+        if not self.max_party_items is None and \
+                len(self._party_items) >= self.max_party_items:
+            default_group = QApplication.translate(
+                'ProfileTenureView',
+                'Other parties'
+            )
+            self.add_party_group(default_group, [party])
+
+            return
+
+        self._add_party_item(party)
+        self._update_default_party_item()
+
+    def _add_party_item(self, party, pos=None):
+        #Creates, or reuses a pooled, item for the party and links it to the
+        # social tenure item.
+        p_item = self.item_pool.acquire()
+        p_item.entity = party
+        self.scene().addItem(p_item)
+
+        if not pos is None:
+            p_item.setPos(pos)
+        elif len(self._party_items) == 0:
+            p_item.setPos(*ProfileTenureModel.PARTY_POS)
+        else:
+            self.auto_position(p_item)
+
+        #Add to collection
+        self._party_items[party.short_name] = p_item
+
+        #Add connection arrow to social tenure item
+        self.add_arrow(p_item, self._str_item)
+
+        return p_item
+
+    def _remove_item(self, item):
+        #Removes a party or party group item and its arrows from the scene.
+        # The item stops observing its entity so that it can be released.
+        item._observe(None)
+        item.remove_arrows()
+        self.scene().removeItem(item)
+
+    def _update_default_party_item(self):
+        #The placeholder is only shown if there are no parties
+        self._default_party_item.setVisible(
+            len(self._party_items) == 0 and len(self._party_groups) == 0
+        )
+
+    def auto_position(self, item):
+        """
+        Automatically positions the party item to prevent it from overlapping
+        the others.
+        :param item: Party entity item.
+        :type item: EntityItem
+        """
+        pass
+
+    def has_party(self, name):
+        """
+        :param name: Party name.
+        :type name: str
+        :return: Returns True if there is a party with the given name in the
+        view, either as an item or as a member of a party group.
+        :rtype: bool
+        """
+        return name in self._party_items or \
+            not self.party_group_of(name) is None
+
+    def _discard_party(self, name):
+        #Removes the party item, or the party from its group. Groups left
+        # without members are removed.
+        p_item = self._party_items.pop(name, None)
+        if not p_item is None:
+            self._remove_item(p_item)
+            self.item_pool.release(p_item)
+
+            return True
+
+        group = self.party_group_of(name)
+        if group is None:
+            return False
+
+        group.remove_member(name)
+        if len(group.members()) == 0:
+            del self._party_groups[group.name]
+            self._remove_item(group)
+
+        return True
+
+    def remove_party(self, name):
+        """
+        Removes the party with the specified name from the collection.
+        :param name: Party name
+        :return: Returns True if the operation succeeded, otherwise False if
+        the party with the specified name does not exist in the collection.
+        :rtype: bool
+        """
+        if not self._discard_party(name):
+            return False
+
+        #Show default party item
+        self._update_default_party_item()
+
+        return True
+
+    def party_groups(self):
+        """
+        :return: Returns the party group items in the view.
+        :rtype: list
+        """
+        return list(self._party_groups.values())
+
+    def party_group_of(self, name):
+        """
+        :param name: Party name.
+        :type name: str
+        :return: Returns the group containing the party with the given name
+        or None if the party is not in a group.
+        :rtype: PartyGroupItem
+        """
+        for group in self._party_groups.values():
+            if group.has_member(name):
+                return group
+
+        return None
+
+    def add_party_group(self, name, parties):
+        """
+        Adds party entities to the view collapsed into a single group item
+        that is linked to the social tenure item by one arrow. No items are
+        created for the parties themselves. Existing parties with the same
+        names are removed first.
+        :param name: Name of the group, the parties are added to an
+        existing group with the same name.
+        :type name: str
+        :param parties: Party entities.
+        :type parties: list
+        :return: Returns the group item.
+        :rtype: PartyGroupItem
+        """
+        for party in parties:
+            self._discard_party(party.short_name)
+
+        group = self._party_groups.get(name, None)
+        if group is None:
+            group = PartyGroupItem(name)
+            self.scene().addItem(group)
+
+            if len(self._party_items) == 0 and len(self._party_groups) == 0:
+                group.setPos(*ProfileTenureModel.PARTY_POS)
+            else:
+                self.auto_position(group)
+
+            self._party_groups[name] = group
+            self.add_arrow(group, self._str_item)
+
+        group.add_members(parties)
+        self._update_default_party_item()
+
+        return group
+
+    def collapse_parties(self, name, party_names=None):
+        """
+        Collapses existing party items into a group item.
+        :param name: Name of the group.
+        :type name: str
+        :param party_names: Names of the parties to collapse. All party
+        items are collapsed if not specified.
+        :type party_names: list
+        :return: Returns the group item or None if there were no party items
+        to collapse.
+        :rtype: PartyGroupItem
+        """
+        if party_names is None:
+            party_names = list(self._party_items.keys())
+
+        p_items = [
+            self._party_items[n] for n in party_names
+            if n in self._party_items
+        ]
+        if len(p_items) == 0:
+            return None
+
+        #The group takes the place of the first item if it is new
+        pos = p_items[0].pos()
+        is_new = not name in self._party_groups
+
+        group = self.add_party_group(name, [i.entity for i in p_items])
+        if is_new:
+            group.setPos(pos)
+
+        return group
+
+    def expand_party_group(self, name, columns=5, spacing=20.0):
+        """
+        Replaces a group item with individual items for each of its
+        parties. The items are laid out in a grid starting at the position
+        of the group.
+        :param name: Name of the group.
+        :type name: str
+        :param columns: Number of items in each row of the grid.
+        :type columns: int
+        :param spacing: Space, in pixels, between the items.
+        :type spacing: float
+        :return: Returns True if the group was expanded, otherwise False if
+        there is no group with the given name.
+        :rtype: bool
+        """
+        group = self._party_groups.pop(name, None)
+        if group is None:
+            return False
+
+        pos = group.pos()
+        step = group.width + spacing
+        self._remove_item(group)
+
+        self.begin_update()
+
+        try:
+            for i, party in enumerate(group.members()):
+                row, col = divmod(i, columns)
+                self._add_party_item(
+                    party,
+                    QPointF(pos.x() + col * step, pos.y() + row * step)
+                )
+
+        finally:
+            self.end_update()
+
+        self._update_default_party_item()
+
+        return True
+
+    def invalidate_spatial_unit(self):
+        """
+        Clears the spatial unit entity.
+        """
+        self._sp_item.invalidate()
+        self._sp_item.remove_arrows()
+
+    def set_spatial_unit(self, spatial_unit):
+        """
+        Set the spatial unit entity.
+        :param spatial_unit: Entity corresponding to a spatial unit in a
+        profile's STR relationship.
+        :type spatial_unit: Entity
+        """
+        if spatial_unit is None:
+            return
+
+        self._sp_item.entity = spatial_unit
+
+        #Add arrow linking social tenure to spatial unit item
+        if not self.has_arrow(self._str_item, self._sp_item):
+            self.add_arrow(self._str_item, self._sp_item)
+
+    def has_arrow(self, start_item, end_item):
+        """
+        :param start_item: Start item for the arrow.
+        :type start_item: BaseTenureItem
+        :param end_item: End item for the arrow.
+        :type end_item: BaseTenureItem
+        :return: Returns True if there is an arrow running from the start to
+        the end item, otherwise False.
+        :rtype: bool
+        """
+        for ar in start_item.arrows:
+            if ar.start_item is start_item and ar.end_item is end_item:
+                return True
+
+        return False
+
+    def party_entities(self):
+        """
+        :return: Returns the party entities in the view, including those in
+        party groups.
+        :rtype: list
+        """
+        parties = [p_item.entity for p_item in self._party_items.values()]
+        for group in self._party_groups.values():
+            parties.extend(group.members())
+
+        return parties
+
+    def clear_parties(self):
+        """
+        Removes all party entities from the view.
+        """
+        self.begin_update()
+
+        try:
+            for party in self.party_entities():
+                self.remove_party(party.short_name)
+
+        finally:
+            self.end_update()
+
+    def set_party_entities(self, parties):
+        """
+        Replaces the party entities in the view. Only the differences are
+        applied i.e. parties that are no longer present are removed, new
+        ones are added and the items of existing parties are only updated
+        if their columns have changed.
+        :param parties: Party entities.
+        :type parties: list
+        """
+        names = set(p.short_name for p in parties)
+        self.begin_update()
+
+        try:
+            for party in self.party_entities():
+                if not party.short_name in names:
+                    self.remove_party(party.short_name)
+
+            for party in parties:
+                p_item = self._party_items.get(party.short_name, None)
+                group = self.party_group_of(party.short_name)
+
+                if not p_item is None:
+                    p_item.entity = party
+                elif not group is None:
+                    group.add_members([party])
+                else:
+                    self.add_party_entity(party)
+
+        finally:
+            self.end_update()
+
+    def annotation_items(self):
+        """
+        :return: Returns the annotation items in the scene.
+        :rtype: list
+        """
+        return [
+            item for item in self.scene().items()
+            if isinstance(item, Annotation)
+        ]
+
+    def add_annotation(self, text, size, pos):
+        """
+        Adds a non-editable annotation item to the scene.
+        :param text: Annotation text.
+        :type text: str
+        :param size: Annotation.Minor or Annotation.Major.
+        :type size: int
+        :param pos: Position of the annotation in scene coordinates.
+        :type pos: QPointF
+        :return: Returns the annotation item.
+        :rtype: Annotation
+        """
+        scene = self.scene()
+        annotation = Annotation(size=size)
+        annotation.setPlainText(text)
+        annotation.setZValue(1000.0)
+        annotation.lost_focus.connect(scene.editor_lost_focus)
+        scene.addItem(annotation)
+        annotation.setPos(pos)
+
+        return annotation
+
+    def to_model(self):
+        """
+        Creates a widget-free model of the diagram.
+        :return: Returns the model of the items, positions, arrows and
+        annotations in the view.
+        :rtype: ProfileTenureModel
+        """
+        model = ProfileTenureModel()
+        model.profile = self.scene().profile
+
+        fixed_nodes = (
+            (self._str_item, model.social_tenure),
+            (self._sp_item, model.spatial_unit),
+            (self._supporting_doc_item, model.supporting_document)
+        )
+        nodes = {}
+
+        for item, node in fixed_nodes:
+            node.entity = item.entity
+            node.x, node.y = item.pos().x(), item.pos().y()
+            nodes[item] = node
+
+        for name, p_item in self._party_items.items():
+            pos = p_item.pos()
+            nodes[p_item] = model.add_party(p_item.entity, pos.x(), pos.y())
+
+        #Edges are taken from the arrows in the scene
+        model.edges = []
+        for item in self.scene().items():
+            if isinstance(item, Arrow):
+                start = nodes.get(item.start_item, None)
+                end = nodes.get(item.end_item, None)
+                if not start is None and not end is None:
+                    model.add_edge(start, end)
+
+        #Parties in a group are added at the position of the group
+        for group in self._party_groups.values():
+            pos = group.pos()
+            for party in group.members():
+                model.add_party(party, pos.x(), pos.y(), group.name)
+
+        for item in self.annotation_items():
+            pos = item.pos()
+            model.add_annotation(
+                unicode(item.toPlainText()),
+                item.size,
+                pos.x(),
+                pos.y()
+            )
+
+        return model
+
+    def load_model(self, model):
+        """
+        Replaces the contents of the view with those of the model.
+        :param model: Diagram model.
+        :type model: ProfileTenureModel
+        """
+        self.begin_update()
+
+        try:
+            for item in self.annotation_items():
+                self.scene().removeItem(item)
+                item.deleteLater()
+
+            self.scene().profile = model.profile
+
+            fixed_nodes = (
+                (self._str_item, model.social_tenure),
+                (self._sp_item, model.spatial_unit),
+                (self._supporting_doc_item, model.supporting_document)
+            )
+            items = {}
+
+            for item, node in fixed_nodes:
+                if not node.entity is None:
+                    item.entity = node.entity
+                item.setPos(node.x, node.y)
+                items[node] = item
+
+            #Remove the parties that are not in the model, or whose item or
+            # group differs, so that grouped parties never get an item
+            for party in self.party_entities():
+                name = party.short_name
+                node = model.parties.get(name, None)
+                group = self.party_group_of(name)
+                group_name = None if group is None else group.name
+
+                if node is None or node.group != group_name:
+                    self._discard_party(name)
+
+            for name, node in model.parties.items():
+                if not node.group is None:
+                    continue
+
+                p_item = self._party_items.get(name, None)
+                if p_item is None:
+                    p_item = self._add_party_item(node.entity)
+                else:
+                    p_item.entity = node.entity
+
+                p_item.setPos(node.x, node.y)
+                items[node] = p_item
+
+            #Groups take the position of their first member
+            groups = OrderedDict()
+            for node in model.parties.values():
+                if not node.group is None:
+                    groups.setdefault(node.group, []).append(node)
+
+            for name, nodes in groups.items():
+                group = self._party_groups.get(name, None)
+                if group is None:
+                    group = self.add_party_group(
+                        name,
+                        [node.entity for node in nodes]
+                    )
+                else:
+                    group.add_members([node.entity for node in nodes])
+
+                group.setPos(nodes[0].x, nodes[0].y)
+
+            self._update_default_party_item()
+
+            for edge in model.edges:
+                start = items.get(edge.start, None)
+                end = items.get(edge.end, None)
+                if start is None or end is None:
+                    continue
+
+                if not self.has_arrow(start, end):
+                    self.add_arrow(start, end)
+
+            for anno in model.annotations:
+                self.add_annotation(
+                    anno.text,
+                    anno.size,
+                    QPointF(anno.x, anno.y)
+                )
+
+        finally:
+            self.end_update()
+
+    def add_arrow(self, start_item, end_item, **kwargs):
+        """
+        Adds an arrow item running from the start to the end item.
+        :param start_item: Start item for the arrow.
+        :type start_item: BaseTenureItem
+        :param end_item: End item for the arrow.
+        :type end_item: BaseTenureItem
+        :param kwargs: Optional arrow arguments such as angle, base width
+        etc. See arguments for the Arrow class.
+        :type kwargs: dict
+        :return: Returns the arrow item.
+        :rtype: Arrow
+        """
+        return self.scene().add_arrow(start_item, end_item, **kwargs)
+
+    def keyPressEvent(self, event):
+        """
+        Capture delete key to remove selected annotation items.
+        :param event: Key event.
+        :type event: QKeyEvent
+        """
+        if event.key() == Qt.Key_Delete:
+            self._delete_selected_annotation_items()
+
+        super(ProfileTenureView, self).keyPressEvent(event)
+
+    def set_update_strategy(self, mode=None, optimization_flags=None):
+        """
+        Sets how the viewport is updated when items change.
+        :param mode: Viewport update mode e.g.
+        QGraphicsView.SmartViewportUpdate, MinimalViewportUpdate or
+        FullViewportUpdate. Defaults to VIEWPORT_UPDATE_MODE.
+        :type mode: int
+        :param optimization_flags: Optimization flags of the view. Defaults
+        to OPTIMIZATION_FLAGS.
+        :type optimization_flags: QGraphicsView.OptimizationFlags
+        """
+        if mode is None:
+            mode = self.VIEWPORT_UPDATE_MODE
+
+        if optimization_flags is None:
+            optimization_flags = self.OPTIMIZATION_FLAGS
+
+        self.setViewportUpdateMode(mode)
+        self.setOptimizationFlags(optimization_flags)
+
+    def begin_update(self):
+        """
+        Defers repainting of the viewport until end_update is called, so
+        that the areas changed by several operations, such as adding many
+        parties, are repainted in a single update rather than one per item.
+        The geometry of the arrows is also updated in a single batch. Calls
+        can be nested.
+        """
+        self._update_depth += 1
+        if self._update_depth > 1:
+            return
+
+        self.viewport().setUpdatesEnabled(False)
+        self.scene().begin_batch_update()
+
+    def end_update(self):
+        """
+        Repaints the viewport once after the changes made since
+        begin_update was called.
+        """
+        if self._update_depth == 0:
+            return
+
+        self._update_depth -= 1
+        if self._update_depth > 0:
+            return
+
+        self.scene().end_batch_update()
+        self.viewport().setUpdatesEnabled(True)
+        self.viewport().update()
+
+    def draft_mode(self):
+        """
+        :return: Returns True if the view is rendered in draft quality i.e.
+        without antialiasing, shadows and gradients.
+        :rtype: bool
+        """
+        return self._draft
+
+    def set_draft_mode(self, draft):
+        """
+        Switches between draft and full quality rendering of the view.
+        Exported images are always rendered in full quality.
+        :param draft: True for draft quality, False for full quality.
+        :type draft: bool
+        """
+        if draft == self._draft:
+            return
+
+        self._draft = draft
+        self.setRenderHint(QPainter.Antialiasing, not draft)
+        self.setRenderHint(QPainter.TextAntialiasing, not draft)
+        self.viewport().update()
+
+    def notify_interaction(self):
+        """
+        Switches to draft quality while the user drags, zooms or scrolls, if
+        draft_while_interacting is True. Full quality is restored once there
+        has been no interaction for DRAFT_IDLE_INTERVAL milliseconds.
+        """
+        if not self.draft_while_interacting:
+            return
+
+        self.set_draft_mode(True)
+        self._draft_timer.start()
+
+    def _end_draft(self):
+        #Restores full quality unless an item is still being dragged or
+        # the view is being zoomed
+        if QApplication.mouseButtons() != Qt.NoButton or self.is_zooming():
+            self._draft_timer.start()
+
+            return
+
+        self.set_draft_mode(False)
+
+    def mouseMoveEvent(self, event):
+        """
+        Uses draft quality while items are being dragged.
+        :param event: Mouse event.
+        :type event: QMouseEvent
+        """
+        if event.buttons() != Qt.NoButton:
+            self.notify_interaction()
+
+        super(ProfileTenureView, self).mouseMoveEvent(event)
+
+    def wheelEvent(self, event):
+        """
+        Zooms the view about the mouse position if the wheel is turned with
+        the Ctrl key pressed, otherwise scrolls the view in draft quality.
+        :param event: Wheel event.
+        :type event: QWheelEvent
+        """
+        if event.modifiers() & Qt.ControlModifier:
+            factor = self.WHEEL_ZOOM_STEP ** (event.delta() / 120.0)
+            self.zoom_to(
+                self._zoom_base() * factor,
+                anchor=QGraphicsView.AnchorUnderMouse
+            )
+            event.accept()
+
+            return
+
+        self.notify_interaction()
+
+        super(ProfileTenureView, self).wheelEvent(event)
+
+    def viewportEvent(self, event):
+        """
+        Zooms the view with pinch gestures.
+        :param event: Viewport event.
+        :type event: QEvent
+        """
+        if event.type() == QEvent.Gesture:
+            pinch = event.gesture(Qt.PinchGesture)
+            if not pinch is None:
+                self._pinch_zoomed(pinch)
+                event.accept()
+
+                return True
+
+        return super(ProfileTenureView, self).viewportEvent(event)
+
+    def _pinch_zoomed(self, pinch):
+        #The total scale factor of the gesture is applied to the zoom at
+        # the start of the gesture
+        if pinch.state() == Qt.GestureStarted:
+            self._pinch_zoom = self._zoom_base()
+
+        if pinch.changeFlags() & QPinchGesture.ScaleFactorChanged:
+            self.zoom_to(
+                self._pinch_zoom * pinch.totalScaleFactor(),
+                anchor=QGraphicsView.AnchorUnderMouse
+            )
+
+    def fit_to_contents(self, margin=20.0, animate=True):
+        """
+        Zooms and scrolls the view so that all the tenure items are
+        visible. The bounds of the items are taken from the contents rect
+        maintained by the scene.
+        :param margin: Space, in pixels, around the items.
+        :type margin: float
+        :param animate: True to animate the zoom.
+        :type animate: bool
+        :return: Returns False if there are no items to fit, otherwise True.
+        :rtype: bool
+        """
+        rect = self.scene().contents_rect()
+        if rect.isEmpty():
+            return False
+
+        viewport = self.viewport().rect()
+        factor = min(
+            viewport.width() / (rect.width() + margin * 2),
+            viewport.height() / (rect.height() + margin * 2)
+        )
+
+        #Centered again once the zoom settles since scrolling may be
+        # limited at the current zoom
+        self._zoom_center = rect.center()
+        self.centerOn(self._zoom_center)
+        self.zoom_to(factor, animate, QGraphicsView.AnchorViewCenter)
+
+        return True
+
+    def zoom_factor(self):
+        """
+        :return: Returns the current zoom factor of the view.
+        :rtype: float
+        """
+        return self.transform().m11()
+
+    def _zoom_base(self):
+        #Zoom factor that relative zoom steps apply to, which is the target
+        # of an animated zoom in progress so that steps accumulate
+        if self.is_zooming():
+            return self._zoom_target
+
+        return self.zoom_factor()
+
+    def is_zooming(self):
+        """
+        :return: Returns True if an animated zoom is in progress.
+        :rtype: bool
+        """
+        return self._zoom_timer.isActive()
+
+    def zoom_to(self, factor, animate=True, anchor=None):
+        """
+        Zooms the view to the given factor. An animated zoom advances
+        towards the factor on each frame, rendering in draft quality and
+        from cached item pixmaps, and covers more of the remaining distance
+        per frame if frames exceed ZOOM_FRAME_BUDGET so that it settles in
+        a similar time on slow machines. A single full quality frame is
+        rendered once the zoom settles, after which zoom_changed is raised.
+        :param factor: Zoom factor, limited to MIN_ZOOM and MAX_ZOOM.
+        :type factor: float
+        :param animate: True to animate the zoom, False to apply it at
+        once.
+        :type animate: bool
+        :param anchor: Point kept in place while zooming e.g.
+        QGraphicsView.AnchorUnderMouse. Defaults to the resize anchor of
+        the view.
+        :type anchor: int
+        """
+        self._zoom_target = min(max(factor, self.MIN_ZOOM), self.MAX_ZOOM)
+
+        if anchor is None:
+            anchor = self.resizeAnchor()
+
+        if self._zoom_anchor is None:
+            self._zoom_anchor = self.transformationAnchor()
+        self.setTransformationAnchor(anchor)
+
+        if not animate:
+            self._zoom_timer.stop()
+            self._apply_zoom(self._zoom_target)
+            self._end_zoom()
+
+            return
+
+        if not self.is_zooming():
+            if self.draft_while_interacting:
+                self.set_draft_mode(True)
+            self._begin_item_caching()
+            self._zoom_frame_time = 0.0
+            self._zoom_timer.start()
+
+    def _apply_zoom(self, factor):
+        #Scales the view, relative to the current zoom, to the factor
+        current = self.zoom_factor()
+        if current > 0 and factor != current:
+            self.scale(factor / current, factor / current)
+
+    def scale(self, sx, sy):
+        """
+        Scales the view and raises visible_area_changed.
+        :param sx: Horizontal scale factor.
+        :type sx: float
+        :param sy: Vertical scale factor.
+        :type sy: float
+        """
+        super(ProfileTenureView, self).scale(sx, sy)
+        self.visible_area_changed.emit()
+
+    def setTransform(self, matrix, combine=False):
+        """
+        Sets the transformation matrix of the view and raises
+        visible_area_changed.
+        :param matrix: Transformation matrix.
+        :type matrix: QTransform
+        :param combine: True to combine the matrix with the current one.
+        :type combine: bool
+        """
+        super(ProfileTenureView, self).setTransform(matrix, combine)
+        self.visible_area_changed.emit()
+
+    def resizeEvent(self, event):
+        super(ProfileTenureView, self).resizeEvent(event)
+        self.visible_area_changed.emit()
+
+    def _zoom_frame(self):
+        #Advances the animated zoom by one frame
+        start = time.time()
+        current = self.zoom_factor()
+
+        #Frames over budget cover a larger part of the remaining distance
+        budget_ratio = self._zoom_frame_time / self.ZOOM_FRAME_BUDGET
+        fraction = min(1.0, self._zoom_fraction * max(1.0, budget_ratio))
+
+        #Interpolate in log space so that zooming in and out is symmetric
+        ratio = self._zoom_target / current
+        factor = current * ratio ** fraction
+        if abs(math.log(self._zoom_target / factor)) < 0.005:
+            factor = self._zoom_target
+
+        self._apply_zoom(factor)
+        self.viewport().repaint()
+        self._zoom_frame_time = (time.time() - start) * 1000.0
+
+        if factor == self._zoom_target:
+            self._zoom_timer.stop()
+            self._end_zoom()
+
+    def _end_zoom(self):
+        #Restores full quality rendering once the zoom has settled
+        self._end_item_caching()
+
+        if not self._zoom_anchor is None:
+            self.setTransformationAnchor(self._zoom_anchor)
+            self._zoom_anchor = None
+
+        if not self._zoom_center is None:
+            self.centerOn(self._zoom_center)
+            self._zoom_center = None
+
+        self.set_draft_mode(False)
+        self.zoom_changed.emit(self.zoom_factor())
+
+    def _begin_item_caching(self):
+        #Each view holds at most one reference to the item cache of the
+        # shared scene
+        if not self._item_caching:
+            self._item_caching = True
+            self.scene().begin_item_caching()
+
+    def _end_item_caching(self):
+        if self._item_caching:
+            self._item_caching = False
+            self.scene().end_item_caching()
+
+    def scrollContentsBy(self, dx, dy):
+        #Uses draft quality while the view is being scrolled
+        self.notify_interaction()
+
+        super(ProfileTenureView, self).scrollContentsBy(dx, dy)
+
+    def mouseDoubleClickEvent(self, event):
+        """
+        Expands a party group item that has been double-clicked.
+        :param event: Mouse event.
+        :type event: QMouseEvent
+        """
+        for item in self.items(event.pos()):
+            if isinstance(item, PartyGroupItem):
+                self.expand_party_group(item.name)
+
+                return
+
+        super(ProfileTenureView, self).mouseDoubleClickEvent(event)
+
+    def _delete_selected_annotation_items(self):
+        #Deletes selected annotation items in the scene
+        for item in self.scene().selectedItems():
             if isinstance(item, Annotation):
                 #Only remove if item is not on interactive text edit mode
                 if item.textInteractionFlags() == Qt.NoTextInteraction:
                     self.scene().removeItem(item)
                     item.deleteLater()
 
-    def save_image_to_file(self, path, resolution=96):
+    def save_image_to_file(self, path, resolution=96, memory_mapped=False):
         """
         Saves the profile tenure view image to file using A4 paper size.
         :param path: Absolute path where the image will be saved.
         :type path: str
         :param resolution: Resolution in dpi. Default is 96.
         :type resolution: int
+        :param memory_mapped: True to render directly into a memory-mapped
+        file instead of holding the image in memory. Only uncompressed
+        formats are supported, see save_mapped_image.
+        :type memory_mapped: bool
         :return: Returns True if the operation succeeded, otherwise False. If
         False then a corresponding message is returned as well.
         :rtype: (bool, str)
         """
-        image = self.image(resolution)
+        cache_key = None
+        image_format = os.path.splitext(path)[1][1:].upper()
+
+        if not self._render_cache is None and image_format:
+            cache_key = self.scene_digest(resolution, image_format)
+            cached_path = self._render_cache.lookup(cache_key, image_format)
+
+            if not cached_path is None:
+                try:
+                    shutil.copyfile(cached_path, path)
+
+                    return True, ''
+                except (IOError, OSError):
+                    #Fall back to rendering the scene
+                    pass
+
+        if memory_mapped:
+            status, msg = self.save_mapped_image(path, resolution)
+
+            if status and not cache_key is None:
+                self._render_cache.store_file(cache_key, image_format, path)
+
+            return status, msg
+
+        image = self._render_image(resolution)
 
         if image.isNull():
             msg = self.tr('Constructed image is null.')
@@ -1477,14 +5185,219 @@ class ProfileTenureView(QGraphicsView):
 
         #Attempt to save to file
         save_op = image.save(fl)
+        fl.close()
 
         if not save_op:
             msg = self.tr('Image operation failed.')
 
             return False, msg
 
+        if not cache_key is None:
+            self._render_cache.store_file(cache_key, image_format, path)
+
+        return True, ''
+
+    def save_mapped_image(self, path, resolution=96, size=None):
+        """
+        Renders the view directly into a memory-mapped file. The image is
+        constructed over the mapped buffer so the operating system can page
+        the pixel data out to disk instead of it being held by the process,
+        which allows exporting images larger than the available memory.
+        The image is rendered in bands of at most MAPPED_BAND_BYTES.
+        The file format is determined by the extension of the path:
+        .ppm - binary PPM (P6) with 24-bit RGB pixels.
+        .tif/.tiff - uncompressed TIFF with 24-bit RGB pixels.
+        .raw - headerless 32-bit ARGB pixels in the native byte order.
+        :param path: Absolute path where the image will be saved.
+        :type path: str
+        :param resolution: Resolution in dpi. Default is 96.
+        :type resolution: int
+        :param size: Size of the image in pixels, for poster-size exports.
+        Defaults to the A4 size at the given resolution.
+        :type size: QSize
+        :return: Returns True if the operation succeeded, otherwise False. If
+        False then a corresponding message is returned as well.
+        :rtype: (bool, str)
+        """
+        ext = os.path.splitext(path)[1].lower()
+        resolution = self._clamp_resolution(resolution)
+
+        if size is None:
+            size = self.image_size(resolution)
+
+        width, height = size.width(), size.height()
+        if width <= 0 or height <= 0:
+            msg = self.tr('Constructed image is null.')
+
+            return False, msg
+
+        if ext == '.raw':
+            img_format = QImage.Format_ARGB32
+            bytes_per_line = width * 4
+            header = b''
+        elif ext == '.ppm':
+            img_format = QImage.Format_RGB888
+            bytes_per_line = width * 3
+            header = self._ppm_header(width, height)
+        elif ext in ('.tif', '.tiff'):
+            img_format = QImage.Format_RGB888
+            bytes_per_line = width * 3
+            header = self._tiff_header(width, height, resolution)
+        else:
+            msg = self.tr('Memory-mapped images can only be saved as raw, '
+                          'PPM or TIFF files.')
+
+            return False, msg
+
+        data_size = bytes_per_line * height
+        file_size = len(header) + data_size
+
+        #TIFF offsets and byte counts are 32-bit
+        if ext in ('.tif', '.tiff') and file_size >= 2 ** 32:
+            msg = self.tr('The image is too large to be saved as a TIFF '
+                          'file, use the raw or PPM format instead.')
+
+            return False, msg
+
+        if file_size > sys.maxsize or bytes_per_line > self.MAPPED_BAND_BYTES:
+            msg = self.tr('The image is too large to be mapped into memory.')
+
+            return False, msg
+
+        try:
+            fl = open(path, 'w+b')
+        except IOError:
+            msg = self.tr('The image file cannot be saved in the '
+                          'specified location.')
+
+            return False, msg
+
+        try:
+            #Extend the file without writing the pixel data
+            fl.truncate(file_size)
+            mm = mmap.mmap(fl.fileno(), file_size)
+        except (EnvironmentError, ValueError, OverflowError):
+            fl.close()
+            msg = self.tr('Image operation failed.')
+
+            return False, msg
+
+        #A QImage cannot hold more than 2 GiB hence the image is rendered
+        # in horizontal bands, each constructed over its slice of the file.
+        band_height = max(1, self.MAPPED_BAND_BYTES // bytes_per_line)
+        buf = None
+        img = None
+
+        try:
+            mm[:len(header)] = header
+
+            for top in range(0, height, band_height):
+                rows = min(band_height, height - top)
+                buf = ctypes.c_char.from_buffer(
+                    mm,
+                    len(header) + top * bytes_per_line
+                )
+                img = QImage(
+                    sip.voidptr(ctypes.addressof(buf)),
+                    width,
+                    rows,
+                    bytes_per_line,
+                    img_format
+                )
+
+                if img.isNull():
+                    msg = self.tr('Constructed image is null.')
+
+                    return False, msg
+
+                self._render_band(img, resolution, Qt.white, size, top)
+
+                img = None
+                buf = None
+
+            mm.flush()
+
+        finally:
+            #The buffer cannot be unmapped while it is still referenced
+            img = None
+            buf = None
+            mm.close()
+            fl.close()
+
         return True, ''
 
+    def _render_band(self, img, resolution, background, size, top):
+        #Renders the rows of an image of the given size starting at top
+        # onto an image holding only those rows
+        dpm = self._resolution_in_m(resolution)
+
+        img.setDotsPerMeterX(int(dpm))
+        img.setDotsPerMeterY(int(dpm))
+        img.fill(background)
+
+        painter = QPainter(img)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setRenderHint(QPainter.TextAntialiasing, True)
+        painter.translate(0, -top)
+        self.scene().render(
+            painter,
+            QRectF(0, 0, size.width(), size.height())
+        )
+        painter.end()
+
+    def _ppm_header(self, width, height):
+        #Binary PPM header padded so that the pixel data is 32-bit aligned.
+        # Only a single whitespace character is allowed after the maximum
+        # value hence the padding is inserted before it.
+        dims = 'P6\n{0} {1}\n'.format(width, height)
+        pad = (4 - (len(dims) + 4) % 4) % 4
+
+        return (dims + ' ' * pad + '255\n').encode('ascii')
+
+    def _tiff_header(self, width, height, resolution):
+        #Little endian TIFF header with a single IFD and a single strip of
+        # uncompressed RGB data which immediately follows the header.
+        num_entries = 13
+        ifd_offset = 8
+        bps_offset = ifd_offset + 2 + num_entries * 12 + 4
+        x_res_offset = bps_offset + 6
+        y_res_offset = x_res_offset + 8
+        data_offset = y_res_offset + 8
+
+        short, long_, rational = 3, 4, 5
+        entries = [
+            (256, long_, 1, width),
+            (257, long_, 1, height),
+            (258, short, 3, bps_offset),
+            (259, short, 1, 1),
+            (262, short, 1, 2),
+            (273, long_, 1, data_offset),
+            (277, short, 1, 3),
+            (278, long_, 1, height),
+            (279, long_, 1, width * height * 3),
+            (282, rational, 1, x_res_offset),
+            (283, rational, 1, y_res_offset),
+            (284, short, 1, 1),
+            (296, short, 1, 2)
+        ]
+
+        header = struct.pack('<2sHI', b'II', 42, ifd_offset)
+        header += struct.pack('<H', num_entries)
+
+        for tag, typ, count, value in entries:
+            if typ == short and count == 1:
+                header += struct.pack('<HHIHH', tag, typ, count, value, 0)
+            else:
+                header += struct.pack('<HHII', tag, typ, count, value)
+
+        #Offset to the next IFD
+        header += struct.pack('<I', 0)
+        header += struct.pack('<HHH', 8, 8, 8)
+        header += struct.pack('<II', int(resolution), 1)
+        header += struct.pack('<II', int(resolution), 1)
+
+        return header
+
     def _resolution_in_mm(self, resolution):
         #Calculates the resolution in mm
         return resolution / 25.4
@@ -1509,9 +5422,72 @@ class ProfileTenureView(QGraphicsView):
 
         return QSize(int(width), int(height))
 
+    def _clamp_resolution(self, resolution):
+        #Ensure resolution is within limits
+        if resolution < ProfileTenureView.MIN_DPI:
+            resolution = ProfileTenureView.MIN_DPI
+        if resolution > ProfileTenureView.MAX_DPI:
+            resolution = ProfileTenureView.MAX_DPI
+
+        return resolution
+
+    def scene_digest(self, resolution, image_format='PNG',
+                     background=Qt.white):
+        """
+        Computes a stable hash of the scene content i.e. entities, columns,
+        lookups, item positions, annotations as well as the output
+        resolution and format. Scenes with the same digest render to
+        identical images.
+        :param resolution: Resolution of the image in dpi.
+        :type resolution: int
+        :param image_format: Image format e.g. PNG, JPG.
+        :type image_format: str
+        :param background: Background color of the image.
+        :type background: QColor
+        :return: Returns the hex digest of the scene content.
+        :rtype: str
+        """
+        content = [
+            self._clamp_resolution(resolution),
+            image_format.upper(),
+            QColor(background).name()
+        ]
+
+        rect = self.scene().sceneRect()
+        content.append(
+            (rect.x(), rect.y(), rect.width(), rect.height())
+        )
+
+        tenure_items = []
+        annotations = []
+        arrows = []
+
+        for item in self.scene().items():
+            if isinstance(item, BaseTenureItem):
+                tenure_items.append(item.content_key())
+            elif isinstance(item, Annotation):
+                pos = item.pos()
+                annotations.append(
+                    (item.size, unicode(item.toPlainText()), pos.x(), pos.y())
+                )
+            elif isinstance(item, Arrow):
+                arrows.append((
+                    item.start_item.content_key(),
+                    item.end_item.content_key()
+                ))
+
+        #Sort so that the digest is independent of the stacking order
+        content.extend(sorted(tenure_items))
+        content.extend(sorted(annotations))
+        content.extend(sorted(arrows))
+
+        return hashlib.sha1(repr(content).encode('utf-8')).hexdigest()
+
     def image(self, resolution, background=Qt.white):
         """
-        Renders the view onto a QImage object.
+        Renders the view onto a QImage object. If a render cache has been
+        set and the scene has not changed since it was last rendered then
+        the image is loaded from the cache.
         :param resolution: Resolution of the image in dpi.
         :type resolution: int
         :param background: Set background color of the image. Default is a
@@ -1521,52 +5497,397 @@ class ProfileTenureView(QGraphicsView):
         view.
         :rtype: QImage
         """
-        #Ensure resolution is within limits
-        if resolution < ProfileTenureView.MIN_DPI:
-            resolution = ProfileTenureView.MIN_DPI
-        if resolution > ProfileTenureView.MAX_DPI:
-            resolution = ProfileTenureView.MAX_DPI
+        if self._render_cache is None:
+            return self._render_image(resolution, background)
+
+        cache_key = self.scene_digest(resolution, 'PNG', background)
+        cached_path = self._render_cache.lookup(cache_key, 'PNG')
+
+        if not cached_path is None:
+            img = QImage(cached_path)
+            if not img.isNull():
+                return img
+
+        img = self._render_image(resolution, background)
+        if not img.isNull():
+            self._render_cache.store_image(cache_key, 'PNG', img)
+
+        return img
+
+    def _render_image(self, resolution, background=Qt.white):
+        #Renders the scene onto a QImage object
+        resolution = self._clamp_resolution(resolution)
+
+        image_size = self.image_size(resolution)
+
+        img = QImage(
+            image_size.width(),
+            image_size.height(),
+            QImage.Format_ARGB32
+        )
+        self._render_onto(img, resolution, background)
+
+        return img
+
+    def _render_onto(self, img, resolution, background):
+        #Renders the scene onto an existing image object
+        #In metres
+        dpm = self._resolution_in_m(resolution)
+
+        img.setDotsPerMeterX(int(dpm))
+        img.setDotsPerMeterY(int(dpm))
+        img.fill(background)
+
+        #Always rendered in full quality, even in draft mode
+        painter = QPainter(img)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setRenderHint(QPainter.TextAntialiasing, True)
+        self.scene().render(painter)
+        painter.end()
+
+    def image_array(self, resolution, background=Qt.white, out=None):
+        """
+        Renders the view directly into a NumPy array without an intermediate
+        copy or encoding step. The array is wrapped in a QImage which the
+        scene is painted onto. The pixels are 32-bit ARGB values in the
+        native byte order i.e. the channels are ordered B, G, R, A on little
+        endian machines.
+        :param resolution: Resolution of the image in dpi.
+        :type resolution: int
+        :param background: Set background color of the image. Default is a
+        white background.
+        :type background: QColor
+        :param out: Optional array to render into. It must be a C-contiguous,
+        writeable uint8 array whose shape is (height, width, 4) as given by
+        image_size. A new array is allocated if not specified.
+        :type out: numpy.ndarray
+        :return: Returns the array containing the rendered view.
+        :rtype: numpy.ndarray
+        """
+        if numpy is None:
+            raise ImportError('NumPy is required for rendering into arrays.')
+
+        resolution = self._clamp_resolution(resolution)
+        image_size = self.image_size(resolution)
+        shape = (image_size.height(), image_size.width(), 4)
+
+        if out is None:
+            out = numpy.empty(shape, dtype=numpy.uint8)
+
+        elif out.shape != shape or out.dtype != numpy.uint8 or \
+                not out.flags['C_CONTIGUOUS'] or not out.flags['WRITEABLE']:
+            raise ValueError(
+                'Output array must be a writeable, C-contiguous uint8 array '
+                'with shape {0}.'.format(shape)
+            )
+
+        img = QImage(
+            sip.voidptr(out.ctypes.data),
+            shape[1],
+            shape[0],
+            out.strides[0],
+            QImage.Format_ARGB32
+        )
+        self._render_onto(img, resolution, background)
+
+        #Release the image before handing the buffer to the caller
+        del img
+
+        return out
+
+    def thumbnail(self, size, background=Qt.white):
+        """
+        Renders the scene directly to a small image whose longest side is
+        equal to the given size. See thumbnail_pyramid.
+        :param size: Size, in pixels, of the longest side of the thumbnail.
+        :type size: int
+        :param background: Background color of the thumbnail.
+        :type background: QColor
+        :return: Returns the thumbnail image.
+        :rtype: QImage
+        """
+        return self.thumbnail_pyramid((size,), background)[size]
+
+    def thumbnail_pyramid(self, sizes=None, background=Qt.white):
+        """
+        Creates thumbnails of the scene for each of the given sizes. The
+        scene is only rendered once, at the largest size, and each smaller
+        level is derived by scaling down the next larger one. Thumbnails are
+        cached using the digest of the scene content so unchanged scenes are
+        not rendered again.
+        :param sizes: Sizes, in pixels, of the longest side of each level.
+        Defaults to THUMBNAIL_SIZES.
+        :type sizes: list
+        :param background: Background color of the thumbnails.
+        :type background: QColor
+        :return: Returns the thumbnails keyed by size.
+        :rtype: dict
+        """
+        if sizes is None:
+            sizes = ProfileTenureView.THUMBNAIL_SIZES
+
+        sizes = sorted(set(int(s) for s in sizes if s > 0), reverse=True)
+        if len(sizes) == 0:
+            return {}
+
+        cache = ProfileTenureView.thumbnail_cache
+        key = self.scene_digest(ProfileTenureView.MIN_DPI, 'THUMBNAIL',
+                                background)
+
+        levels = {}
+        for sz in sizes:
+            img = cache.get(key, sz)
+            if not img is None:
+                levels[sz] = img
+
+        missing = [sz for sz in sizes if not sz in levels]
+        if len(missing) == 0:
+            return levels
+
+        #Render the largest level then scale down for the subsequent ones
+        source = self._render_thumbnail(missing[0], background)
+        rendered = {missing[0]: source}
+
+        for sz in missing[1:]:
+            source = source.scaled(
+                self._thumbnail_size(sz),
+                Qt.KeepAspectRatio,
+                Qt.SmoothTransformation
+            )
+            rendered[sz] = source
+
+        cache.put(key, rendered)
+        levels.update(rendered)
+
+        return levels
+
+    def _thumbnail_size(self, size):
+        #Size of the thumbnail whose longest side is equal to size
+        scene_size = self.scene().sceneRect().size().toSize()
+        scene_size.scale(size, size, Qt.KeepAspectRatio)
+
+        return QSize(max(1, scene_size.width()), max(1, scene_size.height()))
+
+    def _render_thumbnail(self, size, background):
+        #Renders the scene directly onto an image of the thumbnail size
+        thumb_size = self._thumbnail_size(size)
+
+        img = QImage(thumb_size, QImage.Format_ARGB32_Premultiplied)
+        img.fill(QColor(background).rgba())
+
+        painter = QPainter(img)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        self.scene().render(painter, QRectF(img.rect()))
+        painter.end()
+
+        return img
+
+    def valid(self):
+        """
+        :return: Returns False if the respective party and spatial unit
+        entities have not been set. Otherwise True.
+        :rtype: bool
+        """
+        if len(self.party_entities()) == 0:
+            return False
+
+        if self._sp_item.entity is None:
+            return False
+
+        return True
+
+    def minimumSizeHint(self):
+        return QSize(480, 270)
+
+    def sizeHint(self):
+        return QSize(560, 315)
+
+
+class ProfileTenureMinimap(QWidget):
+    """
+    Overview of the whole scene rendered by a ProfileTenureView. The scene
+    is rendered once into a low resolution pixmap and only the regions that
+    have changed are rendered again. The visible area of the view is shown
+    as a rectangle and clicking or dragging in the minimap pans the view.
+    """
+    def __init__(self, view, parent=None):
+        """
+        Class constructor.
+        :param view: View whose scene is shown in the minimap.
+        :type view: ProfileTenureView
+        :param parent: Parent widget.
+        :type parent: QWidget
+        """
+        super(ProfileTenureMinimap, self).__init__(parent)
+
+        self._view = view
+        self._cache = None
+        self.background = QColor(Qt.white)
+        self.viewport_pen = QPen(QColor('#1399FC'), 1.5)
+        self.viewport_brush = QBrush(QColor(19, 153, 252, 40))
+
+        scene = view.scene()
+        scene.changed.connect(self._on_scene_changed)
+        scene.sceneRectChanged.connect(self._on_scene_rect_changed)
+        view.horizontalScrollBar().valueChanged.connect(self.update)
+        view.verticalScrollBar().valueChanged.connect(self.update)
+        view.visible_area_changed.connect(self.update)
+
+    @property
+    def view(self):
+        """
+        :return: Returns the view whose scene is shown in the minimap.
+        :rtype: ProfileTenureView
+        """
+        return self._view
+
+    def _target_rect(self):
+        #Area of the widget, preserving the aspect ratio of the scene, in
+        # which the scene is drawn.
+        scene_size = self._view.scene().sceneRect().size()
+        scene_size.scale(QSizeF(self.size()), Qt.KeepAspectRatio)
+
+        return QRectF(QPointF(0, 0), scene_size)
+
+    def _scale(self):
+        #Ratio of the minimap size to the scene size
+        scene_rect = self._view.scene().sceneRect()
+        if scene_rect.width() == 0:
+            return 1.0
+
+        return self._target_rect().width() / scene_rect.width()
+
+    def map_to_scene(self, point):
+        """
+        :param point: Point in widget coordinates.
+        :type point: QPointF
+        :return: Returns the corresponding point in scene coordinates.
+        :rtype: QPointF
+        """
+        scale = self._scale()
+        origin = self._view.scene().sceneRect().topLeft()
+
+        return QPointF(point.x() / scale, point.y() / scale) + origin
+
+    def map_from_scene(self, rect):
+        """
+        :param rect: Rectangle in scene coordinates.
+        :type rect: QRectF
+        :return: Returns the corresponding rectangle in widget coordinates.
+        :rtype: QRectF
+        """
+        scale = self._scale()
+        origin = self._view.scene().sceneRect().topLeft()
+        rect = rect.translated(-origin)
+
+        return QRectF(
+            rect.x() * scale,
+            rect.y() * scale,
+            rect.width() * scale,
+            rect.height() * scale
+        )
+
+    def viewport_rect(self):
+        """
+        :return: Returns the area of the scene shown by the view in widget
+        coordinates.
+        :rtype: QRectF
+        """
+        view_rect = self._view.mapToScene(
+            self._view.viewport().rect()
+        ).boundingRect()
+
+        return self.map_from_scene(view_rect).intersected(
+            self._target_rect()
+        )
+
+    def _render_regions(self, regions):
+        #Renders the given scene regions onto the cached pixmap
+        painter = QPainter(self._cache)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        scene = self._view.scene()
+
+        for region in regions:
+            target = self.map_from_scene(region).toAlignedRect()
+            target = target.adjusted(-1, -1, 1, 1).intersected(
+                self._cache.rect()
+            )
+            if target.isEmpty():
+                continue
+
+            #Map back to the scene so source and target match exactly
+            source = QRectF(
+                self.map_to_scene(QPointF(target.topLeft())),
+                self.map_to_scene(QPointF(target.bottomRight()) +
+                                  QPointF(1, 1))
+            )
+
+            painter.setClipRect(target)
+            painter.fillRect(target, self.background)
+            scene.render(painter, QRectF(target), source)
+
+        painter.end()
+
+    def _rebuild_cache(self):
+        #Renders the whole scene
+        size = self._target_rect().size().toSize()
+        if size.isEmpty():
+            self._cache = None
+
+            return
+
+        self._cache = QPixmap(size)
+        self._render_regions([self._view.scene().sceneRect()])
+
+    def _on_scene_changed(self, regions):
+        #Only render the regions that have changed
+        if self._cache is None:
+            return
+
+        self._render_regions(regions)
+        self.update()
 
-        #In metres
-        dpm = self._resolution_in_m(resolution)
+    def _on_scene_rect_changed(self, rect):
+        self._rebuild_cache()
+        self.update()
 
-        image_size = self.image_size(resolution)
+    def resizeEvent(self, event):
+        self._rebuild_cache()
+        super(ProfileTenureMinimap, self).resizeEvent(event)
 
-        img = QImage(
-            image_size.width(),
-            image_size.height(),
-            QImage.Format_ARGB32
-        )
-        img.setDotsPerMeterX(int(dpm))
-        img.setDotsPerMeterY(int(dpm))
-        img.fill(background)
+    def paintEvent(self, event):
+        if self._cache is None:
+            self._rebuild_cache()
+        if self._cache is None:
+            return
 
-        painter = QPainter(img)
-        painter.setRenderHint(QPainter.Antialiasing, True)
-        self.scene().render(painter)
-        painter.end()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._cache)
 
-        return img
+        #Draw visible area of the view
+        painter.setPen(self.viewport_pen)
+        painter.setBrush(self.viewport_brush)
+        painter.drawRect(self.viewport_rect())
+        painter.end()
 
-    def valid(self):
-        """
-        :return: Returns False if the respective party and spatial unit
-        entities have not been set. Otherwise True.
-        :rtype: bool
-        """
-        if len(self._party_items) == 0:
-            return False
+    def _pan_to(self, pos):
+        #Centers the view on the scene point under pos
+        self._view.centerOn(self.map_to_scene(QPointF(pos)))
 
-        if self._sp_unit_renderer.entity is None:
-            return False
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._pan_to(event.pos())
 
-        return True
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self._pan_to(event.pos())
 
     def minimumSizeHint(self):
-        return QSize(480, 270)
+        return QSize(96, 54)
 
     def sizeHint(self):
-        return QSize(560, 315)
+        return QSize(160, 90)
 
 
 class ProfileTenureDiagram(QWidget):
@@ -1575,10 +5896,20 @@ class ProfileTenureDiagram(QWidget):
     It provides controls for zooming, adding text and exporting the view to
     an image file, and wraps most of the ProfileTenureView functionality.
     """
-    def __init__(self, parent=None, profile=None):
+    def __init__(self, parent=None, profile=None, scene=None):
+        """
+        Class constructor.
+        :param parent: Parent widget.
+        :type parent: QWidget
+        :param profile: Profile object to be rendered.
+        :type profile: Profile
+        :param scene: Existing scene to attach the diagram's view to. See
+        ProfileTenureView.
+        :type scene: ProfileTenureScene
+        """
         super(ProfileTenureDiagram, self).__init__(parent)
 
-        self._profile_view = ProfileTenureView(self, profile)
+        self._profile_view = ProfileTenureView(self, profile, scene)
         self.set_scene_mode(ProfileTenureScene.MoveItem)
         self._profile_view.scene().annotation_inserted.connect(
             self.on_annotation_inserted
@@ -1587,6 +5918,20 @@ class ProfileTenureDiagram(QWidget):
         self._setup_widgets()
         self._current_zoom_factor = 1.0
 
+        #Keep the zoom combo in sync with wheel and pinch zoom
+        self._profile_view.zoom_changed.connect(self._on_view_zoom_changed)
+        self._profile_view.visible_area_changed.connect(
+            self._on_visible_area_changed
+        )
+
+    def scene(self):
+        """
+        :return: Returns the scene rendered by the diagram. It can be passed
+        to other views or diagrams to share the same items.
+        :rtype: ProfileTenureScene
+        """
+        return self._profile_view.scene()
+
     def scene_mode(self):
         """
         :return: Returns the current state of the scene.
@@ -1655,11 +6000,42 @@ class ProfileTenureDiagram(QWidget):
         self.zoom_cbo.addItem(self.tr('125%'), 125 / 100.0)
         self.zoom_cbo.addItem(self.tr('150%'), 150 / 100.0)
         self.zoom_cbo.setCurrentIndex(2)
+        self._preset_zoom_levels = self.zoom_cbo.count()
         self.zoom_cbo.currentIndexChanged.connect(self.on_zoom_changed)
-        self.layout.addWidget(self.zoom_cbo, 0, 5, 1, 1)
+
+        self.fit_contents = QToolButton(self)
+        self.fit_contents.setMinimumSize(QSize(24, 24))
+        self.fit_contents.setText(self.tr('Fit'))
+        self.fit_contents.setToolTip(self.tr('Fit to Contents'))
+        self.fit_contents.clicked.connect(self.fit_to_contents)
+
+        #The zoom controls share the last column spanned by the view so
+        # that the minimap column is left free
+        zoom_layout = QHBoxLayout()
+        zoom_layout.addWidget(self.zoom_cbo)
+        zoom_layout.addWidget(self.fit_contents)
+        self.layout.addLayout(zoom_layout, 0, 5, 1, 1)
 
         self.layout.addWidget(self._profile_view, 1, 0, 1, 6)
 
+        #Created on demand
+        self._minimap = None
+
+    def set_minimap_visible(self, visible):
+        """
+        Shows or hides the overview minimap next to the view.
+        :param visible: True to show the minimap, otherwise False.
+        :type visible: bool
+        """
+        if self._minimap is None:
+            if not visible:
+                return
+
+            self._minimap = ProfileTenureMinimap(self._profile_view, self)
+            self.layout.addWidget(self._minimap, 1, 6, 1, 1, Qt.AlignTop)
+
+        self._minimap.setVisible(visible)
+
     def minimumSizeHint(self):
         return QSize(500, 320)
 
@@ -1734,10 +6110,53 @@ class ProfileTenureDiagram(QWidget):
         #TODO: Remove conversion from QVariant
         factor, status = self.zoom_cbo.itemData(idx).toFloat()
 
-        #Compute relative scale
-        scale = factor / self._current_zoom_factor
-        self.scale(scale)
+        self._profile_view.zoom_to(factor)
+
+    def _on_visible_area_changed(self):
+        #Tracks the zoom factor on each step of an animated zoom, and syncs
+        # the zoom levels when the view is scaled directly. The levels of
+        # an animated zoom are synced once it settles, see zoom_changed.
+        factor = self._profile_view.zoom_factor()
+        if factor == self._current_zoom_factor:
+            return
+
         self._current_zoom_factor = factor
+        if not self._profile_view.is_zooming():
+            self._on_view_zoom_changed(factor)
+
+    def _on_view_zoom_changed(self, factor):
+        #Selects the zoom level matching the factor of the view, a custom
+        # level is shown after the preset ones if there is no match.
+        self._current_zoom_factor = factor
+        idx = -1
+
+        for i in range(self.zoom_cbo.count()):
+            level, status = self.zoom_cbo.itemData(i).toFloat()
+            if abs(level - factor) < 0.005:
+                idx = i
+                break
+
+        self.zoom_cbo.blockSignals(True)
+
+        if idx == -1:
+            idx = self._preset_zoom_levels
+            text = u'{0:.0f}%'.format(factor * 100)
+
+            if self.zoom_cbo.count() == idx:
+                self.zoom_cbo.addItem(text, factor)
+            else:
+                self.zoom_cbo.setItemText(idx, text)
+                self.zoom_cbo.setItemData(idx, factor)
+
+        self.zoom_cbo.setCurrentIndex(idx)
+        self.zoom_cbo.blockSignals(False)
+
+    def fit_to_contents(self):
+        """
+        Zooms and scrolls the view so that all the tenure items are
+        visible.
+        """
+        self._profile_view.fit_to_contents()
 
     def scale(self, factor):
         """
@@ -1748,6 +6167,7 @@ class ProfileTenureDiagram(QWidget):
         if factor <= 0:
             return
 
+        self._profile_view.notify_interaction()
         self._profile_view.scale(factor, factor)
 
     def valid(self):
@@ -1805,6 +6225,32 @@ class ProfileTenureDiagram(QWidget):
         """
         return self._profile_view.remove_party(name)
 
+    def collapse_parties(self, name, party_names=None):
+        """
+        Collapses existing party items into a group item.
+        :param name: Name of the group.
+        :type name: str
+        :param party_names: Names of the parties to collapse. All party
+        items are collapsed if not specified.
+        :type party_names: list
+        :return: Returns the group item or None if there were no party items
+        to collapse.
+        :rtype: PartyGroupItem
+        """
+        return self._profile_view.collapse_parties(name, party_names)
+
+    def expand_party_group(self, name):
+        """
+        Replaces a group item with individual items for each of its
+        parties.
+        :param name: Name of the group.
+        :type name: str
+        :return: Returns True if the group was expanded, otherwise False if
+        there is no group with the given name.
+        :rtype: bool
+        """
+        return self._profile_view.expand_party_group(name)
+
     @property
     def profile(self):
         """
@@ -1823,10 +6269,621 @@ class ProfileTenureDiagram(QWidget):
         self._profile_view.profile = profile
 
 
-class Entity(object):
+class ProfileReportWriter(object):
+    """
+    Exports the social tenure relationship diagrams of several profiles to a
+    single PDF document, one page per profile. A single view and scene are
+    reused for all the pages; only the entities are swapped between pages.
+    Each page is flushed to the file once the next one is started hence
+    memory use does not grow with the number of profiles.
+    """
+    def __init__(self, view=None):
+        """
+        Class constructor.
+        :param view: View used for rendering the profiles. Its profile and
+        party entities are restored once the report has been written. An
+        off-screen view is created if not specified.
+        :type view: ProfileTenureView
+        """
+        self._view = view
+        if self._view is None:
+            self._view = ProfileTenureView()
+
+    @property
+    def view(self):
+        """
+        :return: Returns the view used for rendering the profiles.
+        :rtype: ProfileTenureView
+        """
+        return self._view
+
+    def _profile_parties(self, profile):
+        #Returns the party entities in the profile's social tenure
+        if profile is None:
+            return []
+
+        str_ent = profile.social_tenure
+        parties = getattr(str_ent, 'parties', None)
+
+        if parties is None:
+            party = getattr(str_ent, 'party', None)
+            parties = [] if party is None else [party]
+
+        return list(parties)
+
+    def _set_profile(self, profile, parties, spatial_unit):
+        #Swaps the entities rendered by the view, clearing the items of the
+        # previous profile that are not replaced
+        if profile is None:
+            self._view.clear_profile()
+        else:
+            self._view.profile = profile
+
+        if spatial_unit is None:
+            self._view.invalidate_spatial_unit()
+        else:
+            self._view.set_spatial_unit(spatial_unit)
+
+        self._view.set_party_entities(parties)
+
+    def write(self, profiles, path, resolution=300):
+        """
+        Writes the diagrams of the given profiles to a PDF file using A4
+        landscape pages.
+        :param profiles: Iterable of profile objects. It is consumed lazily
+        so a generator can be used for large sets of profiles.
+        :type profiles: iterable
+        :param path: Absolute path of the PDF file.
+        :type path: str
+        :param resolution: Resolution of the document in dpi. Default is 300.
+        :type resolution: int
+        :return: Returns True if the operation succeeded, otherwise False. If
+        False then a corresponding message is returned as well.
+        :rtype: (bool, str)
+        """
+        printer = QPrinter(QPrinter.HighResolution)
+        printer.setOutputFormat(QPrinter.PdfFormat)
+        printer.setOutputFileName(path)
+        printer.setPaperSize(QPrinter.A4)
+        printer.setOrientation(QPrinter.Landscape)
+        printer.setFullPage(True)
+        printer.setResolution(resolution)
+
+        init_profile = self._view.profile
+        init_parties = self._view.party_entities()
+        init_spatial_unit = self._view.spatial_unit()
+
+        painter = QPainter()
+        if not painter.begin(printer):
+            msg = QApplication.translate(
+                'ProfileReportWriter',
+                'The PDF file cannot be saved in the specified location.'
+            )
+
+            return False, msg
+
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setRenderHint(QPainter.TextAntialiasing, True)
+
+        status, msg = True, ''
+
+        try:
+            page_rect = QRectF(0, 0, printer.width(), printer.height())
+            scene = self._view.scene()
+
+            for i, profile in enumerate(profiles):
+                #Flushes the previous page to the file
+                if i > 0 and not printer.newPage():
+                    status = False
+                    msg = QApplication.translate(
+                        'ProfileReportWriter',
+                        'A new page could not be added to the PDF file.'
+                    )
+
+                    break
+
+                spatial_unit = None
+                if not profile is None:
+                    spatial_unit = profile.social_tenure.spatial_unit
+
+                self._set_profile(
+                    profile,
+                    self._profile_parties(profile),
+                    spatial_unit
+                )
+                scene.render(painter, page_rect)
+
+        finally:
+            painter.end()
+            self._set_profile(init_profile, init_parties, init_spatial_unit)
+
+        return status, msg
+
+
+class Entity(EntityObservable):
     def __init__(self, name):
         self.short_name = name
-        self.columns = {}
+        self.columns = OrderedDict()
+
+    def add_column(self, name, column=None):
+        """
+        Adds a column and notifies observers.
+        :param name: Column name.
+        :type name: str
+        :param column: Column object.
+        :type column: object
+        """
+        exists = name in self.columns
+        self.columns[name] = column
+
+        if not exists:
+            self.notify_observers(EntityObservable.ColumnAdded, None, name)
+
+    def remove_column(self, name):
+        """
+        Removes a column and notifies observers.
+        :param name: Column name.
+        :type name: str
+        :return: Returns True if the column was removed, otherwise False.
+        :rtype: bool
+        """
+        if not name in self.columns:
+            return False
+
+        del self.columns[name]
+        self.notify_observers(EntityObservable.ColumnRemoved, name, None)
+
+        return True
+
+    def rename_column(self, old_name, new_name):
+        """
+        Renames a column and notifies observers.
+        :param old_name: Current column name.
+        :type old_name: str
+        :param new_name: New column name.
+        :type new_name: str
+        :return: Returns True if the column was renamed, otherwise False.
+        :rtype: bool
+        """
+        if not old_name in self.columns or new_name in self.columns:
+            return False
+
+        #Preserve the position of the column
+        self.columns = OrderedDict(
+            (new_name if k == old_name else k, v)
+            for k, v in self.columns.items()
+        )
+        self.notify_observers(
+            EntityObservable.ColumnRenamed,
+            old_name,
+            new_name
+        )
+
+        return True
+
+
+class ValueList(EntityObservable):
+    def __init__(self, name, values=None):
+        self.name = name
+        self.values = list(values or [])
+        #Incremented whenever the lookup values change
+        self.version = 0
+
+    def lookups(self):
+        """
+        :return: Returns the lookup values.
+        :rtype: list
+        """
+        return list(self.values)
+
+    def add_value(self, value):
+        """
+        Adds a lookup value and notifies observers.
+        :param value: Lookup value.
+        :type value: str
+        """
+        self.values.append(value)
+        self.version += 1
+        self.notify_observers(EntityObservable.LookupAdded, None, value)
+
+    def remove_value(self, value):
+        """
+        Removes a lookup value and notifies observers.
+        :param value: Lookup value.
+        :type value: str
+        :return: Returns True if the value was removed, otherwise False.
+        :rtype: bool
+        """
+        if not value in self.values:
+            return False
+
+        self.values.remove(value)
+        self.version += 1
+        self.notify_observers(EntityObservable.LookupRemoved, value, None)
+
+        return True
+
+    def rename_value(self, old_value, new_value):
+        """
+        Renames a lookup value and notifies observers.
+        :param old_value: Current lookup value.
+        :type old_value: str
+        :param new_value: New lookup value.
+        :type new_value: str
+        :return: Returns True if the value was renamed, otherwise False.
+        :rtype: bool
+        """
+        if not old_value in self.values:
+            return False
+
+        self.values[self.values.index(old_value)] = new_value
+        self.version += 1
+        self.notify_observers(
+            EntityObservable.LookupRenamed,
+            old_value,
+            new_value
+        )
+
+        return True
+
+class SqliteColumnSource(object):
+    """
+    Data source that reads the column names of a table in an SQLite
+    database one page at a time.
+    """
+    def __init__(self, database, table):
+        """
+        Class constructor.
+        :param database: Path to the database file or an open connection.
+        :type database: str or sqlite3.Connection
+        :param table: Name of the table whose columns will be read.
+        :type table: str
+        """
+        if isinstance(database, sqlite3.Connection):
+            self._connection = database
+        else:
+            self._connection = sqlite3.connect(database)
+
+        self.table = table
+        self._count = None
+
+    def column_count(self):
+        """
+        :return: Returns the number of columns in the table.
+        :rtype: int
+        """
+        if self._count is None:
+            try:
+                cursor = self._connection.execute(
+                    'SELECT COUNT(*) FROM pragma_table_info(?)',
+                    (self.table,)
+                )
+                self._count = cursor.fetchone()[0]
+            except sqlite3.OperationalError:
+                #Table-valued pragma functions require SQLite 3.16
+                self._count = len(self._table_info())
+
+        return self._count
+
+    def column_names(self, offset, limit):
+        """
+        :param offset: Position of the first column to be read.
+        :type offset: int
+        :param limit: Maximum number of columns to read.
+        :type limit: int
+        :return: Returns the names of the columns in the given range.
+        :rtype: list
+        """
+        try:
+            cursor = self._connection.execute(
+                'SELECT name FROM pragma_table_info(?) ORDER BY cid '
+                'LIMIT ? OFFSET ?',
+                (self.table, limit, offset)
+            )
+
+            return [row[0] for row in cursor.fetchall()]
+
+        except sqlite3.OperationalError:
+            rows = self._table_info()[offset:offset + limit]
+
+            return [row[1] for row in rows]
+
+    def _table_info(self):
+        #Table names cannot be bound as parameters in PRAGMA statements
+        table = self.table.replace('"', '""')
+        cursor = self._connection.execute(
+            'PRAGMA table_info("{0}")'.format(table)
+        )
+
+        return cursor.fetchall()
+
+
+class LazyColumnEntity(EntityObservable):
+    """
+    Entity adapter that loads the column names from a data source one page
+    at a time. The first page is loaded when the entity is created so that
+    it can be rendered immediately, and the remaining pages can be fetched
+    in the background through the event loop, which entity items do once
+    the entity is set. Observers are notified once per loaded page.
+    """
+    def __init__(self, name, source, page_size=50):
+        """
+        Class constructor.
+        :param name: Short name of the entity.
+        :type name: str
+        :param source: Data source with column_count and column_names
+        methods e.g. SqliteColumnSource.
+        :type source: object
+        :param page_size: Number of columns loaded per page.
+        :type page_size: int
+        """
+        self.short_name = name
+        self.source = source
+        self.page_size = page_size
+        self.columns = OrderedDict()
+        self._loading = False
+
+        self.load_next_page()
+
+    @property
+    def fully_loaded(self):
+        """
+        :return: Returns True if all the columns have been loaded.
+        :rtype: bool
+        """
+        return len(self.columns) >= self.source.column_count()
+
+    def load_next_page(self):
+        """
+        Loads the next page of columns from the data source.
+        :return: Returns the number of columns loaded.
+        :rtype: int
+        """
+        names = self.source.column_names(len(self.columns), self.page_size)
+
+        added = []
+        for name in names:
+            if name in self.columns:
+                continue
+
+            self.columns[name] = None
+            added.append(name)
+
+        if len(added) > 0:
+            self.notify_observers(
+                EntityObservable.ColumnsAdded, None, tuple(added)
+            )
+
+        return len(names)
+
+    def load_remaining(self):
+        """
+        Loads the remaining pages in the background, one page per event
+        loop iteration, so that the user interface remains responsive.
+        """
+        if self._loading or self.fully_loaded:
+            return
+
+        self._loading = True
+        QTimer.singleShot(0, self._load_page_deferred)
+
+    def _load_page_deferred(self):
+        #Loads a page and schedules the next one
+        if self.load_next_page() == 0 or self.fully_loaded:
+            self._loading = False
+
+            return
+
+        QTimer.singleShot(0, self._load_page_deferred)
+
+
+class LookupColumn(object):
+    def __init__(self, name, value_list):
+        self.name = name
+        self.value_list = value_list
+
+
+class SupportingDocument(object):
+    def __init__(self, doc_type):
+        self.doc_type = doc_type
+
+
+class SocialTenure(object):
+    def __init__(self, parties, spatial_unit, tenure_type_lookup,
+                 supporting_doc):
+        self.parties = list(parties)
+        self.party = self.parties[0] if len(self.parties) > 0 else None
+        self.spatial_unit = spatial_unit
+        self.tenure_type_lookup = tenure_type_lookup
+        self.supporting_doc = supporting_doc
+
+
+class Profile(object):
+    def __init__(self, name, description=''):
+        self.name = name
+        self.description = description
+        self.entities = OrderedDict()
+        self.value_lists = OrderedDict()
+        self.social_tenure = None
+
+
+class ProfileConfigurationReader(object):
+    """
+    Streams profiles from an STDM configuration file. The file is read
+    incrementally and each profile is discarded from the document tree once
+    it has been yielded, hence memory use does not grow with the size of the
+    file. The profiles can be used with ProfileTenureView.profile while the
+    party and spatial unit entities, in the social tenure, can be used with
+    add_party_entity and set_spatial_unit respectively.
+    The following subset of the configuration is read:
+    <Configuration>
+      <Profile name="" description="">
+        <Entities>
+          <Entity name="" shortName="">
+            <Columns>
+              <Column name=""/>
+            </Columns>
+          </Entity>
+        </Entities>
+        <ValueLists>
+          <ValueList name="">
+            <CodeValue value="" code=""/>
+          </ValueList>
+        </ValueLists>
+        <SocialTenure party="" spatialUnit="" tenureTypeList=""
+                      documentTypeList=""/>
+      </Profile>
+    </Configuration>
+    Multiple parties are separated by commas and can be referenced using
+    either the name or short name of the entity.
+    """
+    def __init__(self, path):
+        """
+        Class constructor.
+        :param path: Path to the configuration file or a file-like object.
+        :type path: str
+        """
+        self.path = path
+
+    def __iter__(self):
+        return self.profiles()
+
+    def profile(self, name):
+        """
+        Reads the configuration up to the profile with the given name.
+        :param name: Name of the profile.
+        :type name: str
+        :return: Returns the profile object or None if not found.
+        :rtype: Profile
+        """
+        for p in self.profiles():
+            if p.name == name:
+                return p
+
+        return None
+
+    def profiles(self):
+        """
+        Reads the profiles in the configuration file.
+        :return: Returns a generator that yields one profile at a time.
+        :rtype: generator
+        """
+        root = None
+        profile = None
+        entity = None
+        value_list = None
+        str_attrs = None
+
+        for event, elem in ElementTree.iterparse(
+                self.path, events=('start', 'end')):
+            tag = elem.tag
+
+            if event == 'start':
+                if root is None:
+                    root = elem
+                elif tag == 'Profile':
+                    profile = Profile(
+                        elem.get('name', ''),
+                        elem.get('description', '')
+                    )
+                elif tag == 'Entity' and not profile is None:
+                    name = elem.get('name', '')
+                    entity = Entity(elem.get('shortName', name))
+                    entity.name = name
+                elif tag == 'ValueList' and not profile is None:
+                    value_list = ValueList(elem.get('name', ''))
+
+                continue
+
+            if profile is None:
+                continue
+
+            if tag == 'Column' and not entity is None:
+                entity.columns[elem.get('name', '')] = None
+                elem.clear()
+
+            elif tag == 'CodeValue' and not value_list is None:
+                value_list.values.append(elem.get('value', ''))
+                elem.clear()
+
+            elif tag == 'Entity' and not entity is None:
+                profile.entities[entity.name] = entity
+                entity = None
+                elem.clear()
+
+            elif tag == 'ValueList' and not value_list is None:
+                profile.value_lists[value_list.name] = value_list
+                value_list = None
+                elem.clear()
+
+            elif tag == 'SocialTenure':
+                str_attrs = dict(elem.attrib)
+                elem.clear()
+
+            elif tag == 'Profile':
+                profile.social_tenure = self._social_tenure(
+                    profile,
+                    str_attrs or {}
+                )
+                yield profile
+
+                profile = None
+                str_attrs = None
+
+                #Discard the profile from the document tree
+                elem.clear()
+                root.clear()
+
+    def _entity(self, profile, name):
+        #Get entity using either the name or short name
+        name = name.strip()
+        entity = profile.entities.get(name, None)
+        if not entity is None:
+            return entity
+
+        for e in profile.entities.values():
+            if e.short_name == name:
+                return e
+
+        return None
+
+    def _value_list(self, profile, name):
+        #Empty value list is returned if not found
+        value_list = profile.value_lists.get(name, None)
+        if value_list is None:
+            value_list = ValueList(name)
+
+        return value_list
+
+    def _social_tenure(self, profile, attrs):
+        #Creates the social tenure object from the element's attributes
+        parties = []
+        for name in attrs.get('party', '').split(','):
+            party = self._entity(profile, name)
+            if not party is None:
+                parties.append(party)
+
+        spatial_unit = self._entity(profile, attrs.get('spatialUnit', ''))
+
+        tenure_list = attrs.get('tenureTypeList', '')
+        tenure_type_lookup = LookupColumn(
+            'tenure_type',
+            self._value_list(profile, tenure_list)
+        )
+
+        doc_list = attrs.get('documentTypeList', '')
+        doc_type = LookupColumn(
+            'document_type',
+            self._value_list(profile, doc_list)
+        )
+
+        return SocialTenure(
+            parties,
+            spatial_unit,
+            tenure_type_lookup,
+            SupportingDocument(doc_type)
+        )
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
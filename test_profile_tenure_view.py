@@ -16,14 +16,59 @@ email                : gkahiu at gmail dot com
  *                                                                         *
  ***************************************************************************/
 """
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
 import sys
+import tempfile
+import time
 import unittest
 from unittest import TestCase
 
-from PyQt4.QtGui import QApplication
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from PyQt4.QtCore import QEvent, QPoint, QPointF, QRectF, QSize, Qt
+from PyQt4.QtGui import (
+    QApplication,
+    QGraphicsItem,
+    QImage,
+    QMouseEvent,
+    QPainter
+)
 from PyQt4.QtTest import QTest
 
-from profile_tenure_view import ProfileTenureView
+from profile_tenure_view import (
+    Annotation,
+    Arrow,
+    ArrowRouter,
+    DiagramStateStore,
+    Entity,
+    EntityItemPool,
+    LazyColumnEntity,
+    LookupCache,
+    LookupColumn,
+    Profile,
+    ProfileConfigurationReader,
+    ProfileReportWriter,
+    ProfileTenureDiagram,
+    ProfileTenureMinimap,
+    ProfileTenureModel,
+    ProfileTenureView,
+    RenderCache,
+    SocialTenure,
+    SqliteColumnSource,
+    SupportingDocument,
+    ValueList,
+    lookup_cache,
+    update_arrow_positions
+)
 
 app = QApplication(sys.argv)
 
@@ -36,5 +81,1100 @@ class TestProfileTenureView(TestCase):
         status  =True
         self.assertTrue(status)
 
+    def test_scene_digest_changes_with_content(self):
+        digest = self.tenure_view.scene_digest(96)
+        self.assertEqual(digest, self.tenure_view.scene_digest(96))
+        self.assertNotEqual(digest, self.tenure_view.scene_digest(300))
+
+        party = Entity('Farmer')
+        party.columns['first_name'] = 'FN'
+        self.tenure_view.add_party_entity(party)
+        self.assertNotEqual(digest, self.tenure_view.scene_digest(96))
+
+    def test_entity_item_digest_with_render_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.tenure_view.render_cache = RenderCache(cache_dir)
+
+        party = Entity('Farmer')
+        party.columns['first_name'] = 'FN'
+        self.tenure_view.add_party_entity(party)
+        self.tenure_view.set_spatial_unit(Entity('Parcel'))
+        p_item = self.tenure_view._party_items['Farmer']
+        self.assertEqual(p_item.items, ['first_name'])
+
+        digest = self.tenure_view.scene_digest(96, 'PNG')
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir)
+        path = os.path.join(out_dir, 'view.png')
+        self.assertTrue(self.tenure_view.save_image_to_file(path, 96)[0])
+        self.assertIsNotNone(
+            self.tenure_view.render_cache.lookup(digest, 'PNG')
+        )
+
+    def test_thumbnail_pyramid(self):
+        pyramid = self.tenure_view.thumbnail_pyramid((64, 256))
+        self.assertEqual(sorted(pyramid.keys()), [64, 256])
+
+        for size, img in pyramid.items():
+            self.assertEqual(max(img.width(), img.height()), size)
+
+        #Unchanged scene is served from the cache
+        self.assertIs(self.tenure_view.thumbnail(64), pyramid[64])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_image_array_renders_into_buffer(self):
+        size = self.tenure_view.image_size(72)
+        out = numpy.zeros((size.height(), size.width(), 4), numpy.uint8)
+        arr = self.tenure_view.image_array(72, out=out)
+
+        self.assertIs(arr, out)
+        #Opaque white background
+        self.assertEqual(list(arr[0, 0]), [255, 255, 255, 255])
+
+    def test_unchanged_entity_is_not_reloaded(self):
+        party = Entity('Farmer')
+        party.columns['first_name'] = 'FN'
+        self.tenure_view.add_party_entity(party)
+        p_item = self.tenure_view._party_items['Farmer']
+        items = p_item.items
+
+        same = Entity('Farmer')
+        same.columns['first_name'] = 'FN'
+        self.tenure_view.set_party_entities([same])
+
+        self.assertIs(self.tenure_view._party_items['Farmer'], p_item)
+        self.assertIs(p_item.items, items)
+
+        same.columns['last_name'] = 'LN'
+        p_item.entity = same
+        self.assertEqual(sorted(p_item.items), ['first_name', 'last_name'])
+
+    def test_entity_changes_patch_items(self):
+        party = Entity('Farmer')
+        party.add_column('first_name')
+        self.tenure_view.add_party_entity(party)
+        p_item = self.tenure_view._party_items['Farmer']
+
+        party.add_column('gender')
+        party.rename_column('first_name', 'given_name')
+        self.assertEqual(p_item.items, ['given_name', 'gender'])
+
+        party.remove_column('gender')
+        self.assertEqual(p_item.items, ['given_name'])
+
+        #Removed items no longer observe the entity
+        self.tenure_view.remove_party('Farmer')
+        party.add_column('age')
+        self.assertNotIn('age', p_item.items)
+
+    def test_shared_scene(self):
+        side_view = ProfileTenureView(scene=self.tenure_view.scene())
+        party = Entity('Farmer')
+        self.tenure_view.add_party_entity(party)
+
+        self.assertIs(side_view.scene(), self.tenure_view.scene())
+        self.assertIn('Farmer', side_view._party_items)
+
+        #Each view keeps its own zoom
+        side_view.scale(0.5, 0.5)
+        self.assertEqual(self.tenure_view.transform().m11(), 1.0)
+
+    def test_item_caching_is_shared(self):
+        side_view = ProfileTenureView(scene=self.tenure_view.scene())
+        str_item = self.tenure_view._str_item
+
+        self.tenure_view.zoom_to(2.0)
+        side_view.zoom_to(0.5)
+        self.assertEqual(str_item.cacheMode(),
+                         QGraphicsItem.ItemCoordinateCache)
+
+        #The cache is kept until both views have settled
+        self.tenure_view.zoom_to(2.0, animate=False)
+        self.assertEqual(str_item.cacheMode(),
+                         QGraphicsItem.ItemCoordinateCache)
+
+        side_view.zoom_to(0.5, animate=False)
+        self.assertEqual(str_item.cacheMode(), QGraphicsItem.NoCache)
+
+    def test_items_leaving_during_zoom_are_not_cached(self):
+        view = self.tenure_view
+        view.add_party_entity(Entity('Farmer'))
+        p_item = view._party_items['Farmer']
+
+        view.zoom_to(2.0)
+        self.assertEqual(p_item.cacheMode(),
+                         QGraphicsItem.ItemCoordinateCache)
+
+        #The pooled item is reused without the cache
+        view.remove_party('Farmer')
+        self.assertEqual(p_item.cacheMode(), QGraphicsItem.NoCache)
+        view.zoom_to(2.0, animate=False)
+
+        view.add_party_entity(Entity('Trader'))
+        self.assertIs(view._party_items['Trader'], p_item)
+        self.assertEqual(p_item.cacheMode(), QGraphicsItem.NoCache)
+
+    def test_arrow_bounds_follow_items(self):
+        party = Entity('Farmer')
+        self.tenure_view.add_party_entity(party)
+        p_item = self.tenure_view._party_items['Farmer']
+        arrow = p_item.arrows[0]
+
+        p_item.setPos(-400, 20)
+        bounds = arrow.mapRectToScene(arrow.boundingRect())
+        self.assertTrue(bounds.contains(arrow.mapToScene(arrow.line().p1())))
+        self.assertLess(bounds.left(), -200)
+
+        #Overlapping items are not connected by a visible arrow
+        p_item.setPos(self.tenure_view._str_item.pos())
+        self.assertTrue(arrow.overlapping)
+        self.assertTrue(arrow.boundingRect().isEmpty())
+
+        p_item.setPos(-400, 20)
+        self.assertFalse(arrow.overlapping)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_batch_arrow_update_matches_individual(self):
+        for name, x in (('Farmer', -300), ('Trader', 100)):
+            self.tenure_view.add_party_entity(Entity(name))
+            self.tenure_view._party_items[name].setPos(x, 300)
+
+        arrows = self.tenure_view._str_item.arrows
+        expected = [(ar.line(), list(ar.arrow_points)) for ar in arrows]
+
+        update_arrow_positions(arrows)
+
+        for ar, (line, points) in zip(arrows, expected):
+            self.assertAlmostEqual(ar.line().x1(), line.x1(), 3)
+            self.assertAlmostEqual(ar.line().y2(), line.y2(), 3)
+            self.assertAlmostEqual(
+                ar.arrow_points[0].x(), points[0].x(), 3
+            )
+
+    def test_arrow_shape_is_cached(self):
+        self.tenure_view.add_party_entity(Entity('Farmer'))
+        p_item = self.tenure_view._party_items['Farmer']
+        p_item.setPos(-400, 20)
+        arrow = p_item.arrows[0]
+
+        shape = arrow.shape()
+        self.assertIs(arrow.shape(), shape)
+
+        self.tenure_view.scene().set_arrow_hit_test_mode(Arrow.LooseHitTest)
+        loose_shape = arrow.shape()
+        self.assertIsNot(loose_shape, shape)
+        self.assertTrue(loose_shape.contains(arrow.line().pointAt(0.5)))
+
+        #Moving an item rebuilds the shape
+        p_item.setPos(-500, 20)
+        self.assertIsNot(arrow.shape(), loose_shape)
+
+    def test_arrows_are_routed_around_items(self):
+        scene = self.tenure_view.scene()
+        scene.set_router(ArrowRouter())
+        self.tenure_view.set_spatial_unit(Entity('Parcel'))
+        self.tenure_view.add_party_entity(Entity('Farmer'))
+
+        #The spatial unit item lies between the party and social tenure
+        # items
+        p_item = self.tenure_view._party_items['Farmer']
+        p_item.setPos(800, 20)
+        arrow = p_item.arrows[0]
+        self.assertGreater(len(arrow.route), 2)
+
+        sp_rect = self.tenure_view._sp_item.scene_bounding_rect()
+        self.assertFalse(arrow.mapToScene(arrow.path()).intersects(sp_rect))
+
+        #Moving the obstacle away reroutes the arrow
+        self.tenure_view._sp_item.setPos(600, 400)
+        self.assertEqual(arrow.route, [])
+
+        #Removing an obstacle reroutes the arrows that went around it
+        self.tenure_view.add_party_entity(Entity('Trader'))
+        self.tenure_view._party_items['Trader'].setPos(600, 20)
+        self.assertGreater(len(arrow.route), 2)
+        self.tenure_view.remove_party('Trader')
+        self.assertEqual(arrow.route, [])
+
+        scene.set_router(None)
+        self.assertIsNone(scene.router())
+
+    def test_party_groups(self):
+        view = self.tenure_view
+        view.max_party_items = 2
+        for name in ('Farmer', 'Trader', 'Miner', 'Herder'):
+            view.add_party_entity(Entity(name))
+
+        #Parties beyond the maximum are collapsed into the default group
+        self.assertEqual(sorted(view._party_items.keys()),
+                         ['Farmer', 'Trader'])
+        group = view.party_groups()[0]
+        self.assertEqual(sorted(p.short_name for p in group.members()),
+                         ['Herder', 'Miner'])
+        self.assertEqual(len(group.arrows), 1)
+        self.assertEqual(len(view.party_entities()), 4)
+
+        group = view.collapse_parties('Crop')
+        self.assertEqual(len(view._party_items), 0)
+        self.assertEqual(len(view.party_groups()), 2)
+        self.assertTrue(view.has_party('Farmer'))
+
+        self.assertTrue(view.remove_party('Farmer'))
+        self.assertEqual(group.items, ['Trader'])
+
+        self.assertTrue(view.expand_party_group('Crop'))
+        self.assertIn('Trader', view._party_items)
+        self.assertEqual(len(view.party_groups()), 1)
+        self.assertFalse(view.expand_party_group('Crop'))
+
+    def test_groups_round_trip_through_model(self):
+        view = self.tenure_view
+        self.assertFalse(view.valid())
+
+        view.set_spatial_unit(Entity('Parcel'))
+        for name in ('Farmer', 'Trader', 'Miner'):
+            view.add_party_entity(Entity(name))
+        self.assertTrue(view.valid())
+
+        view._party_items['Farmer'].setPos(10, 10)
+        group = view.collapse_parties('Crop', ['Trader', 'Miner'])
+        group.setPos(50, 300)
+
+        loaded_view = ProfileTenureView()
+        created = []
+        add_party_item = loaded_view._add_party_item
+
+        def recording_add(party, pos=None):
+            created.append(party.short_name)
+            return add_party_item(party, pos)
+
+        loaded_view._add_party_item = recording_add
+        loaded_view.load_model(view.to_model())
+
+        #Grouped parties are not instantiated as items
+        self.assertEqual(created, ['Farmer'])
+
+        farmer_pos = loaded_view._party_items['Farmer'].pos()
+        self.assertEqual((farmer_pos.x(), farmer_pos.y()), (10, 10))
+
+        group = loaded_view.party_group_of('Miner')
+        self.assertEqual(group.name, 'Crop')
+        self.assertEqual(sorted(p.short_name for p in group.members()),
+                         ['Miner', 'Trader'])
+        self.assertEqual((group.pos().x(), group.pos().y()), (50, 300))
+        self.assertEqual(len(group.arrows), 1)
+
+        #Expanded groups are restored as individual items
+        loaded_view.expand_party_group('Crop')
+        loaded_view.load_model(view.to_model())
+        self.assertNotIn('Trader', loaded_view._party_items)
+        self.assertEqual(len(loaded_view.party_groups()), 1)
+
+    def test_party_items_are_pooled(self):
+        view = self.tenure_view
+        view.item_pool = EntityItemPool(max_size=1)
+
+        farmer = Entity('Farmer')
+        view.add_party_entity(farmer)
+        p_item = view._party_items['Farmer']
+        view.remove_party('Farmer')
+        self.assertEqual(len(view.item_pool), 1)
+        self.assertEqual(p_item.arrows, [])
+
+        #The released item no longer observes the removed party
+        farmer.add_column('age')
+        self.assertEqual(p_item.items, [])
+
+        view.add_party_entity(Entity('Trader'))
+        self.assertIs(view._party_items['Trader'], p_item)
+        self.assertEqual(p_item.header, 'Trader')
+        self.assertEqual(len(view.item_pool), 0)
+
+    def test_items_dropped_by_full_pool_are_released(self):
+        view = self.tenure_view
+        view.item_pool = EntityItemPool(max_size=1)
+
+        parties = [Entity(name) for name in ('Farmer', 'Trader')]
+        for party in parties:
+            party.add_column('first_name')
+            view.add_party_entity(party)
+        p_items = [view._party_items[p.short_name] for p in parties]
+
+        #The second item does not fit in the pool
+        view.remove_party('Farmer')
+        view.remove_party('Trader')
+        self.assertEqual(len(view.item_pool), 1)
+
+        dropped = p_items[1]
+        self.assertIsNone(dropped.entity)
+        parties[1].add_column('age')
+        self.assertEqual(dropped.items, [])
+
+    def test_draft_mode_during_interaction(self):
+        view = self.tenure_view
+        self.assertFalse(view.draft_mode())
+
+        view.notify_interaction()
+        self.assertTrue(view.draft_mode())
+        self.assertFalse(view.renderHints() & QPainter.Antialiasing)
+
+        #Exported images are rendered in full quality
+        self.assertFalse(view.image(96).isNull())
+
+        view._end_draft()
+        self.assertFalse(view.draft_mode())
+        self.assertTrue(view.renderHints() & QPainter.Antialiasing)
+
+        view.draft_while_interacting = False
+        view.notify_interaction()
+        self.assertFalse(view.draft_mode())
+
+    def test_batched_viewport_update(self):
+        view = self.tenure_view
+        view.begin_update()
+        view.begin_update()
+        view.add_party_entity(Entity('Farmer'))
+        view.end_update()
+        self.assertFalse(view.viewport().updatesEnabled())
+
+        view.end_update()
+        self.assertTrue(view.viewport().updatesEnabled())
+
+        #Arrow geometry is updated when the batch ends
+        arrow = view._party_items['Farmer'].arrows[0]
+        self.assertFalse(arrow.boundingRect().isEmpty())
+
+    def test_animated_zoom_settles(self):
+        view = self.tenure_view
+        factors = []
+        view.zoom_changed.connect(factors.append)
+
+        view.zoom_to(2.0)
+        self.assertTrue(view.is_zooming())
+        self.assertTrue(view.draft_mode())
+
+        deadline = time.time() + 5
+        while view.is_zooming() and time.time() < deadline:
+            QTest.qWait(20)
+
+        self.assertAlmostEqual(view.zoom_factor(), 2.0)
+        self.assertFalse(view.draft_mode())
+        self.assertEqual(len(factors), 1)
+
+        view.zoom_to(100.0, animate=False)
+        self.assertAlmostEqual(view.zoom_factor(), view.MAX_ZOOM)
+
+    def test_diagram_tracks_zoom(self):
+        diagram = ProfileTenureDiagram()
+        view = diagram._profile_view
+
+        view.zoom_to(2.0)
+        deadline = time.time() + 5
+        while view.is_zooming() and time.time() < deadline:
+            QTest.qWait(20)
+            self.assertEqual(diagram._current_zoom_factor,
+                             view.zoom_factor())
+
+        self.assertEqual(diagram.zoom_cbo.currentText(), '200%')
+
+        #Scaling the view directly also updates the zoom level
+        diagram.scale(0.5)
+        self.assertAlmostEqual(diagram._current_zoom_factor, 1.0)
+        self.assertEqual(diagram.zoom_cbo.currentText(), '100%')
+
+    def test_contents_rect_and_fit(self):
+        view = self.tenure_view
+        scene = view.scene()
+        view.add_party_entity(Entity('Farmer'))
+        p_item = view._party_items['Farmer']
+        initial = scene.contents_rect()
+
+        #Moving an item outwards grows the contents and the scene rect
+        p_item.setPos(2000, 1500)
+        contents = scene.contents_rect()
+        self.assertTrue(contents.contains(p_item.sceneBoundingRect()))
+        self.assertTrue(scene.sceneRect().contains(contents))
+
+        #Moving it back shrinks the contents but not the scene rect
+        p_item.setPos(200, 20)
+        self.assertEqual(scene.contents_rect(), initial)
+        self.assertTrue(scene.sceneRect().contains(contents))
+
+        view.resize(480, 270)
+        p_item.setPos(2000, 1500)
+        self.assertTrue(view.fit_to_contents(animate=False))
+        self.assertLess(view.zoom_factor(), 1.0)
+
+    def test_scene_rect_grows_in_steps(self):
+        scene = self.tenure_view.scene()
+        self.tenure_view.add_party_entity(Entity('Farmer'))
+        p_item = self.tenure_view._party_items['Farmer']
+        changes = []
+        scene.sceneRectChanged.connect(changes.append)
+
+        #Dragging outwards only grows the scene rect occasionally
+        for i in range(100):
+            p_item.moveBy(10, 0)
+        self.assertTrue(
+            scene.sceneRect().contains(p_item.sceneBoundingRect())
+        )
+        self.assertLessEqual(len(changes), 3)
+
+
+class TestProfileTenureMinimap(TestCase):
+    def setUp(self):
+        self.view = ProfileTenureView()
+        self.view.scene().setSceneRect(QRectF(0, 0, 4000, 2000))
+        self.view.resize(400, 300)
+        self.view.show()
+        QTest.qWaitForWindowShown(self.view)
+
+        self.minimap = ProfileTenureMinimap(self.view)
+        self.minimap.resize(160, 80)
+
+    def tearDown(self):
+        self.view.close()
+
+    def _view_center(self):
+        return self.view.mapToScene(self.view.viewport().rect().center())
+
+    def assertCenteredOn(self, pos):
+        expected = self.minimap.map_to_scene(QPointF(pos))
+        center = self._view_center()
+        self.assertLessEqual(abs(center.x() - expected.x()), 2)
+        self.assertLessEqual(abs(center.y() - expected.y()), 2)
+
+    def test_click_and_drag_center_the_view(self):
+        QTest.mouseClick(self.minimap, Qt.LeftButton, Qt.NoModifier,
+                         QPoint(80, 40))
+        self.assertCenteredOn(QPoint(80, 40))
+
+        #Qt 4 QTest cannot drag so the move event is sent directly
+        QTest.mousePress(self.minimap, Qt.LeftButton, Qt.NoModifier,
+                         QPoint(40, 20))
+        move = QMouseEvent(QEvent.MouseMove, QPoint(120, 60),
+                           Qt.NoButton, Qt.LeftButton, Qt.NoModifier)
+        QApplication.sendEvent(self.minimap, move)
+        self.assertCenteredOn(QPoint(120, 60))
+
+    def test_viewport_rect_tracks_zoom(self):
+        changes = []
+        self.view.visible_area_changed.connect(lambda: changes.append(1))
+        width = self.minimap.viewport_rect().width()
+
+        self.view.zoom_to(2.0, animate=False)
+        self.assertTrue(changes)
+        self.assertAlmostEqual(
+            self.minimap.viewport_rect().width(), width / 2.0, delta=1
+        )
+
+        del changes[:]
+        self.view.resize(200, 300)
+        QApplication.processEvents()
+        self.assertTrue(changes)
+
+
+class TestMappedImage(TestCase):
+    def setUp(self):
+        self.tenure_view = ProfileTenureView()
+        self.tenure_view.add_party_entity(Entity('Farmer'))
+        self.out_dir = tempfile.mkdtemp()
+        self.size = QSize(64, 48)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def _save(self, file_name):
+        path = os.path.join(self.out_dir, file_name)
+        status, msg = self.tenure_view.save_mapped_image(path, 96, self.size)
+        self.assertTrue(status, msg)
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _rendered(self, img_format):
+        #Renders the view in memory for comparison with the mapped file
+        img = QImage(self.size, img_format)
+        self.tenure_view._render_onto(img, 96, Qt.white)
+
+        return img
+
+    def _rgb_rows(self, img):
+        bits = img.constBits().asstring(img.byteCount())
+        row_size = img.width() * 3
+
+        return b''.join(
+            bits[y * img.bytesPerLine():y * img.bytesPerLine() + row_size]
+            for y in range(img.height())
+        )
+
+    def test_raw(self):
+        data = self._save('view.raw')
+        img = self._rendered(QImage.Format_ARGB32)
+
+        self.assertEqual(len(data), 64 * 48 * 4)
+        self.assertEqual(data, img.constBits().asstring(img.byteCount()))
+
+    def test_ppm(self):
+        #Rendered in several bands
+        self.tenure_view.MAPPED_BAND_BYTES = 64 * 3 * 10
+        data = self._save('view.ppm')
+
+        self.assertEqual(
+            data.split(None, 4)[:4],
+            [b'P6', b'64', b'48', b'255']
+        )
+        self.assertEqual(len(data.split(b'255\n', 1)[1]), 64 * 48 * 3)
+
+        img = self._rendered(QImage.Format_RGB888)
+        self.assertEqual(
+            data[-64 * 48 * 3:][:64 * 3],
+            self._rgb_rows(img)[:64 * 3]
+        )
+
+    def test_tiff(self):
+        data = self._save('view.tif')
+        self.assertEqual(data[:4], b'II*\x00')
+
+        ifd_offset = struct.unpack('<I', data[4:8])[0]
+        num_entries = struct.unpack('<H', data[ifd_offset:ifd_offset + 2])[0]
+        tags = {}
+        for i in range(num_entries):
+            start = ifd_offset + 2 + i * 12
+            tag, typ, count, value = struct.unpack(
+                '<HHII',
+                data[start:start + 12]
+            )
+            if typ == 3 and count == 1:
+                value &= 0xFFFF
+            tags[tag] = value
+
+        self.assertEqual((tags[256], tags[257]), (64, 48))
+        self.assertEqual(tags[279], 64 * 48 * 3)
+        self.assertEqual(len(data), tags[273] + tags[279])
+
+        img = self._rendered(QImage.Format_RGB888)
+        self.assertEqual(data[tags[273]:], self._rgb_rows(img))
+
+    def test_unsupported_format(self):
+        path = os.path.join(self.out_dir, 'view.png')
+        status, msg = self.tenure_view.save_mapped_image(path, 96, self.size)
+
+        self.assertFalse(status)
+        self.assertTrue(msg)
+        self.assertFalse(os.path.exists(path))
+
+    def test_tiff_size_limit(self):
+        path = os.path.join(self.out_dir, 'poster.tif')
+        status, msg = self.tenure_view.save_mapped_image(
+            path,
+            96,
+            QSize(40000, 40000)
+        )
+
+        self.assertFalse(status)
+        self.assertFalse(os.path.exists(path))
+
+
+def _profile(name, parties, spatial_unit=None):
+    #Creates a profile with the given party and spatial unit names
+    profile = Profile(name)
+    tenure_type = LookupColumn('tenure_type', ValueList('tenure_type'))
+    doc_type = LookupColumn('doc_type', ValueList('doc_type'))
+    profile.social_tenure = SocialTenure(
+        [Entity(p) for p in parties],
+        None if spatial_unit is None else Entity(spatial_unit),
+        tenure_type,
+        SupportingDocument(doc_type)
+    )
+
+    return profile
+
+
+class TestProfileReportWriter(TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.out_dir, 'report.pdf')
+        self.view = ProfileTenureView()
+        self.writer = ProfileReportWriter(self.view)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def _page_count(self):
+        with open(self.path, 'rb') as f:
+            return len(re.findall(br'/Type\s*/Page\b', f.read()))
+
+    def test_one_page_per_profile(self):
+        self.view.add_party_entity(Entity('Owner'))
+        profiles = (
+            _profile('Rural', ['Farmer', 'Herder'], 'Parcel'),
+            _profile('Urban', ['Tenant'], 'Building'),
+            _profile('Basic', ['Occupant'])
+        )
+
+        status, msg = self.writer.write(iter(profiles), self.path, 72)
+        self.assertTrue(status, msg)
+        self.assertEqual(self._page_count(), 3)
+
+        #The view is restored once the report has been written
+        self.assertEqual(
+            [p.short_name for p in self.view.party_entities()],
+            ['Owner']
+        )
+
+    def test_profile_without_spatial_unit_clears_item(self):
+        sp_item = self.view._sp_item
+        rural = _profile('Rural', ['Farmer'], 'Parcel')
+        self.writer._set_profile(
+            rural, [], rural.social_tenure.spatial_unit
+        )
+        self.assertEqual(sp_item.header, 'Parcel')
+
+        self.writer._set_profile(_profile('Basic', ['Occupant']), [], None)
+        self.assertIsNone(self.view.spatial_unit())
+        self.assertNotEqual(sp_item.header, 'Parcel')
+
+    def test_view_is_restored(self):
+        spatial_unit = Entity('Parcel')
+        self.view.set_spatial_unit(spatial_unit)
+
+        profiles = [_profile('Basic', ['Occupant'], 'Building')]
+        status, msg = self.writer.write(profiles, self.path, 72)
+        self.assertTrue(status, msg)
+        self.assertIsNone(self.view.profile)
+        self.assertIs(self.view.spatial_unit(), spatial_unit)
+        self.assertEqual(self.view._str_item.items, [])
+
+
+class TestProfileTenureModel(TestCase):
+    def test_party_edges(self):
+        model = ProfileTenureModel()
+        node = model.add_party(Entity('Farmer'), 10, 20)
+
+        self.assertEqual(node.pos, (10, 20))
+        self.assertTrue(
+            any(e.start is node and e.end is model.social_tenure
+                for e in model.edges)
+        )
+
+        self.assertTrue(model.remove_party('Farmer'))
+        self.assertFalse(any(e.start is node for e in model.edges))
+        self.assertFalse(model.remove_party('Farmer'))
+
+    def test_view_round_trip(self):
+        model = ProfileTenureModel()
+        model.add_party(Entity('Farmer'), 50, 60)
+        model.add_annotation('Note', Annotation.Minor, 5, 5)
+
+        view = model.create_view()
+        copy = view.to_model()
+
+        self.assertEqual(list(copy.parties.keys()), ['Farmer'])
+        self.assertEqual(copy.parties['Farmer'].pos, (50, 60))
+        self.assertEqual(len(copy.edges), len(model.edges))
+        self.assertEqual(copy.annotations[0].text, 'Note')
+
+
+class CountingValueList(ValueList):
+    def __init__(self, *args, **kwargs):
+        super(CountingValueList, self).__init__(*args, **kwargs)
+        self.queries = 0
+
+    def lookups(self):
+        self.queries += 1
+
+        return super(CountingValueList, self).lookups()
+
+
+class TestLookupCache(TestCase):
+    def test_lookups_are_cached(self):
+        cache = LookupCache()
+        value_list = CountingValueList('tenure_type', ['Lease', 'Own'])
+
+        self.assertEqual(cache.lookups(value_list), ['Lease', 'Own'])
+        self.assertEqual(cache.lookups(value_list), ['Lease', 'Own'])
+        self.assertEqual(value_list.queries, 1)
+
+        #Changes to the value list invalidate the entry
+        value_list.add_value('Rent')
+        self.assertEqual(cache.lookups(value_list), ['Lease', 'Own', 'Rent'])
+        self.assertEqual(value_list.queries, 2)
+
+        cache.invalidate(value_list)
+        cache.lookups(value_list)
+        self.assertEqual(value_list.queries, 3)
+
+    def test_item_skips_unchanged_value_list(self):
+        value_list = CountingValueList('tenure_type', ['Lease', 'Own'])
+        tenure = SocialTenure(
+            [],
+            None,
+            LookupColumn('tenure_type', value_list),
+            SupportingDocument(LookupColumn('doc_type', ValueList('doc')))
+        )
+        str_item = ProfileTenureView()._str_item
+
+        str_item.entity = tenure
+        str_item.entity = tenure
+        self.assertEqual(value_list.queries, 1)
+
+        #Invalidating the cache refreshes the item
+        lookup_cache.invalidate(value_list)
+        value_list.values.append('Rent')
+        str_item.entity = tenure
+        self.assertEqual(value_list.queries, 2)
+        self.assertEqual(str_item.items, ['Lease', 'Own', 'Rent'])
+
+        #Notified changes are patched into the item
+        value_list.add_value('Share')
+        self.assertEqual(str_item.items, ['Lease', 'Own', 'Rent', 'Share'])
+
+        lookup_cache.invalidate(value_list)
+
+    def test_unversioned_value_list_is_refreshed(self):
+        value_list = CountingValueList('tenure_type', ['Lease'])
+        del value_list.version
+        tenure = SocialTenure(
+            [],
+            None,
+            LookupColumn('tenure_type', value_list),
+            SupportingDocument(LookupColumn('doc_type', ValueList('doc')))
+        )
+        str_item = ProfileTenureView()._str_item
+        str_item.entity = tenure
+
+        value_list.values.append('Own')
+        lookup_cache.invalidate(value_list)
+        str_item.entity = tenure
+        self.assertEqual(str_item.items, ['Lease', 'Own'])
+
+        lookup_cache.invalidate(value_list)
+
+    def test_lru_bound(self):
+        cache = LookupCache(max_size=2)
+        value_lists = [
+            CountingValueList('list_{0}'.format(i), ['A']) for i in range(3)
+        ]
+        cache.lookups(value_lists[0])
+        cache.lookups(value_lists[1])
+        cache.lookups(value_lists[0])
+        cache.lookups(value_lists[2])
+        self.assertEqual(len(cache), 2)
+
+        #The least recently used value list was discarded
+        cache.lookups(value_lists[0])
+        cache.lookups(value_lists[1])
+        self.assertEqual(value_lists[0].queries, 1)
+        self.assertEqual(value_lists[1].queries, 2)
+
+    def test_switching_profiles_does_not_query(self):
+        profiles = [
+            _profile('Rural', ['Farmer'], 'Parcel'),
+            _profile('Urban', ['Tenant'], 'Building')
+        ]
+        value_lists = []
+        for profile in profiles:
+            value_list = CountingValueList('tenure_type', ['Lease'])
+            profile.social_tenure.tenure_type_lookup.value_list = value_list
+            value_lists.append(value_list)
+
+        view = ProfileTenureView()
+        side_view = ProfileTenureView()
+        side_view.profile = profiles[0]
+
+        #Lookups shown by other views, or shown again, are not evicted
+        for profile in profiles + profiles:
+            view.profile = profile
+        self.assertEqual([v.queries for v in value_lists], [1, 1])
+
+        for value_list in value_lists:
+            lookup_cache.invalidate(value_list)
+
+    def test_ttl_eviction(self):
+        cache = LookupCache(ttl=0)
+        value_list = CountingValueList('tenure_type', ['Lease'])
+        cache.lookups(value_list)
+        cache.lookups(value_list)
+        self.assertEqual(value_list.queries, 2)
+
+        cache.evict_expired()
+        self.assertEqual(len(cache), 0)
+
+
+class TestLazyColumnEntity(TestCase):
+    def test_paginated_loading(self):
+        conn = sqlite3.connect(':memory:')
+        cols = ', '.join('col_{0}'.format(i) for i in range(25))
+        conn.execute('CREATE TABLE parcel ({0})'.format(cols))
+
+        source = SqliteColumnSource(conn, 'parcel')
+        entity = LazyColumnEntity('Parcel', source, page_size=10)
+        self.assertEqual(len(entity.columns), 10)
+        self.assertFalse(entity.fully_loaded)
+
+        view = ProfileTenureView()
+        view.set_spatial_unit(entity)
+        sp_item = view._sp_item
+
+        while entity.load_next_page() > 0:
+            pass
+
+        self.assertTrue(entity.fully_loaded)
+        self.assertEqual(len(sp_item.items), 25)
+        self.assertEqual(sp_item.items[-1], 'col_24')
+
+    def test_item_loads_remaining_columns(self):
+        conn = sqlite3.connect(':memory:')
+        cols = ', '.join('col_{0}'.format(i) for i in range(25))
+        conn.execute('CREATE TABLE household ({0})'.format(cols))
+
+        entity = LazyColumnEntity(
+            'Household', SqliteColumnSource(conn, 'household'), page_size=10
+        )
+        pages = []
+        entity.register_observer(lambda *args: pages.append(args[3]))
+
+        view = ProfileTenureView()
+        view.add_party_entity(entity)
+        p_item = view._party_items['Household']
+
+        #The remaining pages are loaded through the event loop
+        deadline = time.time() + 5
+        while not entity.fully_loaded and time.time() < deadline:
+            QApplication.processEvents()
+
+        self.assertTrue(entity.fully_loaded)
+        self.assertEqual(len(p_item.items), 25)
+        self.assertEqual(p_item.items[-1], 'col_24')
+
+        #One notification per page
+        self.assertEqual([len(p) for p in pages], [10, 5])
+
+
+CONFIGURATION = b"""<Configuration version="1.2">
+  <Profile name="Basic">
+    <Entities>
+      <Entity name="ba_household" shortName="Household">
+        <Columns>
+          <Column name="first_name"/>
+          <Column name="last_name"/>
+        </Columns>
+      </Entity>
+      <Entity name="ba_parcel" shortName="Parcel">
+        <Columns>
+          <Column name="area"/>
+        </Columns>
+      </Entity>
+    </Entities>
+    <ValueLists>
+      <ValueList name="check_tenure_type">
+        <CodeValue value="Lease" code="L"/>
+        <CodeValue value="Ownership" code="O"/>
+      </ValueList>
+    </ValueLists>
+    <SocialTenure party="ba_household" spatialUnit="Parcel"
+                  tenureTypeList="check_tenure_type"/>
+  </Profile>
+  <Profile name="Rural"/>
+</Configuration>
+"""
+
+
+class TestProfileConfigurationReader(TestCase):
+    def test_streams_profiles(self):
+        reader = ProfileConfigurationReader(io.BytesIO(CONFIGURATION))
+        profiles = [p for p in reader]
+
+        self.assertEqual([p.name for p in profiles], ['Basic', 'Rural'])
+
+        str_ent = profiles[0].social_tenure
+        self.assertEqual(str_ent.party.short_name, 'Household')
+        self.assertEqual(
+            list(str_ent.party.columns.keys()),
+            ['first_name', 'last_name']
+        )
+        self.assertEqual(str_ent.spatial_unit.short_name, 'Parcel')
+        self.assertEqual(
+            str_ent.tenure_type_lookup.value_list.lookups(),
+            ['Lease', 'Ownership']
+        )
+
+    def test_profile_renders_in_view(self):
+        reader = ProfileConfigurationReader(io.BytesIO(CONFIGURATION))
+        profile = reader.profile('Basic')
+
+        view = ProfileTenureView(profile=profile)
+        view.add_party_entity(profile.social_tenure.party)
+        self.assertEqual(view._str_item.items, ['Lease', 'Ownership'])
+
+
+class TestDiagramStateStore(TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.state_dir, 'diagram.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def test_incremental_save_and_load(self):
+        view = ProfileTenureView()
+        party = Entity('Farmer')
+        party.columns['first_name'] = 'FN'
+        view.add_party_entity(party)
+
+        store = DiagramStateStore(self.path)
+        self.assertEqual(store.save(view), (True, ''))
+        size = os.path.getsize(self.path)
+
+        #Unchanged state does not write anything
+        store.save(view)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+        view._party_items['Farmer'].setPos(40, 80)
+        view.add_annotation('Village', Annotation.Major, QPointF(5, 5))
+        store.save(view)
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        loaded_view = ProfileTenureView()
+        status, msg = DiagramStateStore(self.path).load(loaded_view)
+        self.assertTrue(status)
+
+        model = loaded_view.to_model()
+        self.assertEqual(model.parties['Farmer'].pos, (40, 80))
+        self.assertEqual(
+            list(model.parties['Farmer'].entity.columns.keys()),
+            ['first_name']
+        )
+        self.assertEqual(model.annotations[0].text, 'Village')
+
+    def test_load_restores_layout_onto_profile(self):
+        profile = _profile('Rural', ['Farmer'], 'Parcel')
+        view = ProfileTenureView()
+        view.profile = profile
+        view.set_spatial_unit(profile.social_tenure.spatial_unit)
+        view.set_party_entities(profile.social_tenure.parties)
+        view._party_items['Farmer'].setPos(40, 80)
+
+        store = DiagramStateStore(self.path)
+        self.assertEqual(store.save(view), (True, ''))
+
+        loaded_view = ProfileTenureView()
+        loaded_view.profile = profile
+        status, msg = DiagramStateStore(self.path).load(loaded_view)
+        self.assertTrue(status, msg)
+
+        #The existing profile and its entities are used
+        self.assertIs(loaded_view.profile, profile)
+        p_item = loaded_view._party_items['Farmer']
+        self.assertIs(p_item.entity, profile.social_tenure.parties[0])
+        self.assertEqual((p_item.pos().x(), p_item.pos().y()), (40, 80))
+        self.assertIs(
+            loaded_view._sp_item.entity,
+            profile.social_tenure.spatial_unit
+        )
+
+    def test_party_groups_are_saved(self):
+        view = ProfileTenureView()
+        for name in ('Farmer', 'Trader'):
+            view.add_party_entity(Entity(name))
+        view.collapse_parties('Crop', ['Trader']).setPos(50, 300)
+        DiagramStateStore(self.path).save(view)
+
+        loaded_view = ProfileTenureView()
+        status, msg = DiagramStateStore(self.path).load(loaded_view)
+        self.assertTrue(status, msg)
+
+        group = loaded_view.party_group_of('Trader')
+        self.assertEqual(group.name, 'Crop')
+        self.assertEqual((group.pos().x(), group.pos().y()), (50, 300))
+        self.assertIn('Farmer', loaded_view._party_items)
+
+    def test_invalid_snapshot(self):
+        header = {'format': DiagramStateStore.FORMAT, 'version': 1}
+        snapshots = (
+            {'profile': 'Rural'},
+            {'nodes': {'party:Farmer': {'x': 1}}, 'edges': [],
+             'annotations': []},
+            {'nodes': {'parcel': {'x': 1, 'y': 2}}, 'edges': [],
+             'annotations': []},
+            {'nodes': {}, 'edges': [['a']], 'annotations': []}
+        )
+
+        for snapshot in snapshots:
+            with open(self.path, 'w') as f:
+                f.write(json.dumps(header) + '\n')
+                f.write(json.dumps({'snapshot': snapshot}) + '\n')
+
+            status, msg = DiagramStateStore(self.path).load(
+                ProfileTenureView()
+            )
+            self.assertFalse(status)
+            self.assertTrue(msg)
+
+    def test_snapshot_is_written_atomically(self):
+        view = ProfileTenureView()
+        view.add_party_entity(Entity('Farmer'))
+
+        store = DiagramStateStore(self.path, max_deltas=0)
+        store.save(view)
+        view._party_items['Farmer'].setPos(10, 10)
+        store.save(view)
+
+        #Only the journal remains, without temporary files
+        self.assertEqual(os.listdir(self.state_dir), ['diagram.json'])
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+class TestRenderCache(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.src_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.src_dir)
+
+    def _source_file(self, name, size):
+        path = os.path.join(self.src_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'0' * size)
+
+        return path
+
+    def test_lru_eviction(self):
+        cache = RenderCache(self.cache_dir, max_size=250)
+        cache.store_file('a', 'PNG', self._source_file('a', 100))
+        cache.store_file('b', 'PNG', self._source_file('b', 100))
+
+        #Same mtime, as on file systems with a coarse mtime resolution
+        os.utime(cache.path('a', 'PNG'), (1000, 1000))
+        os.utime(cache.path('b', 'PNG'), (1000, 1000))
+
+        #Touch 'a' so that 'b' becomes the least recently used
+        self.assertIsNotNone(cache.lookup('a', 'PNG'))
+        cache.store_file('c', 'PNG', self._source_file('c', 100))
+
+        self.assertIsNotNone(cache.lookup('a', 'PNG'))
+        self.assertIsNone(cache.lookup('b', 'PNG'))
+        self.assertIsNotNone(cache.lookup('c', 'PNG'))
+        self.assertLessEqual(cache.size(), 250)
+
+    def test_files_from_earlier_sessions_are_evicted_first(self):
+        cache = RenderCache(self.cache_dir, max_size=250)
+        cache.store_file('a', 'PNG', self._source_file('a', 100))
+        os.utime(cache.path('a', 'PNG'), (1000, 1000))
+
+        cache = RenderCache(self.cache_dir, max_size=250)
+        cache.store_file('b', 'PNG', self._source_file('b', 100))
+        os.utime(cache.path('b', 'PNG'), (500, 500))
+        cache.store_file('c', 'PNG', self._source_file('c', 100))
+
+        self.assertIsNone(cache.lookup('a', 'PNG'))
+        self.assertIsNotNone(cache.lookup('b', 'PNG'))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file